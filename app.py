@@ -1,14 +1,35 @@
 import os
+import time
 import uuid
-from flask import Flask, render_template, request, redirect, session, url_for, flash, jsonify
+import json
+import queue
+from flask import Flask, render_template, request, redirect, session, url_for, flash, jsonify, Response, stream_with_context, g
 from flask_session import Session  # Use server-side sessions
 import requests
-from bs4 import BeautifulSoup
 import spotipy
-from spotipy.oauth2 import SpotifyOAuth
+from spotipy.oauth2 import SpotifyOAuth, SpotifyClientCredentials
 from dotenv import load_dotenv
 import logging
 from urllib.parse import urlencode
+import re
+import threading
+import click
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from chart_cache import ChartCache, all_chart_years, FIRST_CHART_YEAR
+from chart_index import ChartIndex
+from chart_parsers import parse_chart
+from http_pool import get_session, pool_stats
+import metrics
+from jobs import JobQueue, JobLimitExceeded, create_job_store, RUNNING, DONE, FAILED, CANCELLED
+from playlist_registry import PlaylistRegistry, find_playlist_by_name, get_playlist_track_uris, is_following_playlist
+from playlist_writer import add_tracks_in_batches
+from profiling import RequestProfiler
+from resolution_cache import ResolutionCache, cache_key
+from resolver import DEFAULT_SEARCH_BURST, DEFAULT_SEARCH_RATE, TrackResolver
+from session_store import SQLiteSessionInterface, MemorySessionInterface
+from singleflight import LeaseStore, SingleFlight
+from storage import db_path
 
 # Load environment variables (optional, for FLASK_SECRET_KEY)
 load_dotenv()
@@ -23,11 +44,22 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'fallback_super_secret_key_change_me')
 
 # Configure server-side session
-app.config['SESSION_TYPE'] = 'filesystem' # Store session files on the server's filesystem
-app.config['SESSION_PERMANENT'] = False # Session expires when browser closes
-app.config['SESSION_USE_SIGNER'] = True # Encrypt session cookie
-# Consider SESSION_FILE_THRESHOLD, SESSION_FILE_DIR if needed
-Session(app)
+# SESSION_BACKEND: 'sqlite' (default, shared by all workers), 'memory' (single process)
+# or 'filesystem' (the old Flask-Session store, one file per visitor and no expiry)
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'sqlite')
+SESSION_LIFETIME = int(os.getenv('SESSION_LIFETIME', 24 * 3600)) # Idle sessions are dropped after this many seconds
+SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', 10000)) # Oldest sessions are dropped beyond this
+if SESSION_BACKEND == 'sqlite':
+    app.session_interface = SQLiteSessionInterface(db_path('sessions.db'), lifetime=SESSION_LIFETIME, max_sessions=SESSION_MAX_ENTRIES)
+elif SESSION_BACKEND == 'memory':
+    app.session_interface = MemorySessionInterface(lifetime=SESSION_LIFETIME, max_sessions=SESSION_MAX_ENTRIES)
+elif SESSION_BACKEND == 'filesystem':
+    app.config['SESSION_TYPE'] = 'filesystem' # Store session files on the server's filesystem
+    app.config['SESSION_PERMANENT'] = False # Session expires when browser closes
+    app.config['SESSION_USE_SIGNER'] = True # Encrypt session cookie
+    Session(app)
+else:
+    raise ValueError(f"Unknown session backend: {SESSION_BACKEND}")
 
 # --- Spotify Configuration ---
 # These will be provided by the user in the form, but we need placeholders
@@ -35,77 +67,428 @@ Session(app)
 SPOTIPY_REDIRECT_URI = os.getenv('SPOTIPY_REDIRECT_URI', 'http://127.0.0.1:5000/callback') # Use environment variable with fallback
 # Scopes define the permissions the app requests from the user
 SCOPE = 'playlist-modify-public playlist-modify-private user-read-private'
+# Upstream base URLs; only overridden to point the app at local stand-ins (see loadtest.py)
+BILLBOARD_BASE_URL = os.getenv('BILLBOARD_BASE_URL', 'https://www.billboard.com').rstrip('/')
+SPOTIFY_API_URL = os.getenv('SPOTIFY_API_URL', 'https://api.spotify.com/v1').rstrip('/') + '/'
+SPOTIFY_ACCOUNTS_URL = os.getenv('SPOTIFY_ACCOUNTS_URL', 'https://accounts.spotify.com').rstrip('/')
 
 # --- Helper Functions ---
 
-def get_top_100_songs(year):
+# Shared keep-alive connection pools; the pool must fit the resolver and job worker threads
+HTTP_POOL_OPTIONS = {
+    'pool_size': int(os.getenv('HTTP_POOL_SIZE', 32)),
+    'retries': int(os.getenv('HTTP_RETRIES', 3)),
+    'backoff': float(os.getenv('HTTP_BACKOFF', 0.5)),
+}
+
+def create_spotify_client(access_token):
+    """
+    Creates a Spotify client on the shared 'spotify' connection pool.
+    HTTP errors are not retried inside spotipy, so 429s (with Retry-After) reach the resolver's rate limiter.
+    """
+    sp = spotipy.Spotify(auth=access_token, requests_session=get_session('spotify', **HTTP_POOL_OPTIONS))
+    sp.prefix = SPOTIFY_API_URL
+    return sp
+
+# Chart page parser: 'fast' (only the chart rows, lxml when installed) or 'soup' (full page)
+CHART_PARSER = os.getenv('CHART_PARSER', 'fast')
+
+# --- Metrics ---
+REQUEST_SECONDS = metrics.histogram('http_request_seconds', 'Time to handle a request, by endpoint and status.')
+BILLBOARD_FETCH_SECONDS = metrics.histogram('billboard_fetch_seconds', 'Time to download a Billboard chart page.')
+CHART_PARSE_SECONDS = metrics.histogram('chart_parse_seconds', 'Time to parse a Billboard chart page, by parser.')
+BILLBOARD_ERRORS = metrics.counter('billboard_errors', 'Billboard chart scrapes that failed, by stage (fetch, parse).')
+CHART_INDEX_LOOKUPS = metrics.counter('chart_index_lookups', 'Chart years looked up in the offline index, by result (hit, miss).')
+
+BILLBOARD_HEADERS = { # Add headers to mimic a browser request
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+def chart_url(year):
+    return f"{BILLBOARD_BASE_URL}/charts/year-end/{year}/hot-100-songs"
+
+def parse_chart_page(year, html):
+    """
+    Parses a downloaded Billboard Year-End Hot 100 page.
+    Returns a list of tuples: [(song_title, artist_name), ...] or None if no songs were found.
+    """
+    with CHART_PARSE_SECONDS.time(parser=CHART_PARSER):
+        songs = parse_chart(html, CHART_PARSER)
+    if not songs:
+        BILLBOARD_ERRORS.inc(stage='parse')
+        logging.error(f"Could not find song list structure for year {year} on Billboard.")
+        return None
+
+    logging.info(f"Successfully scraped {len(songs)} songs for {year}.")
+    return songs[:100] # Return only the top 100 even if more were found
+
+def scrape_top_100_songs(year):
     """
     Scrapes Billboard Year-End Hot 100 chart for a given year.
     Returns a list of tuples: [(song_title, artist_name), ...]
     Returns None if scraping fails.
     """
     try:
-        url = f"https://www.billboard.com/charts/year-end/{year}/hot-100-songs"
-        headers = { # Add headers to mimic a browser request
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=15)
+        with BILLBOARD_FETCH_SECONDS.time():
+            response = get_session('billboard', **HTTP_POOL_OPTIONS).get(chart_url(year), headers=BILLBOARD_HEADERS, timeout=15)
         response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
+        return parse_chart_page(year, response.text)
 
-        soup = BeautifulSoup(response.text, 'html.parser')
+    except requests.exceptions.RequestException as e:
+        BILLBOARD_ERRORS.inc(stage='fetch')
+        logging.error(f"Error fetching Billboard page for {year}: {e}")
+        return None
+    except Exception as e:
+        BILLBOARD_ERRORS.inc(stage='parse')
+        logging.error(f"Error parsing Billboard page for {year}: {e}")
+        return None
 
-        # --- !! IMPORTANT: HTML structure might change !! ---
-        # This part needs careful inspection of the Billboard page source
-        # Adjust selectors based on current structure (Inspect Element in browser)
-        # Example selectors (these WILL likely need updating):
-        song_elements = soup.select('div.o-chart-results-list-row-container') # Find rows
+# Concurrent identical chart loads and searches share one upstream call, also across workers
+flight_leases = LeaseStore(db_path('singleflight.db'))
+FLIGHT_LEASE_TTL = float(os.getenv('SINGLEFLIGHT_LEASE_TTL', 60))
 
-        if not song_elements:
-             logging.warning(f"No song elements found on Billboard page for {year}. Structure might have changed.")
-             # Try alternative selectors (examples, may not work)
-             song_elements = soup.select('li.o-chart-results-list__item')
-             if not song_elements:
-                  logging.error(f"Could not find song list structure for year {year} on Billboard.")
-                  return None
+# Year-end charts almost never change, so keep them in a shared two-tier cache
+chart_cache = ChartCache(
+    scrape_top_100_songs,
+    db_path('charts.db'),
+    ttl=int(os.getenv('CHART_CACHE_TTL', 30 * 24 * 3600)),
+    recent_ttl=int(os.getenv('CHART_CACHE_RECENT_TTL', 24 * 3600)),
+    flights=SingleFlight('chart', leases=flight_leases, lease_ttl=FLIGHT_LEASE_TTL),
+    failure_ttl=int(os.getenv('CHART_CACHE_FAILURE_TTL', 300)),
+)
 
-        songs = []
-        for item in song_elements:
-            try:
-                # Find title (might be in h3 with specific ID or class)
-                title_tag = item.select_one('h3[id*="title-of-a-story"]') # Look for h3 with 'title-of-a-story' in its id
-                if not title_tag: continue # Skip if title not found
+def get_top_100_songs(year):
+    """
+    Returns the Billboard Year-End Hot 100 chart for a given year from the chart cache,
+    scraping it only on a cache miss.
+    Returns a list of tuples: [(song_title, artist_name), ...] or None if scraping fails.
+    """
+    return chart_cache.get(year)
 
-                title = title_tag.get_text(strip=True)
+# Offline year -> (title, artist, URI) index written by `flask build-index`; the routes read it first
+chart_index = ChartIndex(
+    os.getenv('CHART_INDEX_PATH', db_path('chart_index.db')),
+    recent_ttl=int(os.getenv('CHART_CACHE_RECENT_TTL', 24 * 3600)),
+)
 
-                # Find artist (might be in span sibling to the title's parent, or within the same container)
-                artist_tag = title_tag.find_next_sibling('span') # Common pattern
-                if not artist_tag:
-                    # Try finding span within the row/item with a specific class if sibling fails
-                     artist_tag = item.select_one('span.c-label.a-no-trucate') # Another possible selector
+# Longest year range a single request may ask for
+MAX_YEAR_SPAN = 20
 
-                if not artist_tag: continue # Skip if artist not found
+def parse_year_range(value):
+    """
+    Parses a year ('1995'), a range ('1990-1999') or a decade ('1990s').
+    Returns the list of years. Raises ValueError for anything else or years without a chart.
+    """
+    value = (value or '').strip().lower()
+    match = re.fullmatch(r'(\d{4})\s*-\s*(\d{4})', value)
+    if match:
+        start, end = int(match.group(1)), int(match.group(2))
+    elif re.fullmatch(r'\d{3}0s', value):
+        start = int(value[:4])
+        end = start + 9
+    elif re.fullmatch(r'\d{4}', value):
+        start = end = int(value)
+    else:
+        raise ValueError(f"Invalid year: {value}")
 
-                artist = artist_tag.get_text(strip=True)
+    end = min(end, date.today().year)
+    if start > end or start < FIRST_CHART_YEAR:
+        raise ValueError(f"Year out of range: {value}")
+    if end - start + 1 > MAX_YEAR_SPAN:
+        raise ValueError(f"At most {MAX_YEAR_SPAN} years per playlist")
+    return list(range(start, end + 1))
 
-                if title and artist:
-                    songs.append((title, artist))
-                else:
-                     logging.warning(f"Skipping row due to missing title or artist: {item.get_text(strip=True)[:50]}...")
+def get_indexed_charts(years):
+    """Reads the years the offline index has. Returns a tuple: ({year: [(title, artist, uri), ...]}, missing_years)."""
+    charts = {}
+    missing = []
+    for year in years:
+        rows = chart_index.get_chart(year)
+        if rows:
+            CHART_INDEX_LOOKUPS.inc(result='hit')
+            charts[year] = rows
+        else:
+            CHART_INDEX_LOOKUPS.inc(result='miss')
+            missing.append(year)
+    return charts, missing
 
+def get_charts(years):
+    """
+    Reads several year-end charts from the offline index, fetching the years it does not have in parallel.
+    Returns {year: [(title, artist, uri), ...]}, where uri is None unless the index resolved it;
+    years that failed are left out.
+    """
+    charts, missing = get_indexed_charts(years)
+    if len(missing) == 1:
+        fetched = {missing[0]: get_top_100_songs(missing[0])}
+    elif missing:
+        with ThreadPoolExecutor(max_workers=min(len(missing), 8), thread_name_prefix='chart-fetch') as executor:
+            fetched = dict(zip(missing, executor.map(get_top_100_songs, missing)))
+    else:
+        fetched = {}
+    for year, songs in fetched.items():
+        if songs:
+            charts[year] = [(title, artist, None) for title, artist in songs]
+    return charts
 
-            except Exception as e:
-                logging.warning(f"Error parsing a song item: {e}. Item: {item.get_text(strip=True)[:50]}...")
-                continue # Skip this item and try the next
+def load_chart_songs(year_value):
+    """
+    Fetches every chart in a year or year range and merges them, so songs that chart in
+    several years are only resolved once.
+    Returns a tuple: (entries, songs, indexed), where songs are the unique (title, artist) pairs,
+    entries are (year, rank, song_index) in chart order and indexed maps song_index -> track URI
+    for the songs the offline index already resolved. Returns (None, None, None) if nothing was found.
+    """
+    return merge_charts(get_charts(parse_year_range(str(year_value))))
 
-        logging.info(f"Successfully scraped {len(songs)} songs for {year}.")
-        return songs[:100] # Return only the top 100 even if more were found
+def merge_charts(charts):
+    """Merges {year: [(title, artist, uri), ...]} into (entries, songs, indexed); see load_chart_songs()."""
+    if not charts:
+        return None, None, None
 
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error fetching Billboard page for {year}: {e}")
-        return None
-    except Exception as e:
-        logging.error(f"Error parsing Billboard page for {year}: {e}")
-        return None
+    entries = []
+    songs = []
+    indexed = {}
+    song_index = {}  # normalized (title, artist) -> index into songs
+    for year in sorted(charts):
+        for rank, (title, artist, uri) in enumerate(charts[year]):
+            key = cache_key(title, artist)
+            if key not in song_index:
+                song_index[key] = len(songs)
+                songs.append((title, artist))
+            if uri:
+                indexed[song_index[key]] = uri
+            entries.append((year, rank, song_index[key]))
+    return entries, songs, indexed
+
+def resolve_chart_songs(sp, songs, indexed=None, on_result=None):
+    """
+    Resolves the unique chart songs, taking the URIs the offline index already has and
+    searching only for the rest. Returns results in song order, like TrackResolver.resolve().
+    """
+    results, pending, forward = indexed_results(songs, indexed, on_result)
+    if pending:
+        merge_resolved(results, pending, track_resolver.resolve(sp, [songs[i] for i in pending], on_result=forward))
+    return results
+
+def indexed_results(songs, indexed, on_result=None):
+    """
+    Builds the results for the songs the offline index resolved.
+    Returns a tuple: (results, pending, forward), where pending are the song indexes still to search
+    and forward is the on_result callback to hand the resolver for them.
+    """
+    indexed = indexed or {}
+    results = [None] * len(songs)
+    for i, uri in indexed.items():
+        title, artist = songs[i]
+        results[i] = {'index': i, 'title': title, 'artist': artist, 'uri': uri, 'found': True, 'error': None, 'confidence': None}
+        if on_result:
+            on_result(results[i])
+
+    pending = [i for i in range(len(songs)) if i not in indexed]
+
+    def forward(result):
+        # The resolver numbers the pending songs from 0; map back to the song index
+        result['index'] = pending[result['index']]
+        if on_result:
+            on_result(result)
+
+    return results, pending, forward
+
+def merge_resolved(results, pending, resolved):
+    """Puts the resolver's results for the pending songs into place."""
+    for i, result in zip(pending, resolved):
+        result['index'] = i
+        results[i] = result
+
+def expand_tracks(entries, results):
+    """Maps resolver results for the unique songs back onto every chart entry (adds 'year', 'index' is the chart rank)."""
+    return [dict(results[song], year=year, index=rank) for year, rank, song in entries]
+
+@app.cli.command('prefetch-charts')
+@click.option('--start', default=None, type=int, help='First year to pre-warm (default: 1946).')
+@click.option('--end', default=None, type=int, help='Last year to pre-warm (default: current year).')
+def prefetch_charts_command(start, end):
+    """Pre-warms the chart cache so no user request has to wait on billboard.com."""
+    years = [y for y in all_chart_years() if (start is None or y >= start) and (end is None or y <= end)]
+    refreshed = chart_cache.prefetch(years)
+    click.echo(f"Chart cache warm: refreshed {refreshed} of {len(years)} years.")
+
+def create_app_spotify_client():
+    """
+    Creates a Spotify client that needs no user login (client credentials flow), for offline jobs.
+    Reads SPOTIPY_CLIENT_ID and SPOTIPY_CLIENT_SECRET from the environment.
+    """
+    http = get_session('spotify', **HTTP_POOL_OPTIONS)
+    auth_manager = SpotifyClientCredentials(requests_session=http)
+    auth_manager.OAUTH_TOKEN_URL = f"{SPOTIFY_ACCOUNTS_URL}/api/token"
+    sp = spotipy.Spotify(auth_manager=auth_manager, requests_session=http)
+    sp.prefix = SPOTIFY_API_URL
+    return sp
+
+# (title, artist) -> track URI cache shared by every user, route and worker
+resolution_cache = ResolutionCache(
+    db_path('resolutions.db'),
+    ttl=int(os.getenv('RESOLUTION_CACHE_TTL', 30 * 24 * 3600)),
+    negative_ttl=int(os.getenv('RESOLUTION_CACHE_NEGATIVE_TTL', 24 * 3600)),
+)
+
+# Searches run concurrently, but all of them share one rate limit per process
+track_resolver = TrackResolver(
+    max_workers=int(os.getenv('RESOLVER_WORKERS', 8)),
+    rate=float(os.getenv('SPOTIFY_SEARCH_RATE', DEFAULT_SEARCH_RATE)),
+    burst=int(os.getenv('SPOTIFY_SEARCH_BURST', DEFAULT_SEARCH_BURST)),
+    cache=resolution_cache,
+    max_concurrency=int(os.getenv('ASYNC_MAX_SEARCHES', 64)), # Searches in flight per process in the async mode
+    flights=SingleFlight('search', leases=flight_leases, lease_ttl=FLIGHT_LEASE_TTL),
+)
+
+# Resolve results and queued playlist jobs ('sqlite' is shared by all workers, 'memory' is single-process)
+job_store = create_job_store(
+    os.getenv('JOB_BACKEND', 'sqlite'),
+    db_path('jobs.db'),
+    ttl=int(os.getenv('JOB_TTL', 24 * 3600)),
+)
+
+# (Spotify user, year) -> generated playlist and its tracks, so re-runs only add what is missing
+playlist_registry = PlaylistRegistry(db_path('playlists.db'))
+
+# Playlist generation runs on these worker threads instead of the request thread
+job_queue = JobQueue(
+    job_store,
+    max_workers=int(os.getenv('JOB_WORKERS', 4)),
+    max_per_owner=int(os.getenv('JOB_MAX_PER_USER', 2)),
+)
+
+@app.cli.command('build-index')
+@click.option('--start', default=None, type=int, help='First year to index (default: 1946).')
+@click.option('--end', default=None, type=int, help='Last year to index (default: current year).')
+@click.option('--force', is_flag=True, help='Re-scrape and re-resolve every year, even ones already indexed.')
+def build_index_command(start, end, force):
+    """
+    Scrapes and resolves every chart year into the offline index.
+    Incremental: fresh years only retry their entries without a URI, missing or stale years are rebuilt.
+    """
+    years = [y for y in all_chart_years() if (start is None or y >= start) and (end is None or y <= end)]
+    sp = create_app_spotify_client()
+    # --force searches every song again instead of answering from the resolution cache (and refreshes it)
+    resolver = TrackResolver(max_workers=track_resolver.max_workers, rate=track_resolver.bucket.rate,
+                             burst=track_resolver.bucket.capacity) if force else track_resolver
+    built = retried = 0
+    for year in years:
+        if not force and chart_index.is_fresh(year):
+            pending = chart_index.unresolved_entries(year)
+            if not pending:
+                continue
+            results = track_resolver.resolve(sp, [(title, artist) for _, title, artist in pending])
+            chart_index.set_uris(year, [(rank, result['uri']) for (rank, _, _), result in zip(pending, results)])
+            found = sum(1 for result in results if result['found'])
+            click.echo(f"{year}: resolved {found} of {len(pending)} missing entries.")
+            retried += 1
+            continue
+
+        # Not get_top_100_songs(): it serves a stale chart as is, and store_year() would mark it fresh
+        songs = chart_cache.refresh(year)
+        if not songs:
+            click.echo(f"{year}: could not fetch the chart, skipped.")
+            continue
+        results = resolver.resolve(sp, songs)
+        if force:
+            for result in results:
+                if result['error'] is None:
+                    resolution_cache.set(result['title'], result['artist'], result['uri'])
+        chart_index.store_year(year, songs, [result['uri'] for result in results])
+        click.echo(f"{year}: indexed {sum(1 for result in results if result['found'])} of {len(songs)} songs.")
+        built += 1
+
+    stats = chart_index.stats()
+    click.echo(f"Index built: {built} years rebuilt, {retried} years retried; "
+               f"{stats['resolved']} of {stats['entries']} entries resolved across {stats['years']} years.")
+
+@app.cli.command('benchmark-matching')
+@click.option('--start', default=2010, type=int, help='First chart year to match (default: 2010).')
+@click.option('--end', default=None, type=int, help='Last chart year to match (default: same as --start).')
+def benchmark_matching_command(start, end):
+    """
+    Resolves chart years with fresh searches (no caches, no index) and reports the hit rate,
+    search calls per song and the weakest matches. Needs SPOTIPY_CLIENT_ID/SECRET.
+    """
+    resolver = TrackResolver(max_workers=track_resolver.max_workers, rate=track_resolver.bucket.rate,
+                             burst=track_resolver.bucket.capacity)
+    sp = create_app_spotify_client()
+    results = []
+    for year in range(start, (end or start) + 1):
+        songs = get_top_100_songs(year)
+        if songs:
+            results.extend(resolver.resolve(sp, songs))
+
+    stats = resolver.stats()
+    click.echo(f"{stats['songs_searched']} songs: hit rate {stats['hit_rate']:.1%}, "
+               f"{stats['calls_per_song']} search calls per song ({stats['relaxed_queries']} relaxed queries).")
+    scored = sorted((r for r in results if r['confidence'] is not None), key=lambda r: r['confidence'])
+    for result in scored[:10]:
+        status = 'found' if result['found'] else 'not found'
+        click.echo(f"  {result['confidence']:.2f} {status}: {result['title']} by {result['artist']}")
+
+# Optionally pre-warm the chart cache in the background when the app starts
+if os.getenv('PREFETCH_CHARTS_ON_STARTUP', '').lower() in ('1', 'true', 'yes'):
+    threading.Thread(target=chart_cache.prefetch, args=(all_chart_years(),), name='chart-prefetch', daemon=True).start()
+
+# Opt-in cProfile of single requests: PROFILE_REQUESTS=1 profiles everything (local use),
+# PROFILE_TOKEN=<secret> profiles requests sent with a matching X-Profile header
+request_profiler = RequestProfiler(
+    token=os.getenv('PROFILE_TOKEN') or None,
+    always=os.getenv('PROFILE_REQUESTS', '').lower() in ('1', 'true', 'yes'),
+)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if request_profiler.enabled and request_profiler.wanted(request):
+        g.profile = request_profiler.start()
+
+@app.after_request
+def record_request_metrics(response):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        response.headers['X-Profile-File'] = request_profiler.finish(profile, request.endpoint or 'unknown')
+    started = g.pop('request_started', None)
+    if started is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=request.endpoint or 'unknown', status=response.status_code)
+    return response
+
+@app.teardown_request
+def stop_request_profile(exc):
+    # after_request does not run when the request ends in an unhandled error; stop the profile anyway
+    profile = g.pop('profile', None)
+    if profile is not None:
+        request_profiler.discard(profile)
+
+def get_owner_key():
+    """Returns a random per-session key that ties jobs to the browser session that started them."""
+    if 'owner_key' not in session:
+        session['owner_key'] = uuid.uuid4().hex
+    return session['owner_key']
+
+def get_year_and_token():
+    """
+    Reads the playlist year (session first, then the ?year= parameter) and the Spotify token.
+    Returns a tuple: (year, token_info, error_message); error_message is None when both are present.
+    """
+    year = session.get('year')
+    if not year:
+        year = request.args.get('year')
+        if not year:
+            return None, None, 'Year not found. Please try again.'
+        session['year'] = year
+    token_info = get_spotify_token() # Refreshes an expired token
+    if not token_info:
+        return year, None, 'Spotify token not found. Please authenticate again.'
+    return year, token_info, None
+
+def sse_event(event, data):
+    """Formats one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 def create_spotify_oauth():
     """Creates a SpotifyOAuth object using credentials stored in session."""
@@ -115,14 +498,18 @@ def create_spotify_oauth():
     if not client_id or not client_secret:
         return None
 
-    return SpotifyOAuth(
+    sp_oauth = SpotifyOAuth(
         client_id=client_id,
         client_secret=client_secret,
         redirect_uri=SPOTIPY_REDIRECT_URI,
         scope=SCOPE,
+        requests_session=get_session('spotify', **HTTP_POOL_OPTIONS),
         cache_path=None # Don't use file cache with sessions
         # Removed cache_path=session_cache_path() logic as we store token in Flask session
     )
+    sp_oauth.OAUTH_AUTHORIZE_URL = f"{SPOTIFY_ACCOUNTS_URL}/authorize"
+    sp_oauth.OAUTH_TOKEN_URL = f"{SPOTIFY_ACCOUNTS_URL}/api/token"
+    return sp_oauth
 
 def get_spotify_token():
     """Checks session for token info, attempts refresh if needed."""
@@ -143,8 +530,11 @@ def get_spotify_token():
     if sp_oauth.is_token_expired(token_info):
         logging.info("Spotify token expired, attempting refresh.")
         try:
-            token_info = sp_oauth.refresh_access_token(token_info['refresh_token'])
-            session['spotify_token_info'] = token_info # Store refreshed token
+            refreshed = sp_oauth.refresh_access_token(token_info['refresh_token'])
+            # Only write the session back when the token actually changed
+            if refreshed != token_info:
+                session['spotify_token_info'] = refreshed # Store refreshed token
+            token_info = refreshed
             logging.info("Spotify token refreshed successfully.")
         except Exception as e:
             logging.error(f"Error refreshing Spotify token: {e}")
@@ -157,6 +547,206 @@ def get_spotify_token():
     return token_info
 
 
+def load_resolved_tracks(sp, year, resolve_job_id=None, owner=None):
+    """
+    Returns the resolved tracks for a year: from a finished resolve job when one is given,
+    otherwise by scraping and resolving the chart now.
+    Returns None if the chart could not be scraped.
+    """
+    if resolve_job_id:
+        job = job_store.get(resolve_job_id, owner=owner)
+        if job and job['status'] == DONE and str(job['params'].get('year')) == str(year):
+            logging.info(f"Reusing {len(job['result']['tracks'])} resolved tracks from job {resolve_job_id}")
+            return job['result']['tracks']
+        logging.info(f"Job {resolve_job_id} not usable, resolving tracks again")
+
+    # Get the top 100 songs for every year requested (offline index first, then Billboard)
+    entries, songs, indexed = load_chart_songs(year)
+    if not songs:
+        return None
+    return expand_tracks(entries, resolve_chart_songs(sp, songs, indexed))
+
+def find_existing_playlist(sp, user_id, year, playlist_name):
+    """
+    Finds the playlist an earlier run generated for this user and year.
+    Returns a tuple: (playlist_id, playlist_url, track_uris), or (None, None, []) if there is none.
+    """
+    record = playlist_registry.get(user_id, year)
+    if record:
+        # One cheap call to make sure the user did not delete (unfollow) the playlist in the meantime
+        if is_following_playlist(sp, record['playlist_id'], user_id):
+            return record['playlist_id'], record['playlist_url'], record['track_uris']
+        logging.info(f"Playlist {record['playlist_id']} for {year} was deleted, looking for another one.")
+        playlist_registry.forget(user_id, year)
+
+    # No record (e.g. created before the registry existed): look for a playlist with the same name
+    playlist = find_playlist_by_name(sp, user_id, playlist_name)
+    if playlist:
+        logging.info(f"Reusing existing playlist '{playlist_name}' ({playlist['id']}).")
+        return playlist['id'], playlist['external_urls']['spotify'], get_playlist_track_uris(sp, playlist['id'])
+    return None, None, []
+
+def playlist_description(year):
+    if '-' in str(year):
+        return f"The songs from Billboard's Year-End Hot 100 charts for {year}."
+    return f"A playlist of the top 100 songs from Billboard's Hot 100 chart in {year}."
+
+def collect_track_uris(tracks):
+    """
+    Collects the resolved track URIs in chart order (a song can chart in several years of a range).
+    Returns a tuple: (resolved, not_found_songs, error_adding), where resolved is [(track_uri, "title by artist"), ...].
+    """
+    resolved = []
+    not_found_songs = []
+    error_adding = False
+    seen_labels = set()
+    for result in tracks:
+        label = f"{result['title']} by {result['artist']}"
+        if label in seen_labels:
+            continue
+        seen_labels.add(label)
+        if result['found']:
+            resolved.append((result['uri'], label))
+        else:
+            # Log the song that was not found or failed
+            if result['error']:
+                logging.warning(f"Error searching for {label}: {result['error']}")
+                error_adding = True
+            else:
+                logging.info(f"Not found on Spotify: {label}")
+            not_found_songs.append(label)
+    return resolved, not_found_songs, error_adding
+
+def missing_track_uris(resolved, existing_uris):
+    """Returns the resolved URIs the playlist does not have yet, in chart order and without duplicates."""
+    present = set(existing_uris)
+    missing_uris = []
+    for uri, _ in resolved:
+        if uri not in present:
+            missing_uris.append(uri)
+            present.add(uri)
+    return missing_uris
+
+def playlist_result(playlist_name, playlist_url, resolved, added_uris, failed_uris, reused, not_found_songs, error_adding):
+    """Builds the result dict shown on the generating page once the write step is done."""
+    added_tracks = []
+    failed_uris = set(failed_uris)
+    for uri, label in resolved:
+        if uri in failed_uris:
+            not_found_songs.append(label)
+            error_adding = True
+        else:
+            added_tracks.append(label)
+
+    if added_tracks and reused and not added_uris:
+        message = f"Playlist '{playlist_name}' is already up to date with {len(added_tracks)} songs."
+        if not_found_songs:
+            message += f" {len(not_found_songs)} songs could not be found on Spotify."
+    elif added_tracks:
+        verb = 'updated' if reused else 'created'
+        message = f"Successfully {verb} playlist '{playlist_name}' with {len(added_tracks)} songs."
+        if not_found_songs:
+            message += f" {len(not_found_songs)} songs could not be found on Spotify."
+    else:
+        message = "Failed to add any songs to the playlist."
+        error_adding = True
+
+    return {
+        'success': len(added_tracks) > 0,
+        'message': message,
+        'playlist_url': playlist_url,
+        'playlist_name': playlist_name,
+        'not_found': not_found_songs,
+        'error_adding': error_adding
+    }
+
+def generate_playlist(sp, year, tracks, context=None, user_id=None):
+    """
+    Creates the playlist, or reuses the one an earlier run made for this user and year,
+    and adds the resolved tracks it does not have yet in batches.
+    When run as a queued job, `context` is checked for cancellation between steps.
+    Returns the result dict shown on the generating page.
+    """
+    # Get the user ID (cached in the session at login, so usually no API call)
+    if not user_id:
+        user_id = sp.current_user()['id']
+    
+    if context:
+        context.check_cancelled()
+    
+    playlist_name = f"Billboard Top 100 - {year}"
+    # One run per user and year at a time (across workers): a retry that arrives while the first
+    # run is still creating or filling the playlist waits for it and then finds its record
+    with flight_leases.hold('playlist', f'{user_id}:{year}', ttl=FLIGHT_LEASE_TTL):
+        playlist_id, playlist_url, existing_uris = find_existing_playlist(sp, user_id, year, playlist_name)
+        reused = playlist_id is not None
+        if not reused:
+            # Create a new playlist
+            logging.info(f"Creating playlist: {playlist_name}")
+            playlist = sp.user_playlist_create(user=user_id, name=playlist_name, public=False, description=playlist_description(year))
+            playlist_id, playlist_url = playlist['id'], playlist['external_urls']['spotify']
+            logging.info(f"Playlist created with ID: {playlist_id}")
+
+        resolved, not_found_songs, error_adding = collect_track_uris(tracks)
+
+        if context:
+            context.check_cancelled()
+
+        # Write step: add only the tracks the playlist does not have yet, in batches of up to 100
+        missing_uris = missing_track_uris(resolved, existing_uris)
+        added_uris, failed_uris = add_tracks_in_batches(sp, playlist_id, missing_uris)
+        logging.info(f"Added {len(added_uris)} tracks to playlist {playlist_id} ({len(failed_uris)} failed, {len(resolved) - len(missing_uris)} already there)")
+        playlist_registry.record(user_id, year, playlist_id, playlist_url, list(existing_uris) + added_uris)
+    
+    return playlist_result(playlist_name, playlist_url, resolved, added_uris, failed_uris, reused, not_found_songs, error_adding)
+
+def track_years(year, tracks):
+    """Returns the chart years covered by the tracks, in order."""
+    return sorted({str(track.get('year', year)) for track in tracks})
+
+def merge_playlist_results(year, results):
+    """Combines the per-year results of a split run into one result dict with a 'playlists' list."""
+    not_found = []
+    for result in results:
+        not_found.extend(label for label in result['not_found'] if label not in not_found)
+    created = [result for result in results if result['success']]
+    return {
+        'success': bool(created),
+        'message': f"Generated {len(created)} of {len(results)} yearly playlists for {year}.",
+        'playlist_url': results[0]['playlist_url'],
+        'playlist_name': results[0]['playlist_name'],
+        'playlists': [{'name': r['playlist_name'], 'url': r['playlist_url']} for r in results],
+        'not_found': not_found,
+        'error_adding': any(result['error_adding'] for result in results)
+    }
+
+def generate_playlists(sp, year, tracks, split=False, context=None, user_id=None):
+    """
+    Builds one playlist for the year (or whole year range), or one playlist per year when `split` is set.
+    Returns the result dict shown on the generating page; split runs add a 'playlists' list.
+    """
+    years = track_years(year, tracks)
+    if not split or len(years) < 2:
+        return generate_playlist(sp, year, tracks, context, user_id=user_id)
+
+    if not user_id:
+        user_id = sp.current_user()['id']
+    results = [
+        generate_playlist(sp, chart_year, [t for t in tracks if str(t.get('year')) == chart_year], context, user_id=user_id)
+        for chart_year in years
+    ]
+    return merge_playlist_results(year, results)
+
+def run_playlist_job(params, context, access_token, owner, user_id=None):
+    """Queued job: loads (or resolves) the tracks and builds the playlist(s)."""
+    sp = create_spotify_client(access_token)
+    year = params['year']
+    tracks = load_resolved_tracks(sp, year, params.get('resolve_job_id'), owner)
+    if tracks is None:
+        raise ValueError(f'No songs found for the year {year}')
+    context.check_cancelled()
+    return generate_playlists(sp, year, tracks, params.get('split', False), context, user_id=user_id)
+
 # --- Flask Routes ---
 
 @app.route('/', methods=['GET', 'POST'])
@@ -170,15 +760,15 @@ def index():
         session['spotify_client_id'] = request.form.get('client_id')
         session['spotify_client_secret'] = request.form.get('client_secret')
 
-        # Validate year input
+        session['split_years'] = bool(request.form.get('split_years'))
+
+        # Validate year input: a single year, a range (1990-1999) or a decade (1990s)
         year = session.get('playlist_year')
         try:
-            year_int = int(year)
-            # Add reasonable year range check if desired (e.g., 1950-2025)
-            if not (1940 < year_int < 2030):
-                 raise ValueError("Year out of reasonable range")
-        except (ValueError, TypeError):
-            flash('Please enter a valid year (e.g., 2023).', 'error')
+            years = parse_year_range(year)
+            session['playlist_year'] = str(years[0]) if len(years) == 1 else f"{years[0]}-{years[-1]}"
+        except ValueError:
+            flash(f'Please enter a valid year (e.g., 2023), range (e.g., 1990-1999) or decade (e.g., 1990s), up to {MAX_YEAR_SPAN} years.', 'error')
             return redirect(url_for('index'))
 
         if not session.get('spotify_client_id') or not session.get('spotify_client_secret'):
@@ -255,6 +845,12 @@ def callback():
         session.modified = True  # Ensure session is saved
         logging.info("Successfully obtained and stored Spotify token.")
         
+        # Remember the Spotify user ID so playlist runs don't have to look it up every time
+        try:
+            session['spotify_user_id'] = create_spotify_client(token_info['access_token']).current_user()['id']
+        except Exception as e:
+            logging.warning(f"Could not look up the Spotify user ID: {e}")
+        
         # Get the year from the session and store it with the correct key
         year = session.get('playlist_year')
         if year:
@@ -285,7 +881,7 @@ def create_playlist():
         token_info = session.get('spotify_token_info')
         
         # Log the session variables for debugging
-        print(f"Create playlist - Session variables - year: {year}, token_info: {token_info is not None}")
+        logging.debug(f"Create playlist - Session variables - year: {year}, token_info: {token_info is not None}")
         
         if not year:
             # Try to get the year from the URL parameter as a fallback
@@ -293,97 +889,34 @@ def create_playlist():
             if year:
                 session['year'] = year
                 session.modified = True
-                print(f"Using year from URL parameter: {year}")
+                logging.info(f"Using year from URL parameter: {year}")
             else:
-                print("Year not found in session or URL parameters")
+                logging.warning("Year not found in session or URL parameters")
                 return jsonify({'error': 'Year not found. Please try again.'}), 400
         
         if not token_info:
-            print("Spotify token not found in session")
+            logging.warning("Spotify token not found in session")
             return jsonify({'error': 'Spotify token not found. Please authenticate again.'}), 400
         
-        # Get the top 100 songs from the Billboard chart for the specified year
-        songs = get_top_100_songs(year)
-        if not songs:
-            print(f"No songs found for year {year}")
-            return jsonify({'error': f'No songs found for the year {year}'}), 400
-        
         # Create a Spotify client
-        sp = spotipy.Spotify(auth=token_info['access_token'])
-        
-        # Get the user ID
-        user_info = sp.current_user()
-        user_id = user_info['id']
-        
-        # Create a new playlist
-        playlist_name = f"Billboard Top 100 - {year}"
-        playlist_description = f"A playlist of the top 100 songs from Billboard's Hot 100 chart in {year}."
-        print(f"Creating playlist: {playlist_name}")
-        playlist = sp.user_playlist_create(user=user_id, name=playlist_name, public=False, description=playlist_description)
-        print(f"Playlist created with ID: {playlist['id']}")
-        
-        # Initialize lists to track results
-        added_tracks = []
-        not_found_songs = []
-        error_adding = False
+        sp = create_spotify_client(token_info['access_token'])
         
-        # Add songs to the playlist
-        for title, artist in songs:
-            try:
-                # Search for the song on Spotify
-                query = f"{title} artist:{artist}"
-                results = sp.search(q=query, type='track', limit=1)
-                
-                # Check if the song was found
-                if results['tracks']['items']:
-                    track_uri = results['tracks']['items'][0]['uri']
-                    
-                    # Add the track to the playlist
-                    sp.playlist_add_items(playlist_id=playlist['id'], items=[track_uri])
-                    added_tracks.append(f"{title} by {artist}")
-                    
-                    # Log the success
-                    print(f"Added to playlist: {title} by {artist}")
-                else:
-                    # Log the not found song
-                    print(f"Not found on Spotify: {title} by {artist}")
-                    not_found_songs.append(f"{title} by {artist}")
-                    
-            except Exception as e:
-                # Log the error
-                print(f"Error adding {title} by {artist} to playlist: {str(e)}")
-                not_found_songs.append(f"{title} by {artist}")
-                error_adding = True
-        
-        # Prepare the response
-        if added_tracks:
-            message = f"Successfully created playlist '{playlist_name}' with {len(added_tracks)} songs."
-            if not_found_songs:
-                message += f" {len(not_found_songs)} songs could not be found on Spotify."
-        else:
-            message = "Failed to add any songs to the playlist."
-            error_adding = True
+        # Reuse the tracks /search_songs already resolved when the page passes its job ID
+        tracks = load_resolved_tracks(sp, year, request.args.get('job_id'), get_owner_key())
+        if tracks is None:
+            logging.warning(f"No songs found for year {year}")
+            return jsonify({'error': f'No songs found for the year {year}'}), 400
         
-        # Prepare the response data
-        response_data = {
-            'success': len(added_tracks) > 0,
-            'message': message,
-            'playlist_url': playlist['external_urls']['spotify'],
-            'playlist_name': playlist_name,
-            'not_found': not_found_songs,
-            'error_adding': error_adding
-        }
+        response_data = generate_playlists(sp, year, tracks, session.get('split_years', False), user_id=session.get('spotify_user_id'))
         
-        print(f"Sending response: {response_data}")
+        logging.debug(f"Sending response: {response_data}")
         
         # Return the response
         return jsonify(response_data)
         
     except Exception as e:
         # Log the error and return an error response
-        print(f"Error in create_playlist: {str(e)}")
-        import traceback
-        traceback.print_exc()  # Print the full traceback for debugging
+        logging.exception(f"Error in create_playlist: {e}")  # Logs the full traceback for debugging
         return jsonify({'error': str(e)}), 500
 
 @app.route('/search_songs', methods=['GET'])
@@ -395,7 +928,7 @@ def search_songs():
         token_info = session.get('spotify_token_info')
         
         # Log the session variables for debugging
-        print(f"Session variables - year: {year}, token_info: {token_info is not None}")
+        logging.debug(f"Session variables - year: {year}, token_info: {token_info is not None}")
         
         if not year:
             # Try to get the year from the URL parameter as a fallback
@@ -403,69 +936,219 @@ def search_songs():
             if year:
                 session['year'] = year
                 session.modified = True
-                print(f"Using year from URL parameter: {year}")
+                logging.info(f"Using year from URL parameter: {year}")
             else:
-                print("Year not found in session or URL parameters")
+                logging.warning("Year not found in session or URL parameters")
                 return jsonify({'error': 'Year not found. Please try again.'}), 400
         
         if not token_info:
-            print("Spotify token not found in session")
+            logging.warning("Spotify token not found in session")
             return jsonify({'error': 'Spotify token not found. Please authenticate again.'}), 400
         
-        # Get the top 100 songs from the Billboard chart for the specified year
-        songs = get_top_100_songs(year)
-        if not songs:
-            print(f"No songs found for year {year}")
-            return jsonify({'error': f'No songs found for the year {year}'}), 400
-        
-        # Create a Spotify client
-        sp = spotipy.Spotify(auth=token_info['access_token'])
+        # Start a job that scrapes and resolves the chart once; /create_playlist reuses its tracks
+        job_id = job_store.create('resolve', get_owner_key(), {'year': year}, status=RUNNING)
+        try:
+            # Get the top 100 songs from the Billboard chart for the specified year(s)
+            entries, songs, indexed = load_chart_songs(year)
+            if not songs:
+                logging.warning(f"No songs found for year {year}")
+                job_store.update(job_id, FAILED, error=f'No songs found for the year {year}')
+                return jsonify({'error': f'No songs found for the year {year}'}), 400
+
+            # Create a Spotify client
+            sp = create_spotify_client(token_info['access_token'])
+
+            # Search for each unique song the index does not cover (concurrently, results come back in chart order)
+            results = resolve_chart_songs(sp, songs, indexed)
+            job_store.update(job_id, DONE, result={'year': year, 'tracks': expand_tracks(entries, results)})
+        except Exception as e:
+            # Otherwise the job stays RUNNING, and counts against the owner's limit, until ACTIVE_JOB_TIMEOUT
+            job_store.update(job_id, FAILED, error=str(e))
+            raise
         
-        # Search for each song on Spotify
         song_results = []
-        for index, (title, artist) in enumerate(songs):
-            try:
-                # Search for the song on Spotify
-                query = f"{title} artist:{artist}"
-                results = sp.search(q=query, type='track', limit=1)
-                
-                # Check if the song was found
-                found = len(results['tracks']['items']) > 0
-                
-                # Add the result to the list
-                song_results.append({
-                    'index': index,
-                    'title': title,
-                    'artist': artist,
-                    'found': found,
-                    'error': None
-                })
-                
-                # Log the search result
-                print(f"Song {index + 1}/100: {title} by {artist} - {'Found' if found else 'Not Found'}")
-                
-            except Exception as e:
-                # Log the error and add it to the results
-                print(f"Error searching for {title} by {artist}: {str(e)}")
-                song_results.append({
-                    'index': index,
-                    'title': title,
-                    'artist': artist,
-                    'found': False,
-                    'error': str(e)
-                })
+        for result in results:
+            song_results.append({
+                'index': result['index'],
+                'title': result['title'],
+                'artist': result['artist'],
+                'found': result['found'],
+                'error': result['error'],
+                'confidence': result['confidence']
+            })
+            
+            # Log the search result
+            if result['error']:
+                logging.warning(f"Error searching for {result['title']} by {result['artist']}: {result['error']}")
+            else:
+                logging.debug(f"Song {result['index'] + 1}/{len(songs)}: {result['title']} by {result['artist']} - {'Found' if result['found'] else 'Not Found'}")
         
         # Return the results
         return jsonify({
             'success': True,
+            'job_id': job_id,
             'songs': song_results
         })
         
     except Exception as e:
         # Log the error and return an error response
-        print(f"Error in search_songs: {str(e)}")
+        logging.exception(f"Error in search_songs: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/search_songs/stream', methods=['GET'])
+def search_songs_stream():
+    """
+    Streams song search results as Server-Sent Events while they resolve.
+    Events: 'start' (total songs), 'song' (one result), 'done' (job ID for /create_playlist), 'error'.
+    """
+    year, token_info, error = get_year_and_token()
+    if error:
+        logging.warning(f"search_songs_stream: {error}")
+        return jsonify({'error': error}), 400
+
+    # Everything that touches the session happens before the response starts streaming
+    owner = get_owner_key()
+    sp = create_spotify_client(token_info['access_token'])
+
+    def generate():
+        yield sse_event('status', {'message': f'Fetching the Billboard chart for {year}...'})
+
+        job_id = job_store.create('resolve', owner, {'year': year}, status=RUNNING)
+        try:
+            entries, songs, indexed = load_chart_songs(year)
+        except Exception as e:
+            logging.error(f"Error loading the chart for {year}: {e}")
+            job_store.update(job_id, FAILED, error=str(e))
+            yield sse_event('error', {'error': str(e)})
+            return
+        if not songs:
+            job_store.update(job_id, FAILED, error=f'No songs found for the year {year}')
+            yield sse_event('error', {'error': f'No songs found for the year {year}'})
+            return
+
+        yield sse_event('start', {'total': len(songs)})
+
+        # Resolve on a background thread and forward each result as it completes
+        results = queue.Queue()
+
+        def resolve():
+            try:
+                resolved = resolve_chart_songs(sp, songs, indexed, on_result=results.put)
+                job_store.update(job_id, DONE, result={'year': year, 'tracks': expand_tracks(entries, resolved)})
+                results.put(None)
+            except Exception as e:
+                logging.error(f"Error resolving songs for {year}: {e}")
+                job_store.update(job_id, FAILED, error=str(e))
+                results.put(e)
+
+        threading.Thread(target=resolve, name=f'resolve-{job_id}', daemon=True).start()
+
+        while True:
+            try:
+                result = results.get(timeout=15)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+            if result is None:
+                yield sse_event('done', {'job_id': job_id, 'total': len(songs)})
+                return
+            if isinstance(result, Exception):
+                yield sse_event('error', {'error': str(result)})
+                return
+            yield sse_event('song', {
+                'index': result['index'],
+                'title': result['title'],
+                'artist': result['artist'],
+                'found': result['found'],
+                'error': result['error'],
+                'confidence': result['confidence']
+            })
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/jobs', methods=['POST'])
+def enqueue_playlist_job():
+    """Queues playlist generation and returns the job ID to poll."""
+    year, token_info, error = get_year_and_token()
+    if error:
+        return jsonify({'error': error}), 400
+
+    data = request.get_json(silent=True) or request.form
+    owner = get_owner_key()
+    params = {'year': str(year), 'split': session.get('split_years', False), 'resolve_job_id': data.get('resolve_job_id')}
+    access_token = token_info['access_token']
+    user_id = session.get('spotify_user_id')
+    try:
+        job_id = job_queue.enqueue(
+            'playlist', owner, params,
+            lambda params, context: run_playlist_job(params, context, access_token, owner, user_id)
+        )
+    except JobLimitExceeded as e:
+        return jsonify({'error': str(e)}), 429
+
+    logging.info(f"Queued playlist job {job_id} for {year}.")
+    return jsonify({
+        'job_id': job_id,
+        'status_url': url_for('job_status', job_id=job_id),
+        'result_url': url_for('job_result', job_id=job_id)
+    }), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Returns the status of a job started by this session."""
+    job = job_store.get(job_id, owner=get_owner_key())
+    if not job:
+        return jsonify({'error': 'Job not found.'}), 404
+    return jsonify({
+        'job_id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'error': job['error'],
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at']
+    })
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """Returns a finished job's result; 202 while it is still queued or running."""
+    job = job_store.get(job_id, owner=get_owner_key())
+    if not job:
+        return jsonify({'error': 'Job not found.'}), 404
+    if job['status'] == DONE:
+        return jsonify(job['result'])
+    if job['status'] == FAILED:
+        return jsonify({'error': job['error'] or 'Job failed.'}), 500
+    if job['status'] == CANCELLED:
+        return jsonify({'error': 'Job was cancelled.'}), 409
+    return jsonify({'job_id': job['id'], 'status': job['status']}), 202
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancels a queued job, or asks a running one to stop at its next step."""
+    if not job_store.get(job_id, owner=get_owner_key()):
+        return jsonify({'error': 'Job not found.'}), 404
+    status = job_queue.cancel(job_id)
+    return jsonify({'job_id': job_id, 'status': status})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint: stage timings, cache hits and misses, retries and rate-limit waits."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Returns cache counters and connection pool stats for this worker process."""
+    return jsonify({
+        'resolution_cache': resolution_cache.stats(),
+        'chart_index': chart_index.stats(),
+        'resolver': track_resolver.stats(),
+        'http_pools': pool_stats()
+    })
+
 # --- Main Execution ---
 if __name__ == '__main__':
     # Use 0.0.0.0 to make it accessible on your network, default port is 5000
@@ -0,0 +1,450 @@
+"""
+ASGI entry point: the async serving mode.
+
+    uvicorn asgi:app --workers 2
+
+The routes that spend their time waiting on Billboard and Spotify run as
+coroutines on the event loop with httpx (async_http.py), so one process can
+hold hundreds of playlist generations in flight instead of one per thread.
+Blocking work on their path (SQLite stores, the session, OAuth token refresh,
+chart parsing) runs on threads with asyncio.to_thread so it never stalls the loop:
+
+- GET /search_songs, GET /search_songs/stream, GET /create_playlist
+- POST /jobs (the playlist job runs as a task on the loop)
+
+Every other route (the form, the OAuth callback, job status...) is the
+unchanged Flask app, run on a thread pool. Sessions, caches, the chart
+index, the job store, the rate limiter and /metrics are shared with the sync
+code. The sync entry point (`gunicorn app:app`) is still the default.
+
+Needs `pip install httpx uvicorn`.
+"""
+import asyncio
+import io
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import g, jsonify, request, session, url_for
+from flask.ctx import RequestContext
+
+import app as sync_app
+from app import (
+    BILLBOARD_ERRORS, BILLBOARD_FETCH_SECONDS, BILLBOARD_HEADERS, FLIGHT_LEASE_TTL, SPOTIFY_API_URL, chart_cache,
+    chart_url, collect_track_uris, expand_tracks, flight_leases, get_indexed_charts, get_owner_key, get_year_and_token, indexed_results,
+    job_queue, job_store, merge_charts, merge_playlist_results, merge_resolved, missing_track_uris,
+    parse_chart_page, parse_year_range, playlist_description, playlist_registry, playlist_result, request_profiler, sse_event,
+    track_resolver, track_years,
+)
+from async_http import AsyncSpotify, close_async_clients, fetch_chart_page
+from jobs import DONE, FAILED, RUNNING, JobLimitExceeded
+from playlist_registry import find_playlist_by_name_async, get_playlist_track_uris_async, is_following_playlist_async
+from playlist_writer import add_tracks_in_batches_async
+
+flask_app = sync_app.app
+
+
+# --- Async pipeline (mirrors the sync helpers in app.py) ---
+
+async def scrape_top_100_songs_async(year):
+    """Async counterpart of scrape_top_100_songs(); parsing runs on a thread to keep the loop free."""
+    try:
+        with BILLBOARD_FETCH_SECONDS.time():
+            html = await fetch_chart_page(chart_url(year), BILLBOARD_HEADERS)
+    except Exception as e:
+        BILLBOARD_ERRORS.inc(stage='fetch')
+        logging.error(f"Error fetching Billboard page for {year}: {e}")
+        return None
+    try:
+        return await asyncio.to_thread(parse_chart_page, year, html)
+    except Exception as e:
+        BILLBOARD_ERRORS.inc(stage='parse')
+        logging.error(f"Error parsing Billboard page for {year}: {e}")
+        return None
+
+
+async def get_top_100_songs_async(year):
+    """Chart cache first; a miss is fetched on the loop (once for concurrent requests) and stored for every worker."""
+    return await chart_cache.get_async(year, scrape_top_100_songs_async)
+
+
+async def load_chart_songs_async(year_value):
+    """Async counterpart of load_chart_songs(): index first, the missing years are fetched concurrently."""
+    charts, missing = await asyncio.to_thread(get_indexed_charts, parse_year_range(str(year_value)))
+    for year, songs in zip(missing, await asyncio.gather(*(get_top_100_songs_async(y) for y in missing))):
+        if songs:
+            charts[year] = [(title, artist, None) for title, artist in songs]
+    return merge_charts(charts)
+
+
+async def resolve_chart_songs_async(sp, songs, indexed=None, on_result=None):
+    results, pending, forward = indexed_results(songs, indexed, on_result)
+    if pending:
+        merge_resolved(results, pending, await track_resolver.resolve_async(sp, [songs[i] for i in pending], on_result=forward))
+    return results
+
+
+async def load_resolved_tracks_async(sp, year, resolve_job_id=None, owner=None):
+    if resolve_job_id:
+        job = await asyncio.to_thread(job_store.get, resolve_job_id, owner=owner)
+        if job and job['status'] == DONE and str(job['params'].get('year')) == str(year):
+            logging.info(f"Reusing {len(job['result']['tracks'])} resolved tracks from job {resolve_job_id}")
+            return job['result']['tracks']
+        logging.info(f"Job {resolve_job_id} not usable, resolving tracks again")
+
+    entries, songs, indexed = await load_chart_songs_async(year)
+    if not songs:
+        return None
+    return expand_tracks(entries, await resolve_chart_songs_async(sp, songs, indexed))
+
+
+async def find_existing_playlist_async(sp, user_id, year, playlist_name):
+    record = await asyncio.to_thread(playlist_registry.get, user_id, year)
+    if record:
+        if await is_following_playlist_async(sp, record['playlist_id'], user_id):
+            return record['playlist_id'], record['playlist_url'], record['track_uris']
+        logging.info(f"Playlist {record['playlist_id']} for {year} was deleted, looking for another one.")
+        await asyncio.to_thread(playlist_registry.forget, user_id, year)
+
+    playlist = await find_playlist_by_name_async(sp, user_id, playlist_name)
+    if playlist:
+        logging.info(f"Reusing existing playlist '{playlist_name}' ({playlist['id']}).")
+        return playlist['id'], playlist['external_urls']['spotify'], await get_playlist_track_uris_async(sp, playlist['id'])
+    return None, None, []
+
+
+async def generate_playlist_async(sp, year, tracks, context=None, user_id=None):
+    """Async counterpart of generate_playlist()."""
+    if not user_id:
+        user_id = (await sp.current_user())['id']
+    if context:
+        await context.check_cancelled_async()
+
+    playlist_name = f"Billboard Top 100 - {year}"
+    async with flight_leases.hold_async('playlist', f'{user_id}:{year}', ttl=FLIGHT_LEASE_TTL):
+        playlist_id, playlist_url, existing_uris = await find_existing_playlist_async(sp, user_id, year, playlist_name)
+        reused = playlist_id is not None
+        if not reused:
+            logging.info(f"Creating playlist: {playlist_name}")
+            playlist = await sp.user_playlist_create(user=user_id, name=playlist_name, public=False, description=playlist_description(year))
+            playlist_id, playlist_url = playlist['id'], playlist['external_urls']['spotify']
+
+        resolved, not_found_songs, error_adding = collect_track_uris(tracks)
+        if context:
+            await context.check_cancelled_async()
+
+        missing_uris = missing_track_uris(resolved, existing_uris)
+        added_uris, failed_uris = await add_tracks_in_batches_async(sp, playlist_id, missing_uris)
+        logging.info(f"Added {len(added_uris)} tracks to playlist {playlist_id} ({len(failed_uris)} failed, {len(resolved) - len(missing_uris)} already there)")
+        await asyncio.to_thread(playlist_registry.record, user_id, year, playlist_id, playlist_url, list(existing_uris) + added_uris)
+    return playlist_result(playlist_name, playlist_url, resolved, added_uris, failed_uris, reused, not_found_songs, error_adding)
+
+
+async def generate_playlists_async(sp, year, tracks, split=False, context=None, user_id=None):
+    """Async counterpart of generate_playlists(); the yearly playlists of a split run are built concurrently."""
+    years = track_years(year, tracks)
+    if not split or len(years) < 2:
+        return await generate_playlist_async(sp, year, tracks, context, user_id=user_id)
+
+    if not user_id:
+        user_id = (await sp.current_user())['id']
+    results = await asyncio.gather(*(
+        generate_playlist_async(sp, chart_year, [t for t in tracks if str(t.get('year')) == chart_year], context, user_id=user_id)
+        for chart_year in years
+    ))
+    return merge_playlist_results(year, list(results))
+
+
+async def run_playlist_job_async(params, context, access_token, owner, user_id=None):
+    sp = AsyncSpotify(access_token, prefix=SPOTIFY_API_URL)
+    year = params['year']
+    tracks = await load_resolved_tracks_async(sp, year, params.get('resolve_job_id'), owner)
+    if tracks is None:
+        raise ValueError(f'No songs found for the year {year}')
+    await context.check_cancelled_async()
+    return await generate_playlists_async(sp, year, tracks, params.get('split', False), context, user_id=user_id)
+
+
+# --- Async routes (same responses as the Flask routes they replace) ---
+
+def song_event(result):
+    return {key: result[key] for key in ('index', 'title', 'artist', 'found', 'error', 'confidence')}
+
+
+async def search_songs(request):
+    year, token_info, error = await asyncio.to_thread(get_year_and_token)  # May refresh the token over HTTP
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        job_id = await asyncio.to_thread(job_store.create, 'resolve', get_owner_key(), {'year': year}, status=RUNNING)
+        try:
+            entries, songs, indexed = await load_chart_songs_async(year)
+            if not songs:
+                await asyncio.to_thread(job_store.update, job_id, FAILED, error=f'No songs found for the year {year}')
+                return jsonify({'error': f'No songs found for the year {year}'}), 400
+
+            sp = AsyncSpotify(token_info['access_token'], prefix=SPOTIFY_API_URL)
+            results = await resolve_chart_songs_async(sp, songs, indexed)
+            await asyncio.to_thread(job_store.update, job_id, DONE, result={'year': year, 'tracks': expand_tracks(entries, results)})
+        except Exception as e:
+            await asyncio.to_thread(job_store.update, job_id, FAILED, error=str(e))
+            raise
+        return jsonify({'success': True, 'job_id': job_id, 'songs': [song_event(result) for result in results]})
+    except Exception as e:
+        logging.exception(f"Error in search_songs: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+async def search_songs_stream(request):
+    year, token_info, error = await asyncio.to_thread(get_year_and_token)  # May refresh the token over HTTP
+    if error:
+        return jsonify({'error': error}), 400
+    owner = get_owner_key()
+    sp = AsyncSpotify(token_info['access_token'], prefix=SPOTIFY_API_URL)
+
+    async def generate():
+        yield sse_event('status', {'message': f'Fetching the Billboard chart for {year}...'})
+        job_id = await asyncio.to_thread(job_store.create, 'resolve', owner, {'year': year}, status=RUNNING)
+        try:
+            entries, songs, indexed = await load_chart_songs_async(year)
+        except Exception as e:
+            logging.error(f"Error loading the chart for {year}: {e}")
+            await asyncio.to_thread(job_store.update, job_id, FAILED, error=str(e))
+            yield sse_event('error', {'error': str(e)})
+            return
+        if not songs:
+            await asyncio.to_thread(job_store.update, job_id, FAILED, error=f'No songs found for the year {year}')
+            yield sse_event('error', {'error': f'No songs found for the year {year}'})
+            return
+
+        yield sse_event('start', {'total': len(songs)})
+        results = asyncio.Queue()
+
+        async def resolve():
+            try:
+                resolved = await resolve_chart_songs_async(sp, songs, indexed, on_result=results.put_nowait)
+                await asyncio.to_thread(job_store.update, job_id, DONE, result={'year': year, 'tracks': expand_tracks(entries, resolved)})
+                results.put_nowait(None)
+            except Exception as e:
+                logging.error(f"Error resolving songs for {year}: {e}")
+                await asyncio.to_thread(job_store.update, job_id, FAILED, error=str(e))
+                results.put_nowait(e)
+
+        task = asyncio.create_task(resolve())
+        try:
+            while True:
+                try:
+                    result = await asyncio.wait_for(results.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                if result is None:
+                    yield sse_event('done', {'job_id': job_id, 'total': len(songs)})
+                    return
+                if isinstance(result, Exception):
+                    yield sse_event('error', {'error': str(result)})
+                    return
+                yield sse_event('song', song_event(result))
+        finally:
+            if not task.done():
+                task.cancel()  # The client went away
+
+    response = flask_app.response_class(mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    return response, generate()
+
+
+async def create_playlist(request):
+    year, token_info, error = await asyncio.to_thread(get_year_and_token)  # May refresh the token over HTTP
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        sp = AsyncSpotify(token_info['access_token'], prefix=SPOTIFY_API_URL)
+        tracks = await load_resolved_tracks_async(sp, year, request.args.get('job_id'), get_owner_key())
+        if tracks is None:
+            return jsonify({'error': f'No songs found for the year {year}'}), 400
+        return jsonify(await generate_playlists_async(sp, year, tracks, session.get('split_years', False), user_id=session.get('spotify_user_id')))
+    except Exception as e:
+        logging.exception(f"Error in create_playlist: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+async def enqueue_playlist_job(request):
+    year, token_info, error = await asyncio.to_thread(get_year_and_token)  # May refresh the token over HTTP
+    if error:
+        return jsonify({'error': error}), 400
+
+    data = request.get_json(silent=True) or request.form
+    owner = get_owner_key()
+    params = {'year': str(year), 'split': session.get('split_years', False), 'resolve_job_id': data.get('resolve_job_id')}
+    access_token = token_info['access_token']
+    user_id = session.get('spotify_user_id')
+    try:
+        job_id = await job_queue.enqueue_async(
+            'playlist', owner, params,
+            lambda params, context: run_playlist_job_async(params, context, access_token, owner, user_id)
+        )
+    except JobLimitExceeded as e:
+        return jsonify({'error': str(e)}), 429
+
+    logging.info(f"Queued async playlist job {job_id} for {year}.")
+    return jsonify({
+        'job_id': job_id,
+        'status_url': url_for('job_status', job_id=job_id),
+        'result_url': url_for('job_result', job_id=job_id)
+    }), 202
+
+
+ASYNC_ROUTES = {
+    ('GET', '/search_songs'): ('search_songs', search_songs),
+    ('GET', '/search_songs/stream'): ('search_songs_stream', search_songs_stream),
+    ('GET', '/create_playlist'): ('create_playlist', create_playlist),
+    ('POST', '/jobs'): ('enqueue_playlist_job', enqueue_playlist_job),
+}
+
+
+# --- ASGI plumbing ---
+
+def build_environ(scope, body):
+    """Turns an ASGI HTTP scope and body into a WSGI environ so Flask can build its request and session."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin1').upper().replace('-', '_')
+        value = value.decode('latin1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def send_response(send, response, stream=None):
+    headers = [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in response.headers.items()
+               if not (stream is not None and name.lower() == 'content-length')]
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+    if stream is None:
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+        return
+    try:
+        async for chunk in stream:
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        await stream.aclose()
+
+
+async def finish_response(response):
+    """Runs the after-request hooks and saves the session on a thread (inside the request context)."""
+    # A profile has to be stopped on the thread that started it: this one, in preprocess_request()
+    profile = g.pop('profile', None)
+    if profile is not None:
+        response.headers['X-Profile-File'] = request_profiler.finish(profile, request.endpoint or 'unknown')
+    return await asyncio.to_thread(flask_app.process_response, response)
+
+
+async def dispatch(scope, receive, send, endpoint, view):
+    """
+    Runs an async view inside a Flask request context, so session, request, url_for and the
+    before/after request hooks (metrics, profiling, saving the session) work as in the sync app.
+    """
+    # Pushing the context matches the Flask rule for the same path, so request.endpoint is set as usual
+    environ = build_environ(scope, await read_body(receive))
+    # Loading and saving the session hit its store (SQLite by default), so they run on threads
+    opened = await asyncio.to_thread(flask_app.session_interface.open_session, flask_app, flask_app.request_class(environ))
+    ctx = RequestContext(flask_app, environ, session=opened)
+    ctx.push()
+    stream = None
+    try:
+        rv = flask_app.preprocess_request()
+        if rv is None:
+            rv = await view(ctx.request)
+            if isinstance(rv, tuple) and len(rv) == 2 and hasattr(rv[1], '__aiter__'):
+                rv, stream = rv
+        response = await finish_response(flask_app.make_response(rv))
+    except Exception as e:
+        logging.exception(f"Error in {endpoint}: {e}")
+        response = await finish_response(flask_app.make_response((jsonify({'error': str(e)}), 500)))
+    finally:
+        ctx.pop()
+    # The session was saved above; the streamed body no longer touches it
+    await send_response(send, response, stream)
+
+
+async def call_wsgi(scope, receive, send, executor):
+    """Runs the Flask app for one request on the thread pool and sends its (buffered) response."""
+    environ = build_environ(scope, await read_body(receive))
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = headers
+        return lambda data: None
+
+    def run():
+        result = flask_app(environ, start_response)
+        try:
+            return b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    body = await asyncio.get_running_loop().run_in_executor(executor, run)
+    headers = [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in started['headers']]
+    await send({'type': 'http.response.start', 'status': started['status'], 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class AsyncApp:
+    """ASGI application: native coroutines for ASYNC_ROUTES, the Flask app (on threads) for everything else."""
+
+    def __init__(self, wsgi_threads=16):
+        self.executor = ThreadPoolExecutor(max_workers=wsgi_threads, thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await close_async_clients()
+                    self.executor.shutdown(wait=False)
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+
+        route = ASYNC_ROUTES.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+        if route is None:
+            await call_wsgi(scope, receive, send, self.executor)
+            return
+        await dispatch(scope, receive, send, *route)
+
+
+app = AsyncApp(wsgi_threads=int(os.getenv('ASGI_WSGI_THREADS', 16)))
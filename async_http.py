@@ -0,0 +1,113 @@
+"""
+Async HTTP clients for the ASGI serving mode (see asgi.py).
+
+One pooled httpx.AsyncClient per upstream is shared by every request the
+event loop is serving, the async counterpart of http_pool.get_session().
+AsyncSpotify covers the handful of Web API calls the app makes and raises
+spotipy's SpotifyException (with the response headers) so the resolver and
+the playlist writer handle errors the same way in both modes.
+
+httpx is optional; it is only needed when serving through asgi.py.
+"""
+import asyncio
+
+from spotipy.exceptions import SpotifyException
+
+try:
+    import httpx
+except ImportError:  # Only the async serving mode needs httpx
+    httpx = None
+
+_clients = {}
+
+
+def get_async_client(name, pool_size=100, timeout=15.0):
+    """Returns the shared async client for an upstream ('billboard' or 'spotify'), creating it on first use."""
+    if httpx is None:
+        raise RuntimeError("The async serving mode needs httpx: pip install httpx")
+    client = _clients.get(name)
+    if client is None:
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        # Connection errors are retried by the transport; HTTP errors are left to the caller
+        transport = httpx.AsyncHTTPTransport(retries=3, limits=limits)
+        # Waiting for a free connection is not a failure: callers already cap how many requests they start
+        timeout = httpx.Timeout(timeout, pool=None)
+        client = _clients[name] = httpx.AsyncClient(transport=transport, timeout=timeout, follow_redirects=True)
+    return client
+
+
+async def close_async_clients():
+    """Closes every shared client (on ASGI lifespan shutdown)."""
+    clients = list(_clients.values())
+    _clients.clear()
+    await asyncio.gather(*(client.aclose() for client in clients))
+
+
+async def fetch_chart_page(url, headers, retries=3, backoff=0.5):
+    """Downloads a Billboard page, retrying 429 and 5xx responses like the sync 'billboard' session."""
+    client = get_async_client('billboard')
+    for attempt in range(retries + 1):
+        response = await client.get(url, headers=headers)
+        if response.status_code in (429, 500, 502, 503, 504) and attempt < retries:
+            try:
+                delay = float(response.headers.get('Retry-After'))
+            except (TypeError, ValueError):
+                delay = backoff * (2 ** attempt)
+            await asyncio.sleep(delay)
+            continue
+        response.raise_for_status()
+        return response.text
+
+
+class AsyncSpotify:
+    """Minimal async Spotify Web API client with the same method names and return values as spotipy.Spotify."""
+
+    def __init__(self, access_token, prefix='https://api.spotify.com/v1/', client=None):
+        self.prefix = prefix
+        self.client = client or get_async_client('spotify')
+        self.headers = {'Authorization': f'Bearer {access_token}'}
+
+    async def _call(self, method, url, params=None, payload=None):
+        if not url.startswith('http'):
+            url = self.prefix + url
+        params = {key: value for key, value in (params or {}).items() if value is not None}
+        try:
+            response = await self.client.request(method, url, params=params, json=payload, headers=self.headers)
+        except httpx.HTTPError as e:
+            raise SpotifyException(599, -1, f"{url}: {type(e).__name__} {e}")
+        if response.status_code >= 400:
+            try:
+                message = response.json()['error']['message']
+            except Exception:
+                message = response.text or 'error'
+            raise SpotifyException(response.status_code, -1, f"{url}: {message}", headers=response.headers)
+        return response.json() if response.content else None
+
+    async def search(self, q, limit=10, offset=0, type='track', market=None):
+        return await self._call('GET', 'search', {'q': q, 'limit': limit, 'offset': offset, 'type': type, 'market': market})
+
+    async def current_user(self):
+        return await self._call('GET', 'me/')
+
+    async def user_playlist_create(self, user, name, public=True, collaborative=False, description=''):
+        data = {'name': name, 'public': public, 'collaborative': collaborative, 'description': description}
+        return await self._call('POST', f'users/{user}/playlists', payload=data)
+
+    async def playlist_add_items(self, playlist_id, items, position=None):
+        return await self._call('POST', f'playlists/{playlist_id}/items', {'position': position}, payload=list(items))
+
+    async def playlist(self, playlist_id, fields=None):
+        return await self._call('GET', f'playlists/{playlist_id}', {'fields': fields, 'additional_types': 'track'})
+
+    async def playlist_is_following(self, playlist_id, user_ids):
+        return await self._call('GET', f'playlists/{playlist_id}/followers/contains', {'ids': ','.join(user_ids)})
+
+    async def current_user_playlists(self, limit=50, offset=0):
+        return await self._call('GET', 'me/playlists', {'limit': limit, 'offset': offset})
+
+    async def playlist_items(self, playlist_id, fields=None, limit=100, offset=0, additional_types=('track',)):
+        params = {'fields': fields, 'limit': limit, 'offset': offset, 'additional_types': ','.join(additional_types)}
+        return await self._call('GET', f'playlists/{playlist_id}/items', params)
+
+    async def next(self, result):
+        return await self._call('GET', result['next']) if result.get('next') else None
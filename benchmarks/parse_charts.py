@@ -0,0 +1,67 @@
+"""
+Benchmark: chart page parse time per parser over saved Billboard pages.
+
+Parses every page in --fixtures (default: tests/fixtures/hot-100-*.html)
+with the full 'soup' parser and the lxml fast path, checks that they agree,
+and reports the time per page and the speedup over 'soup'. Drop freshly saved pages into the
+fixtures directory to measure against the live markup.
+
+    python benchmarks/parse_charts.py --repeat 20
+"""
+import glob
+import os
+import statistics
+import sys
+import time
+
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import chart_parsers  # noqa: E402
+
+
+PARSERS = {
+    'soup': chart_parsers.parse_chart_soup,
+    'fast-lxml': lambda html: chart_parsers.parse_chart(html, 'fast'),
+}
+
+
+@click.command()
+@click.option('--fixtures', default=os.path.join(ROOT, 'tests', 'fixtures'), help='Directory of saved chart pages.')
+@click.option('--repeat', default=10, type=int, help='Parses per page and parser (default: 10).')
+def main(fixtures, repeat):
+    paths = sorted(glob.glob(os.path.join(fixtures, '*.html')))
+    if not paths:
+        raise click.ClickException(f"No .html pages in {fixtures}")
+    if chart_parsers.lxml is None:
+        raise click.ClickException("lxml is not installed; the fast parser is the soup parser without it")
+    parsers = PARSERS
+
+    click.echo(f"{len(paths)} pages, {repeat} parses each; median ms per page")
+    click.echo(f"{'page':<22} {'KB':>5} " + ' '.join(f'{name:>14}' for name in parsers) + '  same')
+    totals = {name: 0.0 for name in parsers}
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            html = f.read()
+        row = []
+        results = []
+        for name, parse in parsers.items():
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                songs = parse(html)
+                times.append(time.perf_counter() - start)
+            results.append(songs)
+            median = statistics.median(times)
+            totals[name] += median
+            row.append(f'{median * 1000:>14.1f}')
+        same = all(songs == results[0] for songs in results)
+        click.echo(f"{os.path.basename(path):<22} {len(html) // 1024:>5} {' '.join(row)}  {'yes' if same else 'NO'}")
+
+    click.echo('speedup over soup:     ' + ' '.join(f'{totals["soup"] / totals[name]:>13.1f}x' for name in parsers))
+
+
+if __name__ == '__main__':
+    main()
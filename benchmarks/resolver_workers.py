@@ -0,0 +1,69 @@
+"""
+Benchmark: track resolution time against the number of resolver workers.
+
+Resolves the same generated charts with TrackResolver at each worker count
+against loadtest.py's fake Spotify API (with injected latency, and
+optionally 429s), without the resolution cache, and reports the time and
+speedup over one worker. The rate limit is the shipped default
+(SPOTIFY_SEARCH_RATE / SPOTIFY_SEARCH_BURST when set, like the app); pass
+--rate and --burst to see where it becomes the bottleneck.
+
+    python benchmarks/resolver_workers.py --workers 1,8,32 --latency 0.05 --songs 200
+"""
+import os
+import sys
+import time
+
+import click
+import spotipy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_pool import get_session  # noqa: E402
+from loadtest import FakeSpotifyHandler, Upstream, build_catalog, generate_charts, serve  # noqa: E402
+from resolver import DEFAULT_SEARCH_BURST, DEFAULT_SEARCH_RATE, TrackResolver  # noqa: E402
+
+
+@click.command()
+@click.option('--workers', default='1,8,32', help='Comma-separated worker counts to compare (default: 1,8,32).')
+@click.option('--songs', default=200, type=int, help='Songs to resolve per run (default: 200).')
+@click.option('--latency', default=0.05, type=float, help='Fake Spotify latency per request in seconds (default: 0.05).')
+@click.option('--rate-429', default=0.0, type=float, help='Share of searches answered with 429 (default: 0).')
+@click.option('--retry-after', default=1, type=int, help='Retry-After seconds sent with injected 429s (default: 1).')
+@click.option('--rate', default=float(os.getenv('SPOTIFY_SEARCH_RATE', DEFAULT_SEARCH_RATE)), type=float,
+              help='Resolver searches per second (default: the app default).')
+@click.option('--burst', default=int(os.getenv('SPOTIFY_SEARCH_BURST', DEFAULT_SEARCH_BURST)), type=int,
+              help='Rate limiter burst (default: the app default).')
+def main(workers, songs, latency, rate_429, retry_after, rate, burst):
+    years = range(2000, 2000 + (songs + 99) // 100)
+    charts = generate_charts(years)
+    pending = [song for year in years for song in charts[str(year)]][:songs]
+
+    FakeSpotifyHandler.catalog = build_catalog(charts, miss_rate=0.05)
+    upstream = Upstream(latency=latency, rate_429=rate_429, retry_after=retry_after)
+    server, base_url = serve(FakeSpotifyHandler, upstream)
+
+    counts = [int(count) for count in workers.split(',')]
+    sp = spotipy.Spotify(auth='benchmark', requests_session=get_session('spotify', pool_size=max(counts)))
+    sp.prefix = f'{base_url}/v1/'
+
+    click.echo(f"{len(pending)} songs, {latency * 1000:.0f}ms per search, {rate_429:.0%} 429s, "
+               f"rate limit {rate:g}/s (burst {burst})")
+    click.echo(f"{'workers':>8} {'seconds':>9} {'songs/s':>9} {'searches':>9} {'found':>6} {'speedup':>8}")
+    baseline = None
+    for count in counts:
+        resolver = TrackResolver(max_workers=count, rate=rate, burst=burst)
+        before = upstream.snapshot()['search']
+        start = time.perf_counter()
+        results = resolver.resolve(sp, pending)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        searches = upstream.snapshot()['search'] - before
+        found = sum(1 for result in results if result['found'])
+        click.echo(f"{count:>8} {elapsed:>9.2f} {len(pending) / elapsed:>9.1f} {searches:>9} {found:>6} "
+                   f"{baseline / elapsed:>7.1f}x")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
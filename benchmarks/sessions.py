@@ -0,0 +1,119 @@
+"""
+Benchmark: session read and write cost with 10k active sessions per backend.
+
+Each backend is put behind a minimal Flask app that stores a token-sized
+session like the real one, filled up to --sessions sessions, and then hit
+through the test client: reads load a random session without changing it
+(the common case), writes change it. Reports per-request latency and the
+storage left behind.
+
+    python benchmarks/sessions.py --sessions 10000 --requests 5000
+    python benchmarks/sessions.py --backends sqlite,memory
+"""
+import os
+import random
+import secrets
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import click
+from flask import Flask, session
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import MemorySessionInterface, SQLiteSessionInterface  # noqa: E402
+
+BACKENDS = ('sqlite', 'memory', 'filesystem')
+
+
+def build_app(backend, workdir, max_sessions):
+    app = Flask(__name__)
+    app.secret_key = 'benchmark'
+    if backend == 'sqlite':
+        app.session_interface = SQLiteSessionInterface(os.path.join(workdir, 'sessions.db'), max_sessions=max_sessions)
+    elif backend == 'memory':
+        app.session_interface = MemorySessionInterface(max_sessions=max_sessions)
+    else:
+        from flask_session import Session  # The previous Flask-Session setup from app.py
+        app.config.update(SESSION_TYPE='filesystem', SESSION_PERMANENT=False, SESSION_USE_SIGNER=True,
+                          SESSION_FILE_DIR=os.path.join(workdir, 'flask_session'), SESSION_FILE_THRESHOLD=max_sessions * 2)
+        Session(app)
+
+    @app.route('/login')
+    def login():
+        session['token_info'] = {'access_token': secrets.token_urlsafe(150), 'refresh_token': secrets.token_urlsafe(100),
+                                 'expires_at': int(time.time()) + 3600, 'scope': 'playlist-modify-public'}
+        session['year'] = '1999'
+        return 'ok'
+
+    @app.route('/read')
+    def read():
+        return session.get('year', '')
+
+    @app.route('/write')
+    def write():
+        session['year'] = str(random.randint(1946, 2024))
+        return 'ok'
+
+    return app
+
+
+def storage_used(backend, workdir):
+    if backend == 'memory':
+        return '-'
+    total = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(workdir) for name in names)
+    files = sum(len(names) for _, _, names in os.walk(workdir))
+    return f'{total / 1e6:.1f}MB in {files} files'
+
+
+def timed(client, cookies, path, requests):
+    name = client.application.config['SESSION_COOKIE_NAME']
+    times = []
+    for _ in range(requests):
+        client.set_cookie(name, random.choice(cookies))
+        start = time.perf_counter()
+        response = client.get(path)
+        times.append(time.perf_counter() - start)
+        assert response.status_code == 200
+    return times
+
+
+def summary(times):
+    times = sorted(times)
+    p99 = times[int(len(times) * 0.99) - 1]
+    return f'{statistics.mean(times) * 1000:>8.3f} {times[len(times) // 2] * 1000:>8.3f} {p99 * 1000:>8.3f}'
+
+
+@click.command()
+@click.option('--sessions', default=10000, type=int, help='Active sessions to create first (default: 10000).')
+@click.option('--requests', 'requests_', default=5000, type=int, help='Timed read and write requests each (default: 5000).')
+@click.option('--backends', default=','.join(BACKENDS), help='Comma-separated backends to compare (default: all).')
+def main(sessions, requests_, backends):
+    click.echo(f"{sessions} active sessions, {requests_} timed requests each; times in ms (mean, p50, p99)")
+    click.echo(f"{'backend':<11} {'op':<6} {'mean':>8} {'p50':>8} {'p99':>8}  storage")
+    for backend in backends.split(','):
+        workdir = tempfile.mkdtemp(prefix=f'sessions-{backend}-')
+        try:
+            app = build_app(backend, workdir, max_sessions=sessions)
+            client = app.test_client()
+            name = app.config['SESSION_COOKIE_NAME']
+            cookies = []
+            for _ in range(sessions):
+                client.delete_cookie(name)
+                client.get('/login')
+                cookies.append(client.get_cookie(name).value)
+
+            reads = timed(client, cookies, '/read', requests_)
+            writes = timed(client, cookies, '/write', requests_)
+            used = storage_used(backend, workdir)
+            click.echo(f"{backend:<11} {'read':<6} {summary(reads)}  {used}")
+            click.echo(f"{backend:<11} {'write':<6} {summary(writes)}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
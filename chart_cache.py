@@ -0,0 +1,230 @@
+"""
+Two-tier cache for Billboard year-end charts.
+
+Tier 1 is a small in-process LRU, tier 2 is a SQLite table keyed by year
+that all workers share. Entries older than their TTL are still served
+(stale-while-revalidate) while a background thread fetches a fresh copy,
+unless another worker already refreshed the shared table. A failed load
+(e.g. the current year has no chart yet) is remembered for `failure_ttl`
+so that get() does not hit Billboard on every request.
+
+With a SingleFlight, concurrent loads of the same year (in this process or,
+through its leases, in other workers) share one Billboard request.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import metrics
+from storage import SQLiteStore
+
+# First year we try to pre-warm
+FIRST_CHART_YEAR = 1946
+
+CHART_LOOKUPS = metrics.counter('chart_cache_lookups', 'Chart cache lookups, by result (hit, stale, miss).')
+
+
+class ChartCache(SQLiteStore):
+    """
+    Caches the result of a chart loader (year -> [(title, artist), ...]).
+    Failed loads (None or empty lists) are never stored; get() skips reloading them for failure_ttl.
+    """
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS charts (
+            year TEXT PRIMARY KEY,
+            songs TEXT NOT NULL,
+            fetched_at REAL NOT NULL
+        );
+    '''
+
+    def __init__(self, loader, path, ttl=30 * 24 * 3600, recent_ttl=24 * 3600, max_entries=128, flights=None,
+                 failure_ttl=300):
+        super().__init__(path)
+        self.loader = loader
+        self.flights = flights
+        self.ttl = ttl                # Older, published charts
+        self.recent_ttl = recent_ttl  # Current and previous year may still change
+        self.max_entries = max_entries
+        self.failure_ttl = failure_ttl
+        self._memory = OrderedDict()  # year -> (songs, fetched_at)
+        self._failures = {}           # year -> time of the last failed load
+        self._lock = threading.Lock()
+        self._refreshing = set()
+
+    def get(self, year):
+        """Returns the cached chart for a year, loading it if it is not cached yet."""
+        songs = self.get_cached(year)
+        if songs is None and not self._failed_recently(str(year)):
+            return self.refresh(year)
+        return songs
+
+    async def get_async(self, year, fetch):
+        """Async counterpart of get(); `fetch` is a coroutine function taking the year."""
+        songs = await asyncio.to_thread(self.get_cached, year)
+        if songs is None and not self._failed_recently(str(year)):
+            return await self.refresh_async(year, fetch)
+        return songs
+
+    def get_cached(self, year):
+        """
+        Returns the cached chart for a year without loading it on a miss (None).
+        A stale chart is still returned while a fresh copy loads in the background.
+        """
+        key = str(year)
+        entry = self._get_entry(key)
+        if entry is None:
+            CHART_LOOKUPS.inc(result='miss')
+            return None
+
+        songs, fetched_at = entry
+        if self._is_stale(key, fetched_at):
+            # Only the memory copy may be stale: another worker may have refreshed the shared table
+            songs, fetched_at = self._read_entry(key) or entry
+        if self._is_stale(key, fetched_at):
+            CHART_LOOKUPS.inc(result='stale')
+            self._refresh_in_background(key)
+        else:
+            CHART_LOOKUPS.inc(result='hit')
+        return songs
+
+    def refresh(self, year):
+        """Calls the loader and stores the result. Returns the songs or None."""
+        key = str(year)
+
+        def load():
+            songs = self.loader(key)
+            self.put(key, songs)
+            return songs
+
+        if self.flights is None:
+            return load()
+        return self.flights.do(key, load, lookup=lambda: self._get_fresh(key))
+
+    async def refresh_async(self, year, fetch):
+        """Async counterpart of refresh(); `fetch` is a coroutine function taking the year."""
+        key = str(year)
+
+        async def load():
+            songs = await fetch(key)
+            self.put(key, songs)
+            return songs
+
+        if self.flights is None:
+            return await load()
+        return await self.flights.do_async(key, load, lookup=lambda: self._get_fresh(key))
+
+    def put(self, year, songs):
+        """Stores a chart loaded elsewhere (e.g. by the async fetcher); failed loads are only remembered."""
+        key = str(year)
+        with self._lock:
+            if songs:
+                self._failures.pop(key, None)
+            else:
+                self._failures[key] = time.time()
+        if songs:
+            self._store(key, songs, time.time())
+
+    def prefetch(self, years, max_workers=4):
+        """Loads every year that is missing or stale. Returns the number of years refreshed."""
+        todo = []
+        for year in years:
+            key = str(year)
+            if self._get_fresh(key) is None:
+                todo.append(key)
+
+        if not todo:
+            return 0
+
+        logging.info(f"Pre-warming chart cache for {len(todo)} years.")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(self.refresh, todo))
+        return sum(1 for songs in results if songs)
+
+    # --- Internal helpers ---
+
+    def _ttl_for(self, key):
+        try:
+            if int(key) >= date.today().year - 1:
+                return self.recent_ttl
+        except ValueError:
+            pass
+        return self.ttl
+
+    def _is_stale(self, key, fetched_at):
+        return time.time() - fetched_at > self._ttl_for(key)
+
+    def _failed_recently(self, key):
+        with self._lock:
+            failed_at = self._failures.get(key)
+        return failed_at is not None and time.time() - failed_at < self.failure_ttl
+
+    def _get_entry(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+
+        return self._read_entry(key)
+
+    def _read_entry(self, key):
+        row = self._conn().execute(
+            'SELECT songs, fetched_at FROM charts WHERE year = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        entry = ([tuple(song) for song in json.loads(row[0])], row[1])
+        self._remember(key, entry)
+        return entry
+
+    def _get_fresh(self, key):
+        """Returns the songs if a fresh copy is stored (by any worker), else None."""
+        entry = self._get_entry(key)
+        if entry is not None and self._is_stale(key, entry[1]):
+            entry = self._read_entry(key)  # The memory copy is stale; another worker may have refreshed the table
+        if entry is None or self._is_stale(key, entry[1]):
+            return None
+        return entry[0]
+
+    def _store(self, key, songs, fetched_at):
+        self._conn().execute(
+            'INSERT OR REPLACE INTO charts (year, songs, fetched_at) VALUES (?, ?, ?)',
+            (key, json.dumps(songs), fetched_at)
+        )
+        self._remember(key, (list(songs), fetched_at))
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _refresh_in_background(self, key):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                logging.info(f"Revalidating stale chart cache entry for {key}.")
+                self.refresh(key)
+            except Exception as e:
+                logging.warning(f"Background chart refresh failed for {key}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name=f'chart-refresh-{key}', daemon=True).start()
+
+
+def all_chart_years():
+    """Returns every year from FIRST_CHART_YEAR up to the current year."""
+    return range(FIRST_CHART_YEAR, date.today().year + 1)
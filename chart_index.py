@@ -0,0 +1,97 @@
+"""
+Offline, precomputed index of year -> chart entries -> Spotify track URI.
+
+Year-end charts are fixed once published, so `flask build-index` scrapes
+and resolves every year once and stores (year, rank, title, artist, uri).
+The routes read charts and URIs from here first; only years that are not
+indexed yet fall back to Billboard and the search API.
+"""
+import time
+from datetime import date
+
+from storage import SQLiteStore
+
+
+class ChartIndex(SQLiteStore):
+    """
+    SQLite index of chart entries. A year is listed in chart_years once all its
+    entries are stored; entries whose URI is NULL were not found (or failed)
+    and are retried by the next incremental build.
+    """
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS chart_years (
+            year INTEGER PRIMARY KEY,
+            built_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS chart_entries (
+            year INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            artist TEXT NOT NULL,
+            uri TEXT,
+            resolved_at REAL NOT NULL,
+            PRIMARY KEY (year, rank)
+        );
+    '''
+
+    def __init__(self, path, recent_ttl=24 * 3600):
+        super().__init__(path)
+        self.recent_ttl = recent_ttl  # Current and previous year charts may still change
+
+    def _is_fresh(self, year, built_at):
+        if int(year) >= date.today().year - 1:
+            return time.time() - built_at < self.recent_ttl
+        return True
+
+    def _built_at(self, conn, year):
+        row = conn.execute('SELECT built_at FROM chart_years WHERE year = ?', (int(year),)).fetchone()
+        return row[0] if row else None
+
+    def get_chart(self, year):
+        """Returns [(title, artist, uri), ...] in chart order for an indexed, fresh year, or None."""
+        conn = self._conn()
+        built_at = self._built_at(conn, year)
+        if built_at is None or not self._is_fresh(year, built_at):
+            return None
+        return conn.execute(
+            'SELECT title, artist, uri FROM chart_entries WHERE year = ? ORDER BY rank', (int(year),)
+        ).fetchall()
+
+    def is_fresh(self, year):
+        """True if the year is indexed and, for recent years, was built within recent_ttl."""
+        built_at = self._built_at(self._conn(), year)
+        return built_at is not None and self._is_fresh(year, built_at)
+
+    def unresolved_entries(self, year):
+        """Returns [(rank, title, artist), ...] for entries of a year that have no URI yet."""
+        return self._conn().execute(
+            'SELECT rank, title, artist FROM chart_entries WHERE year = ? AND uri IS NULL ORDER BY rank', (int(year),)
+        ).fetchall()
+
+    def store_year(self, year, songs, uris):
+        """Replaces a year's entries: songs is [(title, artist), ...], uris the matching URIs (or None)."""
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN')
+            conn.execute('DELETE FROM chart_entries WHERE year = ?', (int(year),))
+            conn.executemany(
+                'INSERT INTO chart_entries (year, rank, title, artist, uri, resolved_at) VALUES (?, ?, ?, ?, ?, ?)',
+                [(int(year), rank, title, artist, uri, now) for rank, ((title, artist), uri) in enumerate(zip(songs, uris))]
+            )
+            conn.execute('INSERT OR REPLACE INTO chart_years (year, built_at) VALUES (?, ?)', (int(year), now))
+
+    def set_uris(self, year, rank_uris):
+        """Updates the URI of individual entries: rank_uris is [(rank, uri), ...]."""
+        now = time.time()
+        self._conn().executemany(
+            'UPDATE chart_entries SET uri = ?, resolved_at = ? WHERE year = ? AND rank = ?',
+            [(uri, now, int(year), rank) for rank, uri in rank_uris]
+        )
+
+    def stats(self):
+        """Returns how many years and entries are indexed and how many entries have a URI."""
+        conn = self._conn()
+        years = conn.execute('SELECT COUNT(*) FROM chart_years').fetchone()[0]
+        entries, resolved = conn.execute('SELECT COUNT(*), COUNT(uri) FROM chart_entries').fetchone()
+        return {'years': years, 'entries': entries, 'resolved': resolved}
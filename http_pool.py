@@ -0,0 +1,91 @@
+"""
+Process-wide pooled HTTP sessions for the Billboard and Spotify clients.
+
+Reusing one keep-alive session per upstream saves a TCP and TLS handshake
+on nearly every request. Each session gets an HTTPAdapter whose pool is
+large enough for the resolver and job worker threads.
+
+- 'billboard' retries connection errors and 5xx/429 responses with backoff.
+- 'spotify' retries connection errors only; HTTP errors (including 429 with
+  its Retry-After header) are handed to spotipy so the resolver's rate
+  limiter can react to them.
+"""
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class PooledSession(requests.Session):
+    """
+    requests.Session that ignores close().
+    spotipy closes the session it was given when a client object is garbage
+    collected, which would drop the shared pool after every request.
+    """
+
+    def close(self):
+        pass
+
+    def shutdown(self):
+        """Really closes every pooled connection."""
+        super().close()
+
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def _build_session(name, pool_size, retries, backoff):
+    if name == 'spotify':
+        retry = Retry(total=retries, connect=retries, read=False, status=0, backoff_factor=backoff)
+    else:
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            respect_retry_after_header=True,
+        )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session = PooledSession()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session(name, pool_size=32, retries=3, backoff=0.5):
+    """Returns the shared session for an upstream ('billboard' or 'spotify'), creating it on first use."""
+    session = _sessions.get(name)
+    if session is None:
+        with _lock:
+            session = _sessions.get(name)
+            if session is None:
+                session = _build_session(name, pool_size, retries, backoff)
+                _sessions[name] = session
+    return session
+
+
+def pool_stats():
+    """
+    Returns per-host connection pool stats for every shared session:
+    connections opened, requests sent, idle connections and the pool size.
+    """
+    stats = {}
+    for name, session in list(_sessions.items()):
+        hosts = {}
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                hosts[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                    'connections_opened': pool.num_connections,
+                    'requests': pool.num_requests,
+                    # The queue is pre-filled with None placeholders; only real entries are idle connections
+                    'idle': sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0,
+                    'maxsize': adapter._pool_maxsize,
+                }
+        stats[name] = hosts
+    return stats
@@ -0,0 +1,303 @@
+"""
+Jobs for playlist generation and the in-process queue that runs them.
+
+A job scrapes and resolves a chart once and keeps the resolved track list,
+so later steps (like creating the playlist) reuse it instead of repeating
+the Billboard scrape and the Spotify searches.
+
+Job records go through a pluggable backend: JobStore keeps them in SQLite so
+any gunicorn worker can report status or cancel a job started by another
+one; MemoryJobStore keeps them in a dict for single-process setups.
+JobQueue runs jobs on a pool of worker threads, off the request thread, or
+as tasks on the event loop in the async serving mode.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import SQLiteStore
+
+# Job statuses
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+# Jobs not updated for this long no longer count as active (e.g. their worker process died)
+ACTIVE_JOB_TIMEOUT = 3600
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job when its cancellation was requested."""
+
+
+class JobLimitExceeded(Exception):
+    """Raised by JobQueue.enqueue() when the owner already has too many active jobs."""
+
+
+class JobStore(SQLiteStore):
+    """
+    SQLite job backend. Stores jobs as rows: id, owner, kind, status, params, result, error.
+    params and result are JSON. Jobs older than `ttl` are purged.
+    """
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL,
+            params TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at);
+        CREATE INDEX IF NOT EXISTS jobs_owner_status ON jobs (owner, status);
+    '''
+
+    def __init__(self, path, ttl=24 * 3600):
+        super().__init__(path)
+        self.ttl = ttl
+
+    def create(self, kind, owner, params, status=QUEUED):
+        """Creates a job and returns its ID."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._conn()
+        conn.execute('DELETE FROM jobs WHERE created_at < ?', (now - self.ttl,))
+        conn.execute(
+            'INSERT INTO jobs (id, owner, kind, status, params, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (job_id, owner, kind, status, json.dumps(params), now, now)
+        )
+        return job_id
+
+    def get(self, job_id, owner=None):
+        """Returns a job as a dict, or None if it does not exist (or belongs to someone else)."""
+        row = self._conn().execute(
+            'SELECT id, owner, kind, status, params, result, error, cancel_requested, created_at, updated_at '
+            'FROM jobs WHERE id = ?',
+            (job_id,)
+        ).fetchone()
+        if row is None or (owner is not None and row[1] != owner):
+            return None
+        return {
+            'id': row[0],
+            'owner': row[1],
+            'kind': row[2],
+            'status': row[3],
+            'params': json.loads(row[4]),
+            'result': json.loads(row[5]) if row[5] is not None else None,
+            'error': row[6],
+            'cancel_requested': bool(row[7]),
+            'created_at': row[8],
+            'updated_at': row[9],
+        }
+
+    def update(self, job_id, status, result=None, error=None):
+        """Sets a job's status, and its result or error when given."""
+        self._conn().execute(
+            'UPDATE jobs SET status = ?, result = COALESCE(?, result), error = COALESCE(?, error), updated_at = ? WHERE id = ?',
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+        )
+
+    def request_cancel(self, job_id):
+        """Flags a job for cancellation. Queued jobs are cancelled right away. Returns the new status."""
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            'UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?',
+            (CANCELLED, now, job_id, QUEUED)
+        )
+        conn.execute('UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ?', (now, job_id))
+        row = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def is_cancel_requested(self, job_id):
+        row = self._conn().execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def count_active(self, owner, kind=None):
+        """Returns how many queued or running jobs an owner has."""
+        query = 'SELECT COUNT(*) FROM jobs WHERE owner = ? AND status IN (?, ?) AND updated_at > ?'
+        args = [owner, *ACTIVE_STATUSES, time.time() - ACTIVE_JOB_TIMEOUT]
+        if kind is not None:
+            query += ' AND kind = ?'
+            args.append(kind)
+        return self._conn().execute(query, args).fetchone()[0]
+
+
+class MemoryJobStore:
+    """In-memory job backend with the same interface as JobStore. Only for single-process use."""
+
+    def __init__(self, ttl=24 * 3600):
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, kind, owner, params, status=QUEUED):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            for old_id in [i for i, job in self._jobs.items() if job['created_at'] < now - self.ttl]:
+                del self._jobs[old_id]
+            self._jobs[job_id] = {
+                'id': job_id, 'owner': owner, 'kind': kind, 'status': status,
+                'params': json.loads(json.dumps(params)), 'result': None, 'error': None,
+                'cancel_requested': False, 'created_at': now, 'updated_at': now,
+            }
+        return job_id
+
+    def get(self, job_id, owner=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or (owner is not None and job['owner'] != owner):
+                return None
+            return dict(job)
+
+    def update(self, job_id, status, result=None, error=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['status'] = status
+            if result is not None:
+                job['result'] = json.loads(json.dumps(result))
+            if error is not None:
+                job['error'] = error
+            job['updated_at'] = time.time()
+
+    def request_cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job['cancel_requested'] = True
+            if job['status'] == QUEUED:
+                job['status'] = CANCELLED
+            job['updated_at'] = time.time()
+            return job['status']
+
+    def is_cancel_requested(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return bool(job and job['cancel_requested'])
+
+    def count_active(self, owner, kind=None):
+        cutoff = time.time() - ACTIVE_JOB_TIMEOUT
+        with self._lock:
+            return sum(
+                1 for job in self._jobs.values()
+                if job['owner'] == owner and job['status'] in ACTIVE_STATUSES
+                and job['updated_at'] > cutoff and (kind is None or job['kind'] == kind)
+            )
+
+
+def create_job_store(backend, path, ttl=24 * 3600):
+    """Returns the job backend named by `backend` ('sqlite' or 'memory')."""
+    if backend == 'memory':
+        return MemoryJobStore(ttl=ttl)
+    if backend == 'sqlite':
+        return JobStore(path, ttl=ttl)
+    raise ValueError(f"Unknown job backend: {backend}")
+
+
+class JobContext:
+    """Handed to a running job so it can check for cancellation between steps."""
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+
+    def check_cancelled(self):
+        """Raises JobCancelled if someone asked to cancel this job."""
+        if self.store.is_cancel_requested(self.job_id):
+            raise JobCancelled()
+
+    async def check_cancelled_async(self):
+        """check_cancelled() for coroutines, with the store read on a thread."""
+        await asyncio.to_thread(self.check_cancelled)
+
+
+class JobQueue:
+    """
+    Runs jobs on a pool of worker threads in this process.
+    Each owner may have at most `max_per_owner` queued or running jobs.
+    """
+
+    def __init__(self, store, max_workers=4, max_per_owner=2):
+        self.store = store
+        self.max_per_owner = max_per_owner
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-worker')
+        self._enqueue_lock = threading.Lock()
+        self._tasks = set()
+
+    def enqueue(self, kind, owner, params, func):
+        """
+        Queues `func(params, context)`; its return value becomes the job result.
+        Returns the job ID. Raises JobLimitExceeded when the owner is at the limit.
+        """
+        job_id = self._reserve(kind, owner, params)
+        self._executor.submit(self._run, job_id, params, func)
+        return job_id
+
+    async def enqueue_async(self, kind, owner, params, func):
+        """
+        Like enqueue(), but `func(params, context)` is a coroutine function that runs as a task
+        on the current event loop (ASGI mode) instead of on a worker thread. Store calls run on threads.
+        """
+        job_id = await asyncio.to_thread(self._reserve, kind, owner, params)
+        task = asyncio.get_running_loop().create_task(self._run_async(job_id, params, func))
+        self._tasks.add(task)  # The loop only keeps weak references to tasks
+        task.add_done_callback(self._tasks.discard)
+        return job_id
+
+    def _reserve(self, kind, owner, params):
+        with self._enqueue_lock:
+            if self.store.count_active(owner, kind) >= self.max_per_owner:
+                raise JobLimitExceeded(f"At most {self.max_per_owner} {kind} jobs can run at once.")
+            return self.store.create(kind, owner, params, status=QUEUED)
+
+    def cancel(self, job_id):
+        """Requests cancellation. Returns the job's status afterwards, or None if it does not exist."""
+        return self.store.request_cancel(job_id)
+
+    def _run(self, job_id, params, func):
+        context = JobContext(self.store, job_id)
+        try:
+            context.check_cancelled()
+            self.store.update(job_id, RUNNING)
+            result = func(params, context)
+            self.store.update(job_id, DONE, result=result)
+        except JobCancelled:
+            logging.info(f"Job {job_id} cancelled.")
+            self.store.update(job_id, CANCELLED)
+        except Exception as e:
+            logging.exception(f"Job {job_id} failed: {e}")
+            self.store.update(job_id, FAILED, error=str(e))
+
+    async def _run_async(self, job_id, params, func):
+        context = JobContext(self.store, job_id)
+
+        async def update(status, **fields):
+            await asyncio.to_thread(self.store.update, job_id, status, **fields)
+
+        try:
+            await context.check_cancelled_async()
+            await update(RUNNING)
+            result = await func(params, context)
+            await update(DONE, result=result)
+        except JobCancelled:
+            logging.info(f"Job {job_id} cancelled.")
+            await update(CANCELLED)
+        except Exception as e:
+            logging.exception(f"Job {job_id} failed: {e}")
+            await update(FAILED, error=str(e))
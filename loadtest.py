@@ -0,0 +1,473 @@
+"""
+End-to-end load test: runs the app under gunicorn against local stand-ins
+for billboard.com and the Spotify Web API, and drives concurrent users
+through / -> /callback -> /search_songs -> /create_playlist.
+
+    python loadtest.py --users 20 --concurrency 10 --years 1990-1999
+    python loadtest.py --workers 4 --threads 8 --spotify-latency 0.08 --spotify-429-rate 0.02 --rounds 2
+
+Pass --server uvicorn to measure the async serving mode (asgi.py) instead.
+
+Reports p50/p95/p99 latency per step, playlists per second and how many
+calls each playlist cost against each upstream. Each round reuses the same
+app (and its caches), so --rounds 2 shows the cold and the warm path.
+
+The stand-ins serve generated charts unless --fixtures points at a JSON file
+of {"year": [["title", "artist"], ...]}; --miss-rate songs are missing from
+the fake catalog so the not-found path is exercised too.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import click
+import requests
+
+from matching import search_terms
+
+WORDS = ('love', 'night', 'fire', 'heart', 'dance', 'baby', 'dream', 'rain', 'gold', 'summer',
+         'girl', 'city', 'wild', 'blue', 'forever', 'tonight', 'hold', 'run', 'shake', 'light')
+
+
+# --- Fixtures ---
+
+def generate_charts(years, size=100):
+    """Deterministic fake charts; about a fifth of the songs also chart the following year."""
+    charts = {}
+    rng = random.Random(42)
+    carried = []
+    for year in years:
+        songs = list(carried)
+        while len(songs) < size:
+            title = ' '.join(rng.choice(WORDS).title() for _ in range(rng.randint(1, 3)))
+            artist = f"Artist {rng.randint(1, 400)}"
+            if rng.random() < 0.15:
+                artist += f" Featuring Artist {rng.randint(1, 400)}"
+            songs.append((f"{title} {len(songs)}", artist))
+        charts[str(year)] = songs
+        carried = songs[size - size // 5:]
+    return charts
+
+
+def load_fixtures(path):
+    with open(path) as f:
+        return {str(year): [tuple(song) for song in songs] for year, songs in json.load(f).items()}
+
+
+def fake_id(*parts):
+    # Spotify IDs are base62; a hex digest is a valid subset
+    return hashlib.md5('\x1f'.join(parts).encode()).hexdigest()[:22]
+
+
+# --- Upstream stand-ins ---
+
+class Upstream:
+    """Shared state of a fake server: latency, injected 429s and call counters."""
+
+    def __init__(self, latency=0.0, rate_429=0.0, retry_after=1):
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return Counter(self.calls)
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    upstream = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status=200, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def throttled(self, name):
+        """Applies latency and maybe answers 429. Returns True if the request was rejected."""
+        self.upstream.count(name)
+        if self.upstream.latency:
+            time.sleep(self.upstream.latency)
+        if self.upstream.rate_429 and random.random() < self.upstream.rate_429:
+            self.upstream.count('429')
+            self.send_json({'error': {'status': 429, 'message': 'API rate limit exceeded'}}, 429,
+                           {'Retry-After': str(self.upstream.retry_after)})
+            return True
+        return False
+
+
+class FakeBillboardHandler(FakeHandler):
+    charts = {}
+
+    def do_GET(self):
+        match = re.fullmatch(r'/charts/year-end/(\d{4})/hot-100-songs', urlparse(self.path).path)
+        if self.throttled('chart_page'):
+            return
+        songs = self.charts.get(match.group(1)) if match else None
+        if not songs:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        rows = ''.join(
+            '<div class="o-chart-results-list-row-container"><ul class="o-chart-results-list-row">'
+            f'<li class="o-chart-results-list__item"><h3 id="title-of-a-story" class="c-title">{escape(title)}</h3>'
+            f'<span class="c-label a-no-trucate">{escape(artist)}</span></li></ul></div>'
+            for title, artist in songs
+        )
+        # Pad with script-heavy markup like the real page so parsing costs something
+        body = f"<html><head>{'<script>var x = 1;</script>' * 200}</head><body>{rows}</body></html>".encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeSpotifyHandler(FakeHandler):
+    """Accounts service and the Web API endpoints the app uses, on one server."""
+    catalog = {}  # (clean title, main artist) -> track item
+    playlists = {}  # playlist ID -> {'owner', 'name', 'uris'}
+    tokens = {}  # access token -> user ID
+    lock = threading.Lock()
+
+    def user(self):
+        token = (self.headers.get('Authorization') or '').replace('Bearer ', '')
+        return self.tokens.get(token)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        path = url.path.rstrip('/')
+
+        if path == '/authorize':
+            self.upstream.count('authorize')
+            target = f"{query['redirect_uri']}?{urlencode({'code': uuid.uuid4().hex, 'state': query.get('state', '')})}"
+            self.send_response(302)
+            self.send_header('Location', target)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if path == '/v1/search':
+            if self.throttled('search'):
+                return
+            match = re.fullmatch(r'track:(.*) artist:(.*)', query.get('q', ''))
+            item = self.catalog.get((match.group(1), match.group(2))) if match else None
+            decoy = {'uri': f"spotify:track:{fake_id('decoy', query.get('q', ''))}", 'name': 'Something Else',
+                     'artists': [{'name': 'Someone Else'}]}
+            items = ([item] if item else []) + [decoy]
+            self.send_json({'tracks': {'items': items[:int(query.get('limit', 1))], 'next': None}})
+            return
+
+        if self.throttled('api_read'):
+            return
+        user = self.user()
+        if path == '/v1/me':
+            self.send_json({'id': user, 'display_name': user})
+        elif path == '/v1/me/playlists':
+            with self.lock:
+                items = [{'id': pid, 'name': p['name'], 'owner': {'id': p['owner']},
+                          'external_urls': {'spotify': f'https://open.spotify.com/playlist/{pid}'}}
+                         for pid, p in self.playlists.items() if p['owner'] == user]
+            self.send_json({'items': items, 'next': None})
+        elif re.fullmatch(r'/v1/playlists/\w+/items', path):
+            with self.lock:
+                playlist = self.playlists.get(path.split('/')[3])
+                uris = list(playlist['uris']) if playlist else []
+            self.send_json({'items': [{'track': {'uri': uri}} for uri in uris], 'next': None})
+        elif re.fullmatch(r'/v1/playlists/\w+', path):
+            if path.split('/')[3] not in self.playlists:
+                self.send_json({'error': {'status': 404, 'message': 'Not found.'}}, 404)
+            else:
+                self.send_json({'id': path.split('/')[3]})
+        else:
+            self.send_json({'error': {'status': 404, 'message': 'Not found.'}}, 404)
+
+    def do_POST(self):
+        path = urlparse(self.path).path.rstrip('/')
+        body = self.read_body()
+
+        if path == '/api/token':
+            self.upstream.count('token')
+            form = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+            code = form.get('code') or form.get('refresh_token') or 'app'
+            token = f'token-{code}'
+            with self.lock:
+                self.tokens[token] = f'user-{code[:12]}'
+            self.send_json({'access_token': token, 'token_type': 'Bearer', 'expires_in': 3600,
+                            'refresh_token': code, 'scope': form.get('scope', '')})
+            return
+
+        if self.throttled('playlist_write'):
+            return
+        payload = json.loads(body or b'null')
+        match = re.fullmatch(r'/v1/users/([^/]+)/playlists', path)
+        if match:
+            pid = fake_id('playlist', uuid.uuid4().hex)
+            with self.lock:
+                self.playlists[pid] = {'owner': match.group(1), 'name': payload['name'], 'uris': []}
+            self.send_json({'id': pid, 'external_urls': {'spotify': f'https://open.spotify.com/playlist/{pid}'}}, 201)
+        elif re.fullmatch(r'/v1/playlists/\w+/items', path):
+            with self.lock:
+                playlist = self.playlists.get(path.split('/')[3])
+                if playlist is not None:
+                    playlist['uris'].extend(payload)
+            if playlist is None:
+                self.send_json({'error': {'status': 404, 'message': 'Not found.'}}, 404)
+            else:
+                self.send_json({'snapshot_id': uuid.uuid4().hex}, 201)
+        else:
+            self.send_json({'error': {'status': 404, 'message': 'Not found.'}}, 404)
+
+
+def build_catalog(charts, miss_rate):
+    """Every chart song except about miss_rate of them, keyed the way the app's fielded search asks."""
+    catalog = {}
+    rng = random.Random(7)
+    for songs in charts.values():
+        for title, artist in songs:
+            key = search_terms(title, artist)
+            if key in catalog or rng.random() < miss_rate:
+                continue
+            catalog[key] = {'uri': f"spotify:track:{fake_id(title, artist)}", 'name': title,
+                            'artists': [{'name': name} for name in re.split(r' Featuring ', artist)]}
+    return catalog
+
+
+def serve(handler, upstream):
+    handler.upstream = upstream
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+# --- App under test ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_app(port, workers, threads, env, log_path, server='gunicorn'):
+    """Starts the app (sync under gunicorn, or the async mode under uvicorn) logging to log_path, and waits until it answers."""
+    if server == 'uvicorn':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--workers', str(workers),
+                   '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning']
+    else:
+        command = [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--threads', str(threads),
+                   '--bind', f'127.0.0.1:{port}', '--timeout', '300', '--log-level', 'warning', 'app:app']
+    log = open(log_path, 'w')
+    process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise click.ClickException(f'{server} exited during startup, see {log_path}')
+        try:
+            requests.get(f'http://127.0.0.1:{port}/', timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise click.ClickException(f'{server} did not start within 30s')
+
+
+# --- Virtual users ---
+
+def run_user(base_url, year):
+    """One user's full flow. Returns {step: seconds} and the error, if any."""
+    http = requests.Session()
+    timings = {}
+    started = time.perf_counter()
+    try:
+        step = time.perf_counter()
+        http.get(f'{base_url}/', timeout=30).raise_for_status()
+        # Follows the redirects to the fake authorize page, back to /callback and on to /generating
+        response = http.post(f'{base_url}/', data={'year': year, 'name': 'Load Test', 'age': '30',
+                                                    'client_id': 'loadtest', 'client_secret': 'loadtest'}, timeout=60)
+        response.raise_for_status()
+        if '/generating/' not in response.url:
+            raise RuntimeError(f'login ended at {response.url}')
+        timings['login'] = time.perf_counter() - step
+
+        step = time.perf_counter()
+        response = http.get(f'{base_url}/search_songs', timeout=300)
+        response.raise_for_status()
+        job_id = response.json()['job_id']
+        timings['search_songs'] = time.perf_counter() - step
+
+        step = time.perf_counter()
+        response = http.get(f'{base_url}/create_playlist', params={'job_id': job_id}, timeout=300)
+        response.raise_for_status()
+        if not response.json().get('success'):
+            raise RuntimeError(response.json().get('message'))
+        timings['create_playlist'] = time.perf_counter() - step
+    except Exception as e:
+        return timings, str(e)
+    timings['total'] = time.perf_counter() - started
+    return timings, None
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))]
+
+
+def run_round(base_url, years, users, concurrency, upstreams):
+    before = {name: upstream.snapshot() for name, upstream in upstreams.items()}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(lambda i: run_user(base_url, years[i % len(years)]), range(users)))
+    elapsed = time.perf_counter() - started
+
+    steps = {}
+    errors = []
+    for timings, error in outcomes:
+        if error:
+            errors.append(error)
+        for step, seconds in timings.items():
+            steps.setdefault(step, []).append(seconds)
+    calls = {name: upstream.snapshot() - before[name] for name, upstream in upstreams.items()}
+    return {
+        'users': users,
+        'completed': users - len(errors),
+        'errors': errors,
+        'elapsed': elapsed,
+        'throughput': (users - len(errors)) / elapsed if elapsed else 0.0,
+        'latency': {step: {'p50': percentile(v, 50), 'p95': percentile(v, 95), 'p99': percentile(v, 99),
+                           'max': max(v)} for step, v in steps.items()},
+        'calls': {name: dict(counter) for name, counter in calls.items()},
+    }
+
+
+def print_report(number, report):
+    click.echo(f"\nRound {number}: {report['completed']}/{report['users']} playlists in {report['elapsed']:.1f}s "
+               f"({report['throughput']:.2f} playlists/s)")
+    click.echo(f"  {'step':<16}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for step in ('login', 'search_songs', 'create_playlist', 'total'):
+        if step in report['latency']:
+            stats = report['latency'][step]
+            click.echo(f"  {step:<16}" + ''.join(f"{stats[key]:>8.2f}s" for key in ('p50', 'p95', 'p99', 'max')))
+    playlists = max(report['completed'], 1)
+    for name, calls in report['calls'].items():
+        total = sum(count for key, count in calls.items() if key != '429')
+        detail = ', '.join(f"{key} {count / playlists:.1f}" for key, count in sorted(calls.items()))
+        click.echo(f"  {name} calls per playlist: {total / playlists:.1f} ({detail or 'none'})")
+    if report['errors']:
+        click.echo(f"  {len(report['errors'])} errors, first: {report['errors'][0]}")
+
+
+@click.command()
+@click.option('--users', default=10, help='Virtual users per round.')
+@click.option('--concurrency', default=5, help='Users running at the same time.')
+@click.option('--rounds', default=1, help='Rounds against the same app; later rounds hit warm caches.')
+@click.option('--years', default='2000-2009', help='Chart years the users pick from (YYYY or YYYY-YYYY).')
+@click.option('--server', type=click.Choice(['gunicorn', 'uvicorn']), default='gunicorn',
+              help='gunicorn runs the sync app (app:app), uvicorn the async mode (asgi:app).')
+@click.option('--workers', default=2, help='Worker processes.')
+@click.option('--threads', default=8, help='Threads per gunicorn worker (sync mode only).')
+@click.option('--billboard-latency', default=0.3, help='Seconds per Billboard page.')
+@click.option('--spotify-latency', default=0.05, help='Seconds per Spotify API call.')
+@click.option('--billboard-429-rate', default=0.0, help='Share of Billboard requests answered with 429.')
+@click.option('--spotify-429-rate', default=0.0, help='Share of Spotify API requests answered with 429.')
+@click.option('--retry-after', default=1, help='Retry-After seconds sent with injected 429s.')
+@click.option('--miss-rate', default=0.05, help='Share of chart songs missing from the fake catalog.')
+@click.option('--fixtures', type=click.Path(exists=True), help='JSON file of {"year": [["title", "artist"], ...]}.')
+@click.option('--app-env', multiple=True, help='Extra KEY=VALUE settings for the app (repeatable).')
+@click.option('--json-output', type=click.Path(), help='Also write the reports to this JSON file.')
+def main(users, concurrency, rounds, years, server, workers, threads, billboard_latency, spotify_latency,
+         billboard_429_rate, spotify_429_rate, retry_after, miss_rate, fixtures, app_env, json_output):
+    """Load-tests the app end to end against local Billboard and Spotify stand-ins."""
+    start, _, end = years.partition('-')
+    year_list = [str(year) for year in range(int(start), int(end or start) + 1)]
+    charts = load_fixtures(fixtures) if fixtures else generate_charts(year_list)
+    year_list = [year for year in year_list if year in charts]
+    if not year_list:
+        raise click.ClickException('No fixture data for the requested years')
+
+    upstreams = {
+        'billboard': Upstream(billboard_latency, billboard_429_rate, retry_after),
+        'spotify': Upstream(spotify_latency, spotify_429_rate, retry_after),
+    }
+    FakeBillboardHandler.charts = charts
+    FakeSpotifyHandler.catalog = build_catalog(charts, miss_rate)
+    billboard_server, billboard_url = serve(FakeBillboardHandler, upstreams['billboard'])
+    spotify_server, spotify_url = serve(FakeSpotifyHandler, upstreams['spotify'])
+
+    port = free_port()
+    data_dir = tempfile.mkdtemp(prefix='loadtest-')
+    env = dict(os.environ,
+               DATA_DIR=data_dir,
+               FLASK_SECRET_KEY=uuid.uuid4().hex,
+               BILLBOARD_BASE_URL=billboard_url,
+               SPOTIFY_API_URL=f'{spotify_url}/v1',
+               SPOTIFY_ACCOUNTS_URL=spotify_url,
+               SPOTIPY_REDIRECT_URI=f'http://127.0.0.1:{port}/callback')
+    for setting in app_env:
+        key, _, value = setting.partition('=')
+        env[key] = value
+
+    log_path = os.path.join(data_dir, 'app.log')
+    shape = f"{workers} workers" if server == 'uvicorn' else f"{workers}x{threads}"
+    click.echo(f"App: {server} {shape} on port {port}, log in {log_path}")
+    click.echo(f"Users: {users} per round, {concurrency} at a time, years {year_list[0]}-{year_list[-1]}")
+    process = start_app(port, workers, threads, env, log_path, server)
+    reports = []
+    try:
+        for number in range(1, rounds + 1):
+            report = run_round(f'http://127.0.0.1:{port}', year_list, users, concurrency, upstreams)
+            print_report(number, report)
+            reports.append(report)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        billboard_server.shutdown()
+        spotify_server.shutdown()
+
+    if json_output:
+        with open(json_output, 'w') as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
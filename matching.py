@@ -0,0 +1,150 @@
+"""
+Fuzzy matching of Billboard (title, artist) pairs against Spotify search results.
+
+Billboard credits look like "Drake Featuring Rihanna", "Calvin Harris & Disciples"
+or "Marshmello x Bastille", which an exact `artist:` filter often misses.
+The resolver asks for several candidates per search and scores them here:
+
+- titles lose bracketed and "feat." parts, artists are split into the
+  individual credited names
+- each candidate is scored 0..1 on title and artist similarity (rapidfuzz
+  when installed, difflib otherwise); a candidate whose artist does not
+  match (a same-title song by someone else) or that is a karaoke or tribute
+  recording of the song scores 0, however well its title matches
+- only when the best score is below MATCH_THRESHOLD does the resolver send
+  the relaxed query, and candidates below MIN_CONFIDENCE are rejected
+"""
+import re
+from difflib import SequenceMatcher
+
+try:
+    from rapidfuzz import fuzz
+except ImportError:  # rapidfuzz is optional; difflib gives the same scores, just slower
+    fuzz = None
+
+from resolution_cache import normalize
+
+# Candidates requested per search
+SEARCH_LIMIT = 5
+# Scores at or above this are accepted without trying the relaxed query
+MATCH_THRESHOLD = 0.8
+# Best candidates scoring below this count as not found
+MIN_CONFIDENCE = 0.55
+# Candidates whose artist scores below this are rejected: the title weight alone is above MIN_CONFIDENCE
+MIN_ARTIST_SCORE = 0.5
+
+TITLE_WEIGHT = 0.6
+ARTIST_WEIGHT = 0.4
+
+_FEATURE_RE = re.compile(r'\s*[(\[]?\s*\b(?:feat\.?|featuring|ft\.)\s.*$', re.IGNORECASE)
+_BRACKETS_RE = re.compile(r'\s*[(\[][^)\]]*[)\]]')
+_VERSION_RE = re.compile(r'\s+-\s+.*\b(?:remaster(?:ed)?|version|edit|mix|live|mono|stereo)\b.*$', re.IGNORECASE)
+# "x" only as a lowercase credit of its own ("Marshmello x Bastille"), not the X in "Lil Nas X"
+_FEATURED_SPLIT_RE = re.compile(r'\s+(?:(?i:featuring|feat\.?|ft\.?|with|vs\.?)|x)\s+')
+# Characters that change the meaning of a Spotify search query
+_QUERY_SYNTAX_RE = re.compile(r'[":]')
+_CREDIT_SPLIT_RE = re.compile(r'\s+(?:&|and)\s+|\s*[,/+]\s*', re.IGNORECASE)
+# Marks a karaoke, tribute or backing-track recording of the song rather than the song itself
+_COVER_RE = re.compile(r'\b(?:karaoke|originally performed|made famous|in the style of|tribute|backing track)\b',
+                       re.IGNORECASE)
+
+
+def _strip_title(title):
+    """Drops featured-artist credits, bracketed parts and version suffixes, keeping the original text."""
+    stripped = _FEATURE_RE.sub('', title or '')
+    stripped = _BRACKETS_RE.sub('', stripped)
+    return _VERSION_RE.sub('', stripped).strip()
+
+
+def clean_title(title):
+    """Strips the title (see _strip_title), then normalizes it for scoring."""
+    return normalize(_strip_title(title)) or normalize(title)  # e.g. a title that is all brackets
+
+
+def split_artists(artist):
+    """
+    Splits a Billboard credit into normalized names: the main credit first (kept whole, so
+    "Simon & Garfunkel" stays one name), then every individual artist in the credit.
+    """
+    main, *featured = _FEATURED_SPLIT_RE.split(artist or '')
+    names = [normalize(main)]
+    for part in [main] + featured:
+        names.extend(normalize(name) for name in _CREDIT_SPLIT_RE.split(part))
+    names = [name for name in names if name]
+    return list(dict.fromkeys(names)) or [normalize(artist)]
+
+
+def similarity(a, b):
+    """Returns how similar two normalized strings are, from 0 to 1 (word order does not matter)."""
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    if fuzz is not None:
+        return fuzz.token_sort_ratio(a, b) / 100.0
+    return SequenceMatcher(None, ' '.join(sorted(a.split())), ' '.join(sorted(b.split()))).ratio()
+
+
+def artist_similarity(a, b):
+    """similarity() that also compares the names without spaces, where punctuation was ("ke ha" vs "kesha")."""
+    return max(similarity(a, b), similarity(a.replace(' ', ''), b.replace(' ', '')))
+
+
+def score_candidate(title, artists, item):
+    """
+    Scores one Spotify track item against a cleaned title and the split artist list.
+    Returns 0 for a different artist's song or a karaoke/tribute version, however close the title is.
+    """
+    name = item.get('name') or ''
+    if _COVER_RE.search(name) and not _COVER_RE.search(title):
+        return 0.0
+    title_score = similarity(title, clean_title(name))
+    candidate_artists = [normalize(a.get('name')) for a in item.get('artists') or []]
+    # The main credit has to match one of the track's artists (or all of them together,
+    # for duos Spotify lists separately); extra credits only nudge the score
+    combined = ' '.join(candidate_artists)
+    artist_score = max([artist_similarity(artists[0], name) for name in candidate_artists + [combined]])
+    if len(artists) > 1 and candidate_artists:
+        others = [max(artist_similarity(a, name) for name in candidate_artists) for a in artists[1:]]
+        artist_score = 0.8 * artist_score + 0.2 * (sum(others) / len(others))
+    if artist_score < MIN_ARTIST_SCORE:
+        return 0.0
+    return TITLE_WEIGHT * title_score + ARTIST_WEIGHT * artist_score
+
+
+def best_match(title, artist, items):
+    """Returns (item, score) for the best-scoring candidate, or (None, 0.0) when there are none."""
+    cleaned = clean_title(title)
+    artists = split_artists(artist)
+    best, best_score = None, 0.0
+    for item in items:
+        if not item:
+            continue
+        score = score_candidate(cleaned, artists, item)
+        if score > best_score:
+            best, best_score = item, score
+    return best, best_score
+
+
+def search_terms(title, artist):
+    """
+    Returns the (title, main artist) text to search for. Spotify matches punctuation itself
+    ("P!nk", "Ke$ha", "Don't"), so these are only lightly cleaned, not normalized.
+    """
+    def clean(text):
+        return ' '.join(_QUERY_SYNTAX_RE.sub(' ', text).split())
+
+    main_artist = _FEATURED_SPLIT_RE.split((artist or '').strip())[0]
+    return clean(_strip_title(title)) or clean(title or ''), clean(main_artist) or clean(artist or '')
+
+
+def search_queries(title, artist):
+    """
+    Returns the search queries to try in order: the fielded query on the stripped title and
+    main artist, then a relaxed free-text query used only when the first one scores too low.
+    """
+    title, main_artist = search_terms(title, artist)
+    return [
+        f"track:{title} artist:{main_artist}",
+        f"{title} {main_artist}",
+    ]
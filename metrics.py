@@ -0,0 +1,139 @@
+"""
+In-process metrics registry rendered in the Prometheus text format at /metrics.
+
+Modules declare their metrics at import time and update them on the hot
+path; every update is a dict lookup and an add under one lock:
+
+    SEARCH_SECONDS = histogram('spotify_search_seconds', 'Time per Spotify search call.')
+    with SEARCH_SECONDS.time():
+        ...
+
+Values are per process: with several gunicorn workers each one reports its
+own counters, which Prometheus sums across scrape targets.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) for latency histograms, roughly 5ms to 30s
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = {}
+_lock = threading.Lock()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count, optionally split by labels: inc(result='hit')."""
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        with _lock:
+            values = dict(self._values)
+        return [(f'{self.name}_total', key, value) for key, value in sorted(values.items())]
+
+
+class Histogram:
+    """Distribution of observed values (usually seconds) in cumulative buckets."""
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [bucket counts..., count, sum]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes how long the block took, in seconds (also when it raises)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with _lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        samples = []
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', key + (('le', _format_value(float(bound))),), cumulative))
+            samples.append((f'{self.name}_bucket', key + (('le', '+Inf'),), state[-2]))
+            samples.append((f'{self.name}_count', key, state[-2]))
+            samples.append((f'{self.name}_sum', key, state[-1]))
+        return samples
+
+
+def _register(metric):
+    with _lock:
+        existing = _metrics.get(metric.name)
+        if existing is not None:
+            return existing  # Module reloaded (e.g. the Flask reloader); keep the same series
+        _metrics[metric.name] = metric
+    return metric
+
+
+def counter(name, help):
+    """Returns the process-wide counter with this name, creating it on first use."""
+    return _register(Counter(name, help))
+
+
+def histogram(name, help, buckets=DEFAULT_BUCKETS):
+    """Returns the process-wide histogram with this name, creating it on first use."""
+    return _register(Histogram(name, help, buckets))
+
+
+def render():
+    """Returns every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in sorted(list(_metrics.values()), key=lambda m: m.name):
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples():
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
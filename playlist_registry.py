@@ -0,0 +1,117 @@
+"""
+Records which playlist was generated for each (Spotify user, year) and which
+track URIs were written to it, so a re-run can diff against what is already
+there instead of creating a duplicate playlist and re-adding every track.
+"""
+import json
+import time
+
+from spotipy.exceptions import SpotifyException
+
+from storage import SQLiteStore
+
+
+class PlaylistRegistry(SQLiteStore):
+    """SQLite table of (user_id, chart key) -> playlist ID, URL and written track URIs."""
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS playlists (
+            user_id TEXT NOT NULL,
+            chart_key TEXT NOT NULL,
+            playlist_id TEXT NOT NULL,
+            playlist_url TEXT NOT NULL,
+            track_uris TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (user_id, chart_key)
+        );
+    '''
+
+    def get(self, user_id, chart_key):
+        """Returns {'playlist_id', 'playlist_url', 'track_uris'} or None."""
+        row = self._conn().execute(
+            'SELECT playlist_id, playlist_url, track_uris FROM playlists WHERE user_id = ? AND chart_key = ?',
+            (user_id, str(chart_key))
+        ).fetchone()
+        if row is None:
+            return None
+        return {'playlist_id': row[0], 'playlist_url': row[1], 'track_uris': json.loads(row[2])}
+
+    def record(self, user_id, chart_key, playlist_id, playlist_url, track_uris):
+        """Stores (or replaces) the playlist and the full list of URIs it now holds."""
+        self._conn().execute(
+            'INSERT OR REPLACE INTO playlists (user_id, chart_key, playlist_id, playlist_url, track_uris, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (user_id, str(chart_key), playlist_id, playlist_url, json.dumps(list(track_uris)), time.time())
+        )
+
+    def forget(self, user_id, chart_key):
+        self._conn().execute(
+            'DELETE FROM playlists WHERE user_id = ? AND chart_key = ?', (user_id, str(chart_key))
+        )
+
+
+def is_following_playlist(sp, playlist_id, user_id):
+    """
+    True if the user still follows the playlist. Deleting a playlist in Spotify only unfollows it,
+    so fetching it by ID keeps working afterwards.
+    """
+    try:
+        # spotipy's playlist_is_following() breaks on its own deprecation warning (2.26), so call the endpoint
+        following = sp._get(f'playlists/{playlist_id}/followers/contains', ids=user_id)
+    except SpotifyException as e:
+        if e.http_status != 404:
+            raise
+        return False
+    return bool(following and following[0])
+
+
+def find_playlist_by_name(sp, user_id, name):
+    """Looks through the user's own playlists for one with this exact name. Returns the playlist dict or None."""
+    page = sp.current_user_playlists(limit=50)
+    while page:
+        for playlist in page['items']:
+            if playlist and playlist['name'] == name and playlist['owner']['id'] == user_id:
+                return playlist
+        page = sp.next(page) if page.get('next') else None
+    return None
+
+
+def get_playlist_track_uris(sp, playlist_id):
+    """Returns the URIs of every track in a playlist, in playlist order."""
+    uris = []
+    page = sp.playlist_items(playlist_id, fields='items(track(uri)),next', additional_types=('track',))
+    while page:
+        uris.extend(item['track']['uri'] for item in page['items'] if item.get('track'))
+        page = sp.next(page) if page.get('next') else None
+    return uris
+
+
+async def is_following_playlist_async(sp, playlist_id, user_id):
+    """Async counterpart of is_following_playlist() for an AsyncSpotify client."""
+    try:
+        following = await sp.playlist_is_following(playlist_id, [user_id])
+    except SpotifyException as e:
+        if e.http_status != 404:
+            raise
+        return False
+    return bool(following and following[0])
+
+
+async def find_playlist_by_name_async(sp, user_id, name):
+    """Async counterpart of find_playlist_by_name() for an AsyncSpotify client."""
+    page = await sp.current_user_playlists(limit=50)
+    while page:
+        for playlist in page['items']:
+            if playlist and playlist['name'] == name and playlist['owner']['id'] == user_id:
+                return playlist
+        page = await sp.next(page) if page.get('next') else None
+    return None
+
+
+async def get_playlist_track_uris_async(sp, playlist_id):
+    """Async counterpart of get_playlist_track_uris() for an AsyncSpotify client."""
+    uris = []
+    page = await sp.playlist_items(playlist_id, fields='items(track(uri)),next', additional_types=('track',))
+    while page:
+        uris.extend(item['track']['uri'] for item in page['items'] if item.get('track'))
+        page = await sp.next(page) if page.get('next') else None
+    return uris
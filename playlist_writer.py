@@ -0,0 +1,118 @@
+"""
+Write step for playlist generation: commits resolved track URIs to a
+playlist in API-sized batches instead of one request per song.
+"""
+import asyncio
+import logging
+import time
+
+from spotipy.exceptions import SpotifyException
+
+import metrics
+from resolver import RETRYABLE_STATUSES, retry_after_seconds
+
+# Spotify accepts at most 100 URIs per "add items to playlist" request
+MAX_BATCH_SIZE = 100
+
+WRITE_SECONDS = metrics.histogram('playlist_write_seconds', 'Time per add-items-to-playlist API call.')
+WRITE_RETRIES = metrics.counter('playlist_write_retries', 'Playlist write batches retried after a 429 or 5xx.')
+TRACKS_WRITTEN = metrics.counter('playlist_tracks', 'Track URIs written to playlists, by outcome (added, failed).')
+
+
+def chunked(items, size):
+    """Splits a list into consecutive chunks of at most `size` items."""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def add_tracks_in_batches(sp, playlist_id, track_uris, batch_size=MAX_BATCH_SIZE, max_retries=3, backoff=1.0):
+    """
+    Adds track URIs to a playlist in order, batch_size URIs per request.
+    A batch rejected with 429 or 5xx is retried with exponential backoff (or after Retry-After); one rejected
+    with 400 (a bad URI) is split in half, recursively, so the bad URI does not sink its neighbours.
+    Any other error is raised: auth and missing-playlist errors will not go away by retrying, and a
+    request that got no response at all may already have added the tracks.
+    Returns a tuple: (added_uris, failed_uris), both in chart order.
+    """
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    added = []
+    failed = []
+    for batch in chunked(list(track_uris), batch_size):
+        _write_batch(sp, playlist_id, batch, max_retries, backoff, added, failed)
+    return added, failed
+
+
+def _retry_delay(error, attempt, max_retries, backoff):
+    """
+    Returns how long to wait before retrying a failed write, or None to split the batch (400).
+    Raises the error when it is not worth retrying.
+    """
+    status = getattr(error, 'http_status', None) if isinstance(error, SpotifyException) else None
+    if status == 400:
+        return None
+    if status not in RETRYABLE_STATUSES or attempt >= max_retries:
+        raise error
+    WRITE_RETRIES.inc()
+    return retry_after_seconds(error, default=backoff * (2 ** attempt))
+
+
+def _write_batch(sp, playlist_id, batch, max_retries, backoff, added, failed):
+    for attempt in range(max_retries + 1):
+        try:
+            with WRITE_SECONDS.time():
+                sp.playlist_add_items(playlist_id=playlist_id, items=batch)
+            added.extend(batch)
+            TRACKS_WRITTEN.inc(len(batch), outcome='added')
+            return
+        except Exception as e:
+            logging.warning(f"Adding {len(batch)} tracks to playlist failed (attempt {attempt + 1}): {e}")
+            delay = _retry_delay(e, attempt, max_retries, backoff)
+            if delay is None:
+                break
+            time.sleep(delay)
+
+    if len(batch) == 1:
+        logging.error(f"Giving up on track {batch[0]}.")
+        failed.extend(batch)
+        TRACKS_WRITTEN.inc(outcome='failed')
+        return
+
+    # Split the batch so the URIs that can be written still make it in, in order
+    middle = len(batch) // 2
+    _write_batch(sp, playlist_id, batch[:middle], max_retries, backoff, added, failed)
+    _write_batch(sp, playlist_id, batch[middle:], max_retries, backoff, added, failed)
+
+
+async def add_tracks_in_batches_async(sp, playlist_id, track_uris, batch_size=MAX_BATCH_SIZE, max_retries=3, backoff=1.0):
+    """Async counterpart of add_tracks_in_batches() for an AsyncSpotify client."""
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    added = []
+    failed = []
+    for batch in chunked(list(track_uris), batch_size):
+        await _write_batch_async(sp, playlist_id, batch, max_retries, backoff, added, failed)
+    return added, failed
+
+
+async def _write_batch_async(sp, playlist_id, batch, max_retries, backoff, added, failed):
+    for attempt in range(max_retries + 1):
+        try:
+            with WRITE_SECONDS.time():
+                await sp.playlist_add_items(playlist_id=playlist_id, items=batch)
+            added.extend(batch)
+            TRACKS_WRITTEN.inc(len(batch), outcome='added')
+            return
+        except Exception as e:
+            logging.warning(f"Adding {len(batch)} tracks to playlist failed (attempt {attempt + 1}): {e}")
+            delay = _retry_delay(e, attempt, max_retries, backoff)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+
+    if len(batch) == 1:
+        logging.error(f"Giving up on track {batch[0]}.")
+        failed.extend(batch)
+        TRACKS_WRITTEN.inc(outcome='failed')
+        return
+
+    middle = len(batch) // 2
+    await _write_batch_async(sp, playlist_id, batch[:middle], max_retries, backoff, added, failed)
+    await _write_batch_async(sp, playlist_id, batch[middle:], max_retries, backoff, added, failed)
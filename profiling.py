@@ -0,0 +1,81 @@
+"""
+Opt-in cProfile profiling of single requests, safe to leave deployed.
+
+A request is profiled when PROFILE_REQUESTS is on (every request, for local
+use) or when it carries an `X-Profile` header equal to PROFILE_TOKEN. The
+profile is written to DATA_DIR/profiles/<time>-<endpoint>-<id>.prof (open it with
+`python -m pstats` or snakeviz) and the slowest functions are logged.
+
+Only work done on the request thread before the response is returned is
+captured: streamed bodies and queued jobs run elsewhere. One profile runs per
+thread at a time; under asgi.py, requests that overlap on the event loop
+thread are not profiled while another one is.
+"""
+import cProfile
+import hmac
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+import uuid
+
+from storage import DATA_DIR
+
+PROFILE_HEADER = 'X-Profile'
+
+
+class RequestProfiler:
+    def __init__(self, token=None, always=False, output_dir=None, top=25):
+        self.token = token
+        self.always = always
+        self.output_dir = output_dir or os.path.join(DATA_DIR, 'profiles')
+        self.top = top
+        self._local = threading.local()  # .active: a profile is running on this thread
+
+    @property
+    def enabled(self):
+        return bool(self.always or self.token)
+
+    def wanted(self, request):
+        """True if this request should be profiled."""
+        if self.always:
+            return True
+        header = request.headers.get(PROFILE_HEADER)
+        # Compared as bytes: compare_digest() raises TypeError on non-ASCII str
+        return bool(self.token and header and hmac.compare_digest(header.encode(), self.token.encode()))
+
+    def start(self):
+        """Starts a profile, or returns None when another one is already running on this thread."""
+        # Checked here rather than relying on enable() raising: before Python 3.12 a second
+        # profile on the thread silently replaces the first one
+        if getattr(self._local, 'active', False):
+            logging.warning("Another profile is running on this thread; not profiling this request.")
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # Some other profiler (not ours) is active on this thread
+            logging.warning("Another profiler is running on this thread; not profiling this request.")
+            return None
+        self._local.active = True
+        return profile
+
+    def discard(self, profile):
+        """Stops a profile without saving it (the request failed before finish())."""
+        profile.disable()
+        self._local.active = False
+
+    def finish(self, profile, name):
+        """Stops the profile, saves it and logs the top functions. Returns the file name."""
+        self.discard(profile)
+        os.makedirs(self.output_dir, exist_ok=True)
+        # The suffix keeps concurrent requests to one endpoint from overwriting each other's file
+        filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{uuid.uuid4().hex[:8]}.prof"
+        profile.dump_stats(os.path.join(self.output_dir, filename))
+
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(self.top)
+        logging.info(f"Profile for {name} saved to {filename}:\n{out.getvalue()}")
+        return filename
@@ -0,0 +1,128 @@
+"""
+Shared (title, artist) -> Spotify track URI cache.
+
+Entries live in a SQLite table so every gunicorn worker and every route
+reuses the same search results. Songs that were not found are cached too,
+as negative entries with a shorter TTL, so they get another chance later.
+"""
+import re
+import threading
+import time
+import unicodedata
+
+import metrics
+from storage import SQLiteStore
+
+# Marker returned by ResolutionCache.get() for a cached "not found" entry
+NOT_FOUND = object()
+
+CACHE_LOOKUPS = metrics.counter('resolution_cache_lookups', 'Resolution cache lookups, by result (hits, negative_hits, misses).')
+
+
+def normalize(text):
+    """Lowercases, strips accents and punctuation and collapses whitespace."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r'[^\w\s]', ' ', text.lower())
+    return ' '.join(text.split())
+
+
+def cache_key(title, artist):
+    """Returns the normalized cache key for a song."""
+    return f"{normalize(title)}\x1f{normalize(artist)}"
+
+
+class ResolutionCache(SQLiteStore):
+    """
+    Persistent cache of track URIs keyed on normalized (title, artist).
+    get() returns the URI, NOT_FOUND for a cached miss, or None when unknown.
+    """
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS resolutions (
+            key TEXT PRIMARY KEY,
+            uri TEXT,
+            expires_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS resolutions_expires_at ON resolutions (expires_at);
+    '''
+
+    def __init__(self, path, ttl=30 * 24 * 3600, negative_ttl=24 * 3600):
+        super().__init__(path)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._counters = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'stores': 0}
+        self._counter_lock = threading.Lock()
+
+    def get(self, title, artist):
+        """Looks up one song. Returns its URI, NOT_FOUND or None."""
+        uri = self.peek(title, artist)
+        self._count('misses' if uri is None else 'negative_hits' if uri is NOT_FOUND else 'hits')
+        return uri
+
+    def peek(self, title, artist):
+        """Like get(), without counting the lookup (for polling while another worker searches the song)."""
+        row = self._conn().execute(
+            'SELECT uri FROM resolutions WHERE key = ? AND expires_at > ?',
+            (cache_key(title, artist), time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        return NOT_FOUND if row[0] is None else row[0]
+
+    def get_many(self, songs):
+        """
+        Looks up a list of (title, artist) pairs with a single query.
+        Returns a list aligned with `songs` holding URIs, NOT_FOUND or None.
+        """
+        keys = [cache_key(title, artist) for title, artist in songs]
+        found = {}
+        unique_keys = list(set(keys))
+        # Stay well below SQLite's limit on bound parameters
+        for start in range(0, len(unique_keys), 500):
+            chunk = unique_keys[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self._conn().execute(
+                f'SELECT key, uri FROM resolutions WHERE key IN ({placeholders}) AND expires_at > ?',
+                (*chunk, time.time())
+            ).fetchall()
+            found.update(rows)
+
+        results = []
+        for key in keys:
+            if key not in found:
+                self._count('misses')
+                results.append(None)
+            elif found[key] is None:
+                self._count('negative_hits')
+                results.append(NOT_FOUND)
+            else:
+                self._count('hits')
+                results.append(found[key])
+        return results
+
+    def set(self, title, artist, uri):
+        """Stores a URI, or a negative entry when uri is None."""
+        ttl = self.ttl if uri else self.negative_ttl
+        self._conn().execute(
+            'INSERT OR REPLACE INTO resolutions (key, uri, expires_at) VALUES (?, ?, ?)',
+            (cache_key(title, artist), uri, time.time() + ttl)
+        )
+        self._count('stores')
+
+    def purge_expired(self):
+        """Deletes expired entries. Returns the number of rows removed."""
+        return self._conn().execute('DELETE FROM resolutions WHERE expires_at <= ?', (time.time(),)).rowcount
+
+    def stats(self):
+        """Returns this process's hit/miss counters."""
+        with self._counter_lock:
+            stats = dict(self._counters)
+        lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['negative_hits']) / lookups, 3) if lookups else 0.0
+        return stats
+
+    def _count(self, name):
+        with self._counter_lock:
+            self._counters[name] += 1
+        if name != 'stores':
+            CACHE_LOOKUPS.inc(result=name)
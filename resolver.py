@@ -0,0 +1,371 @@
+"""
+Track resolution engine: turns Billboard (title, artist) pairs into Spotify
+track URIs by running the searches on a bounded thread pool.
+
+All searches in the process share one token bucket, so the request rate stays
+bounded no matter how many users are generating playlists at once. A 429
+response pauses the whole bucket for the Retry-After period instead of
+letting every worker hammer the API. When a ResolutionCache is given,
+cached songs skip the search (and the rate limiter) entirely.
+
+Each search asks for several candidates and picks the best one with the
+fuzzy scorer in matching.py; a relaxed second query is only sent when the
+first one has no confident match.
+
+With a SingleFlight, identical songs searched at the same time (by several
+users, or by other workers through its leases) share one search.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from spotipy.exceptions import SpotifyException
+
+import metrics
+from matching import SEARCH_LIMIT, MATCH_THRESHOLD, MIN_CONFIDENCE, best_match, search_queries
+from resolution_cache import NOT_FOUND, cache_key
+
+# Statuses worth retrying after a pause
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+# Default search rate limit per process. Spotify does not publish its limit (it counts calls over
+# a rolling 30-second window) and answers 429 with a Retry-After that pauses the bucket, so a rate
+# that is too high costs pauses, not failed searches. The burst covers a 100-song chart, so one
+# playlist resolves at the speed of the worker pool rather than of the rate limit.
+DEFAULT_SEARCH_RATE = 30
+DEFAULT_SEARCH_BURST = 100
+
+SEARCH_SECONDS = metrics.histogram('spotify_search_seconds', 'Time per Spotify search API call.')
+SEARCH_RETRIES = metrics.counter('spotify_search_retries', 'Search calls retried, by HTTP status.')
+SEARCH_RESULTS = metrics.counter('track_resolutions', 'Songs searched, by outcome (found, not_found, error).')
+RATE_LIMIT_WAIT_SECONDS = metrics.histogram(
+    'rate_limit_wait_seconds', 'Time searches spent waiting for the rate limiter.',
+    buckets=(0.0, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0))
+RATE_LIMIT_PAUSES = metrics.counter('rate_limit_pauses', 'Times a 429 or 5xx paused every search.')
+
+
+def retry_after_seconds(error, default=1.0):
+    """Returns the Retry-After delay (seconds) carried by a SpotifyException, or default."""
+    headers = getattr(error, 'headers', None) or {}
+    value = headers.get('Retry-After') or headers.get('retry-after')
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiter.
+    `rate` tokens are added per second up to `capacity`; penalize() blocks
+    every caller until the given delay has passed (used for 429 responses).
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _take(self):
+        """Takes a token if one is available. Returns None, or how long to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if now >= self._blocked_until and self._tokens >= 1:
+                self._tokens -= 1
+                return None
+            return max(self._blocked_until - now, (1 - self._tokens) / self.rate)
+
+    def acquire(self):
+        """Blocks until a token is available. Returns the number of seconds waited."""
+        waited = 0.0
+        while True:
+            delay = self._take()
+            if delay is None:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    async def acquire_async(self):
+        """Like acquire(), but waits without blocking the event loop."""
+        waited = 0.0
+        while True:
+            delay = self._take()
+            if delay is None:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def penalize(self, seconds):
+        """Stops handing out tokens for `seconds` (e.g. from a Retry-After header)."""
+        RATE_LIMIT_PAUSES.inc()
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+class TrackResolver:
+    """
+    Resolves songs to Spotify track URIs concurrently.
+    Results come back as dicts in chart order:
+    {'index', 'title', 'artist', 'uri', 'found', 'error', 'confidence'}
+    where confidence is the match score (0..1) of a fresh search, or None for cache hits.
+    """
+
+    def __init__(self, max_workers=8, rate=DEFAULT_SEARCH_RATE, burst=DEFAULT_SEARCH_BURST, max_retries=3, cache=None, max_concurrency=64, flights=None):
+        self.max_workers = max(1, max_workers)
+        self.max_concurrency = max(1, max_concurrency)  # Searches in flight at once across every resolve_async() call
+        self._async_slots = self._async_loop = None  # Created on the event loop, see _slots()
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.cache = cache
+        self.flights = flights
+        self._stats_lock = threading.Lock()
+        self._songs = self._searches = self._relaxed = self._found = 0
+
+    def stats(self):
+        """Returns how many songs were searched, the API calls that took and the share that matched."""
+        with self._stats_lock:
+            songs, searches, relaxed, found = self._songs, self._searches, self._relaxed, self._found
+        return {
+            'songs_searched': songs,
+            'search_calls': searches,
+            'relaxed_queries': relaxed,
+            'found': found,
+            'calls_per_song': round(searches / songs, 3) if songs else 0.0,
+            'hit_rate': round(found / songs, 3) if songs else 0.0,
+        }
+
+    def resolve(self, sp, songs, on_result=None):
+        """
+        Searches every (title, artist) pair with a bounded pool of workers.
+        `on_result` is called with each result as soon as it completes.
+        Returns the list of results in chart order.
+        """
+        results, pending = self._from_cache(songs, on_result)
+        if not pending:
+            return results
+
+        workers = min(self.max_workers, len(pending))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='resolver') as executor:
+            futures = [
+                executor.submit(self._resolve_uncached, sp, index, title, artist)
+                for index, (title, artist) in pending
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                results[result['index']] = result
+                if on_result:
+                    on_result(result)
+        return results
+
+    async def resolve_async(self, sp, songs, on_result=None):
+        """
+        Async counterpart of resolve() for an AsyncSpotify client: the searches run as tasks on
+        the event loop (at most max_concurrency at once, shared by all requests) instead of on worker threads.
+        Cache reads and writes (SQLite) run on threads.
+        """
+        results, pending = await asyncio.to_thread(self._from_cache, songs, None)
+        if on_result:
+            for result in results:
+                if result is not None:
+                    on_result(result)
+        if not pending:
+            return results
+
+        async def run(index, title, artist):
+            if self.flights is None:
+                result = await self._search_and_cache_async(sp, index, title, artist)
+            else:
+                shared = await self.flights.do_async(
+                    cache_key(title, artist),
+                    lambda: self._search_and_cache_async(sp, index, title, artist),
+                    lookup=lambda: self._cached_result(index, title, artist, counted=False))
+                result = dict(shared, index=index, title=title, artist=artist)
+            results[index] = result
+            if on_result:
+                on_result(result)
+
+        await asyncio.gather(*(run(index, title, artist) for index, (title, artist) in pending))
+        return results
+
+    def _from_cache(self, songs, on_result):
+        """
+        Answers what it can from the cache in one query.
+        Returns (results, pending): results has None for every song still to search, listed in pending as (index, (title, artist)).
+        """
+        results = [None] * len(songs)
+        if self.cache is None:
+            return results, list(enumerate(songs))
+
+        pending = []
+        for index, ((title, artist), cached) in enumerate(zip(songs, self.cache.get_many(songs) if songs else [])):
+            if cached is None:
+                pending.append((index, (title, artist)))
+                continue
+            result = self._result(index, title, artist)
+            if cached is not NOT_FOUND:
+                result['uri'] = cached
+                result['found'] = True
+            results[index] = result
+            if on_result:
+                on_result(result)
+        return results, pending
+
+    def resolve_one(self, sp, index, title, artist):
+        """Resolves one song from the cache, or searches it and caches the outcome."""
+        result = self._cached_result(index, title, artist)
+        if result is not None:
+            return result
+        return self._resolve_uncached(sp, index, title, artist)
+
+    def _cached_result(self, index, title, artist, counted=True):
+        """
+        Returns the result for a cached song, or None when it has to be searched. The single-flight lookup
+        polls with counted=False, so waiting on another worker's search does not count as cache misses.
+        """
+        if self.cache is None:
+            return None
+        cached = self.cache.get(title, artist) if counted else self.cache.peek(title, artist)
+        if cached is None:
+            return None
+        result = self._result(index, title, artist)
+        if cached is not NOT_FOUND:
+            result['uri'] = cached
+            result['found'] = True
+        return result
+
+    def _resolve_uncached(self, sp, index, title, artist):
+        """Searches a song, sharing the search with identical ones already in flight."""
+        if self.flights is None:
+            return self._search_and_cache(sp, index, title, artist)
+        shared = self.flights.do(
+            cache_key(title, artist),
+            lambda: self._search_and_cache(sp, index, title, artist),
+            lookup=lambda: self._cached_result(index, title, artist, counted=False))
+        return dict(shared, index=index, title=title, artist=artist)
+
+    def _search_and_cache(self, sp, index, title, artist):
+        result = self._result(index, title, artist)
+        self._search(sp, result)
+        if self.cache is not None and result['error'] is None:
+            self.cache.set(title, artist, result['uri'])
+        return result
+
+    async def _search_and_cache_async(self, sp, index, title, artist):
+        async with self._slots():
+            result = self._result(index, title, artist)
+            await self._search_async(sp, result)
+        if self.cache is not None and result['error'] is None:
+            await asyncio.to_thread(self.cache.set, title, artist, result['uri'])
+        return result
+
+    def _slots(self):
+        """The semaphore bounding async searches, made on the running loop (before Python 3.10 it binds to one)."""
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            self._async_slots, self._async_loop = asyncio.Semaphore(self.max_concurrency), loop
+        return self._async_slots
+
+    @staticmethod
+    def _result(index, title, artist):
+        return {'index': index, 'title': title, 'artist': artist, 'uri': None, 'found': False, 'error': None, 'confidence': None}
+
+    def _search(self, sp, result):
+        """
+        Searches one song and keeps the best-scoring candidate. The relaxed query is only
+        sent when the first one has no match above MATCH_THRESHOLD. Fills in `result`.
+        """
+        title, artist = result['title'], result['artist']
+        best, best_score = None, 0.0
+        calls = 0
+        for query in search_queries(title, artist):
+            calls += 1
+            try:
+                items = self._query(sp, query)
+            except Exception as e:
+                if best is None:
+                    result['error'] = str(e)
+                    SEARCH_RESULTS.inc(outcome='error')
+                    return
+                break  # The relaxed query failed; keep what the first one found
+            item, score = best_match(title, artist, items)
+            if score > best_score:
+                best, best_score = item, score
+            if best_score >= MATCH_THRESHOLD:
+                break
+        self._finish(result, best, best_score, calls)
+
+    async def _search_async(self, sp, result):
+        """Async counterpart of _search()."""
+        title, artist = result['title'], result['artist']
+        best, best_score = None, 0.0
+        calls = 0
+        for query in search_queries(title, artist):
+            calls += 1
+            try:
+                items = await self._query_async(sp, query)
+            except Exception as e:
+                if best is None:
+                    result['error'] = str(e)
+                    SEARCH_RESULTS.inc(outcome='error')
+                    return
+                break
+            item, score = best_match(title, artist, items)
+            if score > best_score:
+                best, best_score = item, score
+            if best_score >= MATCH_THRESHOLD:
+                break
+        self._finish(result, best, best_score, calls)
+
+    def _finish(self, result, best, best_score, calls):
+        """Fills in the best match (if it is confident enough) and counts the search."""
+        result['confidence'] = round(best_score, 3)
+        if best is not None and best_score >= MIN_CONFIDENCE:
+            result['uri'] = best['uri']
+            result['found'] = True
+        with self._stats_lock:
+            self._songs += 1
+            self._searches += calls
+            self._relaxed += calls - 1
+            self._found += result['found']
+        SEARCH_RESULTS.inc(outcome='found' if result['found'] else 'not_found')
+
+    def _query(self, sp, query):
+        """Runs one search for several candidates, retrying rate-limited and transient failures."""
+        for attempt in range(self.max_retries + 1):
+            RATE_LIMIT_WAIT_SECONDS.observe(self.bucket.acquire())
+            try:
+                with SEARCH_SECONDS.time():
+                    return sp.search(q=query, type='track', limit=SEARCH_LIMIT)['tracks']['items']
+            except SpotifyException as e:
+                if e.http_status in RETRYABLE_STATUSES and attempt < self.max_retries:
+                    SEARCH_RETRIES.inc(status=e.http_status)
+                    delay = retry_after_seconds(e, default=2.0 ** attempt)
+                    logging.warning(f"Spotify returned {e.http_status} searching '{query}', pausing searches for {delay:.1f}s.")
+                    self.bucket.penalize(delay)
+                    continue
+                raise
+
+    async def _query_async(self, sp, query):
+        """Async counterpart of _query()."""
+        for attempt in range(self.max_retries + 1):
+            RATE_LIMIT_WAIT_SECONDS.observe(await self.bucket.acquire_async())
+            try:
+                with SEARCH_SECONDS.time():
+                    response = await sp.search(q=query, type='track', limit=SEARCH_LIMIT)
+                return response['tracks']['items']
+            except SpotifyException as e:
+                if e.http_status in RETRYABLE_STATUSES and attempt < self.max_retries:
+                    SEARCH_RETRIES.inc(status=e.http_status)
+                    delay = retry_after_seconds(e, default=2.0 ** attempt)
+                    logging.warning(f"Spotify returned {e.http_status} searching '{query}', pausing searches for {delay:.1f}s.")
+                    self.bucket.penalize(delay)
+                    continue
+                raise
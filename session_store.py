@@ -0,0 +1,188 @@
+"""
+Bounded, expiring server-side session backends.
+
+The session cookie only holds a signed session ID; the session data lives in
+either a SQLite table (shared by all gunicorn workers on the machine) or an
+in-process LRU (single-node, single-process setups). Both expire sessions
+after `lifetime` seconds of inactivity, cap the number of stored sessions,
+and only write when the session actually changed.
+"""
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+import metrics
+from storage import SQLiteStore
+
+SESSION_IO_SECONDS = metrics.histogram('session_io_seconds', 'Time spent loading and saving sessions, by operation.')
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session dict that remembers its ID and whether it was changed."""
+
+    def __init__(self, initial=None, sid=None, new=False, expires_at=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires_at = expires_at
+        self.modified = False
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Common cookie handling for the session backends.
+    Subclasses implement _load(sid), _save(sid, data, expires_at), _delete(sid) and sweep().
+    """
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, lifetime=24 * 3600, max_sessions=10000, sweep_interval=300):
+        self.lifetime = lifetime
+        self.max_sessions = max_sessions
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='server-session', key_derivation='hmac')
+
+    def open_session(self, app, request):
+        signed_sid = request.cookies.get(app.config['SESSION_COOKIE_NAME'])
+        if signed_sid:
+            try:
+                sid = self._signer(app).unsign(signed_sid).decode()
+            except BadSignature:
+                sid = None
+            if sid:
+                with SESSION_IO_SECONDS.time(operation='load'):
+                    stored = self._load(sid)
+                if stored is not None:
+                    data, expires_at = stored
+                    return ServerSession(self.serializer.loads(data), sid=sid, expires_at=expires_at)
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = app.config['SESSION_COOKIE_NAME']
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if not session.new:
+                self._delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        # Write only when something changed, or to keep an active session from expiring
+        needs_touch = session.expires_at is None or session.expires_at - now < self.lifetime / 2
+        if not (session.modified or session.new or needs_touch):
+            return
+
+        with SESSION_IO_SECONDS.time(operation='save'):
+            self._save(session.sid, self.serializer.dumps(dict(session)), now + self.lifetime)
+        self._maybe_sweep(now)
+
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid.encode()).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    def _maybe_sweep(self, now):
+        with self._sweep_lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        self.sweep()
+
+
+class SQLiteSessionInterface(ServerSideSessionInterface, SQLiteStore):
+    """Sessions in a SQLite table indexed on expiry; old sessions are swept periodically."""
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at);
+    '''
+
+    def __init__(self, path, lifetime=24 * 3600, max_sessions=10000, sweep_interval=300):
+        ServerSideSessionInterface.__init__(self, lifetime, max_sessions, sweep_interval)
+        SQLiteStore.__init__(self, path)
+
+    def _load(self, sid):
+        row = self._conn().execute(
+            'SELECT data, expires_at FROM sessions WHERE id = ? AND expires_at > ?', (sid, time.time())
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _save(self, sid, data, expires_at):
+        self._conn().execute(
+            'INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)', (sid, data, expires_at)
+        )
+
+    def _delete(self, sid):
+        self._conn().execute('DELETE FROM sessions WHERE id = ?', (sid,))
+
+    def sweep(self):
+        """Deletes expired sessions, then the ones closest to expiry if over max_sessions."""
+        conn = self._conn()
+        conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),))
+        conn.execute(
+            'DELETE FROM sessions WHERE id IN ('
+            '  SELECT id FROM sessions ORDER BY expires_at DESC LIMIT -1 OFFSET ?'
+            ')',
+            (self.max_sessions,)
+        )
+
+
+class MemorySessionInterface(ServerSideSessionInterface):
+    """Sessions in an in-process LRU. Only for single-process deployments."""
+
+    def __init__(self, lifetime=24 * 3600, max_sessions=10000, sweep_interval=300):
+        super().__init__(lifetime, max_sessions, sweep_interval)
+        self._sessions = OrderedDict()  # sid -> (data, expires_at)
+        self._lock = threading.Lock()
+
+    def _load(self, sid):
+        with self._lock:
+            stored = self._sessions.get(sid)
+            if stored is None:
+                return None
+            if stored[1] <= time.time():
+                del self._sessions[sid]
+                return None
+            self._sessions.move_to_end(sid)
+            return stored
+
+    def _save(self, sid, data, expires_at):
+        with self._lock:
+            self._sessions[sid] = (data, expires_at)
+            self._sessions.move_to_end(sid)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def _delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def sweep(self):
+        """Deletes expired sessions."""
+        now = time.time()
+        with self._lock:
+            for sid in [sid for sid, (_, expires_at) in self._sessions.items() if expires_at <= now]:
+                del self._sessions[sid]
@@ -0,0 +1,273 @@
+"""
+Single-flight coalescing of identical in-flight calls (chart scrapes, track searches).
+
+When many users ask for the same year at once, only the first caller for a key
+runs the call; concurrent callers with the same key wait for it and share
+its result (or its exception):
+
+    flights = SingleFlight('chart', leases=LeaseStore(db_path('singleflight.db')))
+    songs = flights.do('1999', lambda: scrape(1999), lookup=lambda: cached_chart(1999))
+
+Across gunicorn workers (or uvicorn processes) the leader also takes a short
+SQLite lease on the key. A caller that finds the lease held by another
+process polls `lookup` (the shared cache the leader writes to) until the
+result shows up, or runs the call itself once the lease is released or
+expires. A caller that gets the lease straight away always makes the call,
+so an explicit refresh is never answered from the cache it replaces.
+Without a lookup or a lease store only in-process calls coalesce.
+
+do() is for threads, do_async() for coroutines on the event loop (asgi.py).
+"""
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+
+import metrics
+from storage import SQLiteStore
+
+COALESCED = metrics.counter(
+    'singleflight_coalesced', 'Calls that shared an in-flight result instead of making their own, by flight and scope.')
+
+
+class LeaseStore(SQLiteStore):
+    """Short-lived (flight, key) locks shared by every process using the same database file."""
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS leases (
+            flight TEXT NOT NULL,
+            key TEXT NOT NULL,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (flight, key)
+        );
+    '''
+
+    def acquire(self, flight, key, owner, ttl):
+        """Takes the lease if it is free or expired. Returns True if `owner` now holds it."""
+        now = time.time()
+        cursor = self._conn().execute(
+            'INSERT INTO leases (flight, key, owner, expires_at) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (flight, key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at '
+            'WHERE leases.expires_at < ?',
+            (flight, key, owner, now + ttl, now)
+        )
+        return cursor.rowcount == 1
+
+    def renew(self, flight, key, owner, ttl):
+        """Extends a lease `owner` holds. Returns False if it was lost (it expired and someone else took it)."""
+        cursor = self._conn().execute(
+            'UPDATE leases SET expires_at = ? WHERE flight = ? AND key = ? AND owner = ?',
+            (time.time() + ttl, flight, key, owner)
+        )
+        return cursor.rowcount == 1
+
+    def release(self, flight, key, owner):
+        self._conn().execute(
+            'DELETE FROM leases WHERE flight = ? AND key = ? AND owner = ?', (flight, key, owner)
+        )
+
+    @contextmanager
+    def hold(self, flight, key, ttl=60.0, poll_interval=0.1):
+        """
+        Holds the lease for the block, first waiting for the current holder (at most until its lease expires).
+        A heartbeat renews it every ttl/3 while the block runs, so only a holder that died lets it expire.
+        """
+        owner = uuid.uuid4().hex
+        while not self.acquire(flight, key, owner, ttl):
+            time.sleep(poll_interval)
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(ttl / 3):
+                self._renew(flight, key, owner, ttl)
+
+        thread = threading.Thread(target=heartbeat, name=f'lease-{flight}', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+            self.release(flight, key, owner)
+
+    @asynccontextmanager
+    async def hold_async(self, flight, key, ttl=60.0, poll_interval=0.1):
+        """Like hold(), with the SQLite calls on a thread so the event loop keeps running."""
+        owner = uuid.uuid4().hex
+        while not await asyncio.to_thread(self.acquire, flight, key, owner, ttl):
+            await asyncio.sleep(poll_interval)
+
+        async def heartbeat():
+            while True:
+                await asyncio.sleep(ttl / 3)
+                await asyncio.to_thread(self._renew, flight, key, owner, ttl)
+
+        task = asyncio.get_running_loop().create_task(heartbeat())
+        try:
+            yield
+        finally:
+            task.cancel()
+            await asyncio.to_thread(self.release, flight, key, owner)
+
+    def _renew(self, flight, key, owner, ttl):
+        try:
+            if not self.renew(flight, key, owner, ttl):
+                logging.warning(f"Lease {flight} {key} expired before it was renewed; another run may have taken it.")
+        except Exception as e:
+            logging.warning(f"Could not renew lease {flight} {key}: {e}")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key. `name` labels the metric and
+    the leases; `lease_ttl` bounds how long other processes wait for a leader
+    that never finishes.
+    """
+
+    def __init__(self, name, leases=None, lease_ttl=60.0, poll_interval=0.05):
+        self.name = name
+        self.leases = leases
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self._calls = {}    # key -> _Call, for threads
+        self._futures = {}  # key -> asyncio.Future, for coroutines
+        self._lock = threading.Lock()
+
+    def do(self, key, func, lookup=None):
+        """
+        Returns func(), or the result of the identical call already in flight.
+        `lookup` returns the shared (cross-process) result for the key, or None if there is none yet.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            COALESCED.inc(flight=self.name, scope='process')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_leased(key, func, lookup)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key, func, lookup=None):
+        """Like do() for a coroutine function; waiting callers do not block the event loop."""
+        counted = False
+        while key in self._futures:
+            future = self._futures[key]
+            if not counted:
+                COALESCED.inc(flight=self.name, scope='process')
+                counted = True
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise  # This caller was cancelled
+                # The leader was cancelled (e.g. its client went away); take over
+
+        future = self._futures[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._run_leased_async(key, func, lookup)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Retrieved, so no "never retrieved" warning when nobody waited
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._futures[key]
+
+    # --- Internal helpers ---
+
+    def _run_leased(self, key, func, lookup):
+        if self.leases is None or lookup is None:
+            return func()
+        owner = uuid.uuid4().hex
+        waited = False
+        while True:
+            leader, result = self._poll(key, owner, lookup, waited)
+            if leader:
+                try:
+                    return func()
+                finally:
+                    self._release(key, owner)
+            if not waited:
+                COALESCED.inc(flight=self.name, scope='lease')
+                waited = True
+            if result is not None:
+                return result
+            time.sleep(self.poll_interval)
+
+    async def _run_leased_async(self, key, func, lookup):
+        # The lease and lookup calls are SQLite queries, so they run on threads
+        if self.leases is None or lookup is None:
+            return await func()
+        owner = uuid.uuid4().hex
+        waited = False
+        while True:
+            leader, result = await asyncio.to_thread(self._poll, key, owner, lookup, waited)
+            if leader:
+                try:
+                    return await func()
+                finally:
+                    await asyncio.to_thread(self._release, key, owner)
+            if not waited:
+                COALESCED.inc(flight=self.name, scope='lease')
+                waited = True
+            if result is not None:
+                return result
+            await asyncio.sleep(self.poll_interval)
+
+    def _poll(self, key, owner, lookup, waited):
+        """
+        One round of waiting on the lease. Returns (True, None) when this caller now holds it and
+        has to make the call, else (False, the shared result or None while there is none yet).
+        """
+        if not self._acquire(key, owner):
+            return False, lookup()
+        if not waited:
+            # A caller that did not wait makes the call: refresh() means to replace what is cached
+            return True, None
+        result = lookup()  # The process this caller waited on may have finished just before releasing
+        if result is None:
+            return True, None
+        self._release(key, owner)
+        return False, result
+
+    def _acquire(self, key, owner):
+        try:
+            return self.leases.acquire(self.name, key, owner, self.lease_ttl)
+        except Exception as e:  # A broken lease file only costs duplicate calls
+            logging.warning(f"Single-flight lease for {self.name} {key} unavailable: {e}")
+            return True
+
+    def _release(self, key, owner):
+        try:
+            self.leases.release(self.name, key, owner)
+        except Exception as e:
+            logging.warning(f"Could not release single-flight lease for {self.name} {key}: {e}")
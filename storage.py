@@ -0,0 +1,55 @@
+"""
+Small helpers shared by the local SQLite-backed stores.
+
+Every store keeps its own database file under DATA_DIR so that several
+gunicorn workers on the same machine can share it safely (WAL mode plus a
+busy timeout lets readers and a single writer work side by side).
+"""
+import os
+import sqlite3
+import threading
+
+# Directory for local caches and stores; override with the DATA_DIR env variable
+DATA_DIR = os.getenv('DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+
+
+def db_path(filename):
+    """Returns the full path of a database file inside DATA_DIR, creating the directory if needed."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, filename)
+
+
+def connect(path):
+    """Opens a SQLite connection tuned for several processes sharing the same file."""
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    return conn
+
+
+class SQLiteStore:
+    """
+    Base class for the SQLite stores. Keeps one connection per thread
+    and creates the schema on first use.
+    Subclasses set SCHEMA to a string of CREATE statements.
+    """
+    SCHEMA = ''
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = connect(self.path)
+            self._local.conn = conn
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(self.SCHEMA)
+                    self._schema_ready = True
+        return conn
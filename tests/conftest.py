@@ -0,0 +1,21 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Keep the app's SQLite stores out of the working tree; must be set before storage is imported
+os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='billboard-tests-'))
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_spotify import FakeSpotify  # noqa: E402
+
+
+@pytest.fixture
+def fake_spotify():
+    fake = FakeSpotify().start()
+    yield fake
+    fake.stop()
@@ -0,0 +1,108 @@
+"""
+Local stand-in for the Spotify Web API used by the tests.
+
+Each test scripts the responses it needs with route(); every request is
+recorded (method, path, query, JSON body, time spent) so tests can assert
+on how many calls the code under test made:
+
+    fake.route('POST', r'/v1/playlists/\\w+/items', lambda call: (403, {'error': {'message': 'Forbidden'}}))
+    ...
+    assert fake.count('POST') == 1
+"""
+import json
+import re
+import threading
+import time
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+import spotipy
+
+Call = namedtuple('Call', 'method path query body seconds')
+
+
+class FakeSpotify:
+    """A threaded HTTP server answering from per-test handlers: handler(call) -> (status, body[, headers])."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = []
+        self._routes = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_address[1]}/v1/'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def route(self, method, pattern, handler):
+        """Answers requests whose path fully matches `pattern`; later routes win."""
+        self._routes.insert(0, (method, re.compile(pattern), handler))
+
+    def count(self, method=None, pattern=None):
+        """Number of requests received, optionally only those matching a method and path pattern."""
+        with self._lock:
+            calls = list(self.calls)
+        return sum(1 for call in calls
+                   if (method is None or call.method == method)
+                   and (pattern is None or re.fullmatch(pattern, call.path)))
+
+    def client(self, timeout=5):
+        """A spotipy client pointed at this server, without retries of its own (like the app's pooled session)."""
+        sp = spotipy.Spotify(auth='test-token', requests_session=requests.Session(), requests_timeout=timeout)
+        sp.prefix = self.url
+        return sp
+
+    def _answer(self, call):
+        for method, pattern, handler in self._routes:
+            if method == call.method and pattern.fullmatch(call.path):
+                return handler(call)
+        return 404, {'error': {'status': 404, 'message': 'Not found'}}
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def handle_request(self):
+                start = time.perf_counter()
+                url = urlparse(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                body = json.loads(raw) if raw else None
+                if fake.latency:
+                    time.sleep(fake.latency)
+                call = Call(self.command, url.path, parse_qs(url.query), body, 0.0)
+                answer = fake._answer(call)
+                status, data = answer[0], answer[1]
+                headers = answer[2] if len(answer) > 2 else {}
+                with fake._lock:
+                    fake.calls.append(call._replace(seconds=time.perf_counter() - start))
+
+                payload = json.dumps(data).encode() if data is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, str(value))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PUT = do_DELETE = handle_request
+
+        return Handler
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import asgi
+
+SLOW = 0.3
+
+
+def slow(value):
+    def call(*args, **kwargs):
+        time.sleep(SLOW)  # A locked SQLite writer or a token refresh
+        return value
+    return call
+
+
+async def largest_loop_stall(coroutine):
+    """Runs the coroutine while a ticker measures the longest time the event loop did not get back to it."""
+    gaps = []
+
+    async def tick():
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    ticker = asyncio.create_task(tick())
+    try:
+        result = await coroutine
+    finally:
+        ticker.cancel()
+    return result, max(gaps)
+
+
+@pytest.fixture
+def blocking_stores(monkeypatch):
+    songs = [(f'Song {i}', 'Band', f'spotify:track:t{i}') for i in range(3)]
+    monkeypatch.setattr(asgi, 'get_year_and_token', slow(('1999', {'access_token': 'test-token'}, None)))
+    monkeypatch.setattr(asgi, 'get_indexed_charts', slow(({'1999': songs}, [])))
+    monkeypatch.setattr(asgi.job_store, 'create', slow('job1'))
+    monkeypatch.setattr(asgi.job_store, 'update', slow(None))
+
+
+def test_blocking_calls_do_not_stall_the_event_loop(blocking_stores):
+    async def search():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            responses = await asyncio.gather(*(client.get('/search_songs?year=1999') for _ in range(4)))
+        return [response.json() for response in responses]
+
+    started = time.perf_counter()
+    results, stall = asyncio.run(largest_loop_stall(search()))
+    elapsed = time.perf_counter() - started
+
+    assert all(result['success'] and len(result['songs']) == 3 for result in results)
+    assert stall < SLOW / 2
+    # Four requests with four slow calls each overlap instead of queueing behind one another
+    assert elapsed < 4 * 4 * SLOW / 2
@@ -0,0 +1,66 @@
+import time
+from datetime import date
+
+import pytest
+
+import app
+
+RECENT_YEAR = date.today().year - 1
+
+
+def search_hits(call):
+    title = call.query['q'][0].split('track:')[1].split(' artist:')[0]
+    return 200, {'tracks': {'items': [{'uri': f'spotify:track:{abs(hash(title)) % 10 ** 8}', 'name': title,
+                                        'artists': [{'name': 'Band'}]}]}}
+
+
+@pytest.fixture
+def index_env(fake_spotify, monkeypatch):
+    fake_spotify.route('GET', r'/v1/search', search_hits)
+    monkeypatch.setattr(app, 'create_app_spotify_client', fake_spotify.client)
+    scraped = []
+
+    def loader(year):
+        scraped.append(year)
+        return [(f'New Song {i}', 'Band') for i in range(5)]
+
+    monkeypatch.setattr(app.chart_cache, 'loader', loader)
+    conn = app.chart_index._conn()
+    conn.execute('DELETE FROM chart_years')
+    conn.execute('DELETE FROM chart_entries')
+    app.chart_cache._memory.clear()
+    app.chart_cache._conn().execute('DELETE FROM charts')
+    return scraped
+
+
+def run(*args):
+    result = app.app.test_cli_runner().invoke(args=['build-index', '--start', str(RECENT_YEAR), '--end', str(RECENT_YEAR), *args])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_stale_recent_year_is_scraped_again(index_env):
+    old_songs = [(f'Old Song {i}', 'Band') for i in range(5)]
+    app.chart_cache._store(str(RECENT_YEAR), old_songs, time.time() - 10 * 24 * 3600)
+    app.chart_index.store_year(RECENT_YEAR, old_songs, [None] * 5)
+    app.chart_index._conn().execute('UPDATE chart_years SET built_at = 0')
+
+    run()
+
+    assert index_env == [str(RECENT_YEAR)]
+    assert [title for title, _, _ in app.chart_index.get_chart(RECENT_YEAR)] == [f'New Song {i}' for i in range(5)]
+
+
+def test_force_searches_again_instead_of_using_the_resolution_cache(index_env, fake_spotify):
+    songs = [(f'New Song {i}', 'Band') for i in range(5)]
+    for title, artist in songs:
+        app.resolution_cache.set(title, artist, 'spotify:track:outdated')
+
+    run()
+    assert fake_spotify.count('GET', r'/v1/search') == 0  # Incremental build: cache hits
+
+    run('--force')
+    assert fake_spotify.count('GET', r'/v1/search') == 5
+    uris = [uri for _, _, uri in app.chart_index.get_chart(RECENT_YEAR)]
+    assert 'spotify:track:outdated' not in uris
+    assert app.resolution_cache.get('New Song 0', 'Band') == uris[0]
@@ -0,0 +1,105 @@
+import time
+
+import pytest
+
+from chart_cache import ChartCache
+
+OLD = [('Smooth', 'Santana Featuring Rob Thomas')]
+NEW = [('No Scrubs', 'TLC')]
+
+
+class Loader:
+    def __init__(self, songs=NEW):
+        self.songs = songs
+        self.calls = []
+
+    def __call__(self, year):
+        self.calls.append(year)
+        return self.songs
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'charts.db')
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_miss_loads_once_then_hits(path):
+    loader = Loader()
+    cache = ChartCache(loader, path)
+
+    assert cache.get(1999) == NEW
+    assert cache.get(1999) == NEW
+    assert loader.calls == ['1999']
+
+
+def test_memory_miss_falls_through_to_sqlite(path):
+    ChartCache(Loader(), path).get(1999)
+    loader = Loader(OLD)
+    other_worker = ChartCache(loader, path)
+
+    assert other_worker.get(1999) == NEW
+    assert loader.calls == []
+
+
+def test_expired_entry_is_served_while_it_revalidates(path):
+    loader = Loader()
+    cache = ChartCache(loader, path, ttl=60)
+    cache._store('1999', OLD, time.time() - 61)
+
+    assert cache.get_cached(1999) == OLD  # Stale, served as is
+    wait_for(lambda: cache.get_cached(1999) == NEW)
+    assert loader.calls == ['1999']
+
+
+def test_recent_years_use_the_shorter_ttl(path):
+    cache = ChartCache(Loader(), path, ttl=3600, recent_ttl=60)
+    this_year = time.localtime().tm_year
+    cache._store(str(this_year), OLD, time.time() - 120)
+    cache._store('1999', OLD, time.time() - 120)
+
+    assert cache._get_fresh(str(this_year)) is None
+    assert cache._get_fresh('1999') == OLD
+
+
+def test_stale_memory_copy_rereads_sqlite_before_revalidating(path):
+    loader = Loader()
+    cache = ChartCache(loader, path, ttl=60)
+    cache._store('1999', OLD, time.time() - 61)
+    # Another worker refreshes the shared row; this worker's memory copy is still the stale one
+    ChartCache(Loader(), path, ttl=60).put(1999, NEW)
+
+    assert cache.get_cached(1999) == NEW
+    time.sleep(0.1)
+    assert loader.calls == []
+    assert cache.prefetch([1999]) == 0
+
+
+def test_failed_loads_are_not_retried_until_failure_ttl(path):
+    loader = Loader(None)
+    cache = ChartCache(loader, path, failure_ttl=60)
+
+    assert cache.get(2026) is None
+    assert cache.get(2026) is None
+    assert loader.calls == ['2026']
+
+    cache._failures['2026'] -= 61
+    loader.songs = NEW
+    assert cache.get(2026) == NEW
+    assert loader.calls == ['2026', '2026']
+
+
+def test_refresh_still_retries_a_failed_load(path):
+    loader = Loader(None)
+    cache = ChartCache(loader, path, failure_ttl=60)
+    cache.get(2026)
+
+    loader.songs = NEW
+    assert cache.refresh(2026) == NEW
+    assert cache.get(2026) == NEW
@@ -0,0 +1,72 @@
+import glob
+import os
+
+import pytest
+
+import chart_parsers
+from chart_parsers import parse_chart, parse_chart_fast, parse_chart_soup
+
+FIXTURES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'fixtures', 'hot-100-*.html')))
+
+
+def read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.fixture(params=FIXTURES, ids=os.path.basename)
+def page(request):
+    return read(request.param)
+
+
+@pytest.fixture
+def without_lxml(monkeypatch):
+    monkeypatch.setattr(chart_parsers, 'lxml', None)
+
+
+def test_fixtures_cover_several_years():
+    assert len(FIXTURES) >= 3
+
+
+def test_soup_parser_reads_every_chart_row(page):
+    songs = parse_chart_soup(page)
+    assert len(songs) == 100
+    titles = {title for title, _ in songs}
+    # Ad slots and article promos share the row / title markup but are not chart entries
+    assert not any('Advertisement' in title or 'Year-End Charts' in title for title in titles)
+    # Credits that link each artist keep the spaces between them
+    assert not any('Featuring' in artist and ' Featuring ' not in artist for _, artist in songs)
+
+
+def test_lxml_parser_matches_soup(page):
+    if chart_parsers.lxml is None:
+        pytest.skip('lxml is not installed')
+    assert parse_chart_fast(page) == parse_chart_soup(page)
+
+
+def test_fast_parser_without_lxml_is_the_soup_parser(page, without_lxml):
+    assert parse_chart_fast(page) == parse_chart_soup(page)
+    assert parse_chart(page, 'fast') == parse_chart_soup(page)
+
+
+def test_entities_and_non_ascii_text_are_decoded():
+    songs = set()
+    for path in FIXTURES:
+        songs.update(parse_chart_soup(read(path)))
+    for song in [("Don't Stop Believin'", 'Journey'), ('Rock & Roll All Nite', 'KISS'),
+                 ('Señorita', 'Shawn Mendes & Camila Cabello'), ('Crazy In Love', 'Beyoncé Featuring JAY-Z'),
+                 ('So What', 'P!nk'), ('TiK ToK', 'Ke$ha'), ('"Weird Al" <Parody>', '"Weird Al" Yankovic')]:
+        assert song in songs
+
+
+def test_page_without_a_chart_returns_none():
+    html = '<html><body><h3 id="title-of-a-story">News</h3><span>By Staff</span></body></html>'
+    assert parse_chart_fast(html) is None
+    assert parse_chart(html, 'fast') is None
+
+
+def test_page_without_a_chart_is_parsed_once_without_lxml(without_lxml, monkeypatch):
+    calls = []
+    monkeypatch.setattr(chart_parsers, 'parse_chart_soup', lambda html: calls.append(html))
+    assert parse_chart('<html></html>', 'fast') is None
+    assert len(calls) == 1
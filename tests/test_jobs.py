@@ -0,0 +1,206 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import jobs
+from jobs import (CANCELLED, DONE, FAILED, QUEUED, RUNNING, JobLimitExceeded, JobQueue, JobStore, MemoryJobStore,
+                  create_job_store)
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def store(request, tmp_path):
+    if request.param == 'sqlite':
+        return JobStore(str(tmp_path / 'jobs.db'))
+    return MemoryJobStore()
+
+
+def wait_for_status(store, job_id, status, timeout=5):
+    deadline = time.time() + timeout
+    while store.get(job_id)['status'] != status:
+        assert time.time() < deadline, store.get(job_id)
+        time.sleep(0.01)
+
+
+# --- Stores ---
+
+def test_jobs_are_only_visible_to_their_owner(store):
+    job_id = store.create('resolve', 'alice', {'year': '1999'})
+
+    assert store.get(job_id, owner='alice')['params'] == {'year': '1999'}
+    assert store.get(job_id, owner='bob') is None
+    assert store.get('missing') is None
+
+
+def test_update_keeps_result_and_error(store):
+    job_id = store.create('resolve', 'alice', {'year': '1999'}, status=RUNNING)
+    store.update(job_id, DONE, result={'tracks': [1, 2]})
+    store.update(job_id, DONE)
+
+    job = store.get(job_id)
+    assert (job['status'], job['result'], job['error']) == (DONE, {'tracks': [1, 2]}, None)
+
+
+def test_cancel_stops_queued_jobs_and_flags_running_ones(store):
+    queued = store.create('playlist', 'alice', {})
+    running = store.create('playlist', 'alice', {}, status=RUNNING)
+
+    assert store.request_cancel(queued) == CANCELLED
+    assert store.request_cancel(running) == RUNNING
+    assert store.is_cancel_requested(running)
+    assert store.request_cancel('missing') is None
+
+
+def test_count_active_skips_finished_and_abandoned_jobs(store, monkeypatch):
+    store.create('playlist', 'alice', {})
+    store.create('playlist', 'alice', {}, status=RUNNING)
+    store.create('resolve', 'alice', {}, status=RUNNING)
+    store.update(store.create('playlist', 'alice', {}), DONE)
+    store.create('playlist', 'bob', {})
+
+    assert store.count_active('alice') == 3
+    assert store.count_active('alice', kind='playlist') == 2
+
+    monkeypatch.setattr(jobs, 'ACTIVE_JOB_TIMEOUT', -1)  # Every job now looks abandoned
+    assert store.count_active('alice') == 0
+
+
+def test_unknown_backend_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        create_job_store('redis', str(tmp_path / 'jobs.db'))
+
+
+# --- Queue ---
+
+def test_queue_records_results_and_failures(store):
+    queue = JobQueue(store, max_workers=2)
+
+    done = queue.enqueue('playlist', 'alice', {'year': '1999'}, lambda params, context: {'year': params['year']})
+    failed = queue.enqueue('playlist', 'bob', {}, lambda params, context: 1 / 0)
+
+    wait_for_status(store, done, DONE)
+    wait_for_status(store, failed, FAILED)
+    assert store.get(done)['result'] == {'year': '1999'}
+    assert 'division' in store.get(failed)['error']
+
+
+def test_running_job_stops_at_its_next_cancellation_check(store):
+    queue = JobQueue(store)
+    started, proceed = threading.Event(), threading.Event()
+
+    def work(params, context):
+        started.set()
+        proceed.wait(5)
+        context.check_cancelled()
+        return 'finished'
+
+    job_id = queue.enqueue('playlist', 'alice', {}, work)
+    assert started.wait(5)
+    assert queue.cancel(job_id) == RUNNING
+    proceed.set()
+
+    wait_for_status(store, job_id, CANCELLED)
+
+
+def test_owner_limit(store):
+    queue = JobQueue(store, max_workers=1, max_per_owner=2)
+    release = threading.Event()
+    work = lambda params, context: release.wait(5)
+
+    ids = [queue.enqueue('playlist', 'alice', {}, work) for _ in range(2)]
+    with pytest.raises(JobLimitExceeded):
+        queue.enqueue('playlist', 'alice', {}, work)
+    queue.enqueue('playlist', 'bob', {}, work)  # The limit is per owner
+
+    release.set()
+    for job_id in ids:
+        wait_for_status(store, job_id, DONE)
+    queue.enqueue('playlist', 'alice', {}, work)
+
+
+def test_async_jobs(store):
+    queue = JobQueue(store, max_per_owner=1)
+
+    async def work(params, context):
+        await context.check_cancelled_async()
+        return {'year': params['year']}
+
+    async def main():
+        job_id = await queue.enqueue_async('playlist', 'alice', {'year': '1999'}, work)
+        assert store.get(job_id)['status'] in (QUEUED, RUNNING)
+        with pytest.raises(JobLimitExceeded):
+            await queue.enqueue_async('playlist', 'alice', {}, work)
+        while store.get(job_id)['status'] != DONE:
+            await asyncio.sleep(0.01)
+        return job_id
+
+    job_id = asyncio.run(main())
+    assert store.get(job_id)['result'] == {'year': '1999'}
+
+
+# --- Endpoints ---
+
+@pytest.fixture
+def client(monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, 'get_year_and_token', lambda: ('1999', {'access_token': 'test-token'}, None))
+    release = threading.Event()
+
+    def run_playlist_job(params, context, access_token, owner, user_id):
+        release.wait(5)
+        context.check_cancelled()
+        return {'playlist_url': 'https://open.spotify.com/playlist/p1'}
+
+    monkeypatch.setattr(app, 'run_playlist_job', run_playlist_job)
+    client = app.app.test_client()
+    client.release = release
+    yield client
+    release.set()
+
+
+def poll(client, job_id, status):
+    deadline = time.time() + 5
+    while client.get(f'/jobs/{job_id}').get_json()['status'] != status:
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_job_endpoints(client):
+    import app
+
+    first = client.post('/jobs').get_json()['job_id']
+    second = client.post('/jobs').get_json()['job_id']
+    limited = client.post('/jobs')
+    assert limited.status_code == 429
+    assert f'At most {app.job_queue.max_per_owner}' in limited.get_json()['error']
+
+    assert client.get(f'/jobs/{first}/result').status_code == 202
+    assert app.app.test_client().get(f'/jobs/{first}').status_code == 404  # Another session
+
+    assert client.post(f'/jobs/{second}/cancel').get_json()['status'] in (QUEUED, RUNNING, CANCELLED)
+    client.release.set()
+    poll(client, first, DONE)
+    poll(client, second, CANCELLED)
+
+    assert client.get(f'/jobs/{first}/result').get_json() == {'playlist_url': 'https://open.spotify.com/playlist/p1'}
+    assert client.get(f'/jobs/{second}/result').status_code == 409
+    assert client.post('/jobs').status_code == 202
+
+
+def test_failed_search_does_not_leave_a_running_job(client, monkeypatch):
+    import app
+
+    def broken(year):
+        raise RuntimeError('index unavailable')
+
+    monkeypatch.setattr(app, 'load_chart_songs', broken)
+    with client.session_transaction() as session:
+        session['year'] = '1999'
+        session['spotify_token_info'] = {'access_token': 'test-token'}
+        session['owner_key'] = 'failing-owner'
+
+    assert client.get('/search_songs').status_code == 500
+    assert client.get('/search_songs/stream').get_data(as_text=True).count('event: error') == 1
+    assert app.job_store.count_active('failing-owner') == 0
@@ -0,0 +1,92 @@
+import pytest
+
+from matching import MATCH_THRESHOLD, MIN_CONFIDENCE, best_match, clean_title, search_queries, split_artists
+
+
+@pytest.mark.parametrize('artist, names', [
+    ('Lil Nas X Featuring Billy Ray Cyrus', ['lil nas x', 'billy ray cyrus']),
+    ('Marshmello x Bastille', ['marshmello', 'bastille']),
+    ('Lil Nas X x Jack Harlow', ['lil nas x', 'jack harlow']),
+    ('Malcolm X', ['malcolm x']),
+    ('Simon & Garfunkel', ['simon garfunkel', 'simon', 'garfunkel']),
+    ('Drake Featuring Rihanna', ['drake', 'rihanna']),
+    ('Calvin Harris & Disciples', ['calvin harris disciples', 'calvin harris', 'disciples']),
+    ('Bruce Springsteen With The E Street Band', ['bruce springsteen', 'the e street band']),
+    ('P!nk', ['p nk']),
+])
+def test_split_artists(artist, names):
+    assert split_artists(artist) == names
+
+
+@pytest.mark.parametrize('title, artist, queries', [
+    ('Old Town Road', 'Lil Nas X Featuring Billy Ray Cyrus',
+     ['track:Old Town Road artist:Lil Nas X', 'Old Town Road Lil Nas X']),
+    ('So What', 'P!nk', ['track:So What artist:P!nk', 'So What P!nk']),
+    ('TiK ToK', 'Ke$ha', ['track:TiK ToK artist:Ke$ha', 'TiK ToK Ke$ha']),
+    ("Don't Stop Believin'", 'Journey',
+     ["track:Don't Stop Believin' artist:Journey", "Don't Stop Believin' Journey"]),
+    ('Mrs. Robinson (From "The Graduate")', 'Simon & Garfunkel',
+     ['track:Mrs. Robinson artist:Simon & Garfunkel', 'Mrs. Robinson Simon & Garfunkel']),
+    ('Happier', 'Marshmello x Bastille', ['track:Happier artist:Marshmello', 'Happier Marshmello']),
+    ('Amish Paradise', '"Weird Al" Yankovic',
+     ['track:Amish Paradise artist:Weird Al Yankovic', 'Amish Paradise Weird Al Yankovic']),
+])
+def test_search_queries_keep_the_original_text(title, artist, queries):
+    assert search_queries(title, artist) == queries
+
+
+def test_clean_title_normalizes_for_scoring():
+    assert clean_title("Don't Stop Believin' - 2022 Remaster") == 'don t stop believin'
+    assert clean_title('Where Is The Love? (feat. Justin Timberlake)') == 'where is the love'
+
+
+def test_best_match_prefers_the_credited_artist():
+    items = [
+        {'uri': 'spotify:track:cover', 'name': 'Old Town Road', 'artists': [{'name': 'Cover Band'}]},
+        {'uri': 'spotify:track:remix', 'name': 'Old Town Road - Remix',
+         'artists': [{'name': 'Lil Nas X'}, {'name': 'Billy Ray Cyrus'}]},
+    ]
+    item, score = best_match('Old Town Road', 'Lil Nas X Featuring Billy Ray Cyrus', items)
+    assert item['uri'] == 'spotify:track:remix'
+    assert score > 0.8
+
+
+def track(name, *artists):
+    return {'uri': f'spotify:track:{abs(hash((name, artists))) % 10 ** 8}', 'name': name,
+            'artists': [{'name': artist} for artist in artists]}
+
+
+@pytest.mark.parametrize('title, artist, candidate', [
+    ('Hello', 'Adele', track('Hello', 'Lionel Richie')),
+    ('Stay', 'Rihanna Featuring Mikky Ekko', track('Stay', 'Zedd', 'Alessia Cara')),
+    ('Hello', 'Adele', track('Hello - Karaoke Version', 'Sing2Piano')),
+    ('Hello', 'Adele', track('Hello (Originally Performed by Adele) [Karaoke Version]', 'Adele Karaoke Hits')),
+    ('Hello', 'Adele', track('Hello (Tribute to Adele)', 'Adele')),
+])
+def test_same_title_by_someone_else_is_not_a_match(title, artist, candidate):
+    item, score = best_match(title, artist, [candidate])
+    assert score < MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize('title, artist, candidate', [
+    ('Hello', 'Adele', track('Hello', 'Adele')),
+    ('Stay', 'Rihanna Featuring Mikky Ekko', track('Stay', 'Rihanna', 'Mikky Ekko')),
+    ("What's My Name?", 'Rihanna Featuring Drake', track("What's My Name?", 'Rihanna', 'Drake')),
+    ('The Sound Of Silence', 'Simon & Garfunkel', track('The Sound of Silence', 'Simon & Garfunkel')),
+    ('TiK ToK', 'Ke$ha', track('TiK ToK', 'Kesha')),
+    ('Sweet Child O\' Mine', "Guns N' Roses", track("Sweet Child O' Mine", "Guns N' Roses")),
+])
+def test_the_credited_recording_is_still_a_match(title, artist, candidate):
+    item, score = best_match(title, artist, [candidate])
+    assert score >= MATCH_THRESHOLD
+
+
+def test_the_original_wins_over_its_covers():
+    items = [track('Hello - Karaoke Version', 'Sing2Piano'), track('Hello', 'Lionel Richie'), track('Hello', 'Adele')]
+    item, score = best_match('Hello', 'Adele', items)
+    assert item['artists'] == [{'name': 'Adele'}]
+
+
+def test_punctuation_in_artist_names_still_matches():
+    assert best_match('So What', 'P!nk', [track('So What', 'P!nk')])[1] >= MATCH_THRESHOLD
+    assert best_match('So What', 'P!nk', [track('So What', 'Pink')])[1] >= MIN_CONFIDENCE
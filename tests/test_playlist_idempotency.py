@@ -0,0 +1,135 @@
+import threading
+import time
+import uuid
+
+import app
+from app import generate_playlist
+
+USER_PLAYLISTS = r'/v1/users/[^/]+/playlists'
+
+
+class FakeLibrary:
+    """Playlist state behind the fake Spotify endpoints the create/re-run path uses."""
+
+    def __init__(self, fake, create_delay=0.0, add_delay=0.0):
+        self.playlists = {}
+        self.create_delay = create_delay
+        self.add_delay = add_delay
+        self.lock = threading.Lock()
+        fake.route('POST', USER_PLAYLISTS, self.create)
+        fake.route('POST', r'/v1/playlists/\w+/items', self.add)
+        fake.route('GET', r'/v1/playlists/\w+/items', self.items)
+        fake.route('GET', r'/v1/playlists/\w+/followers/contains', self.following)
+        fake.route('GET', r'/v1/me/playlists', self.mine)
+
+    def create(self, call):
+        time.sleep(self.create_delay)
+        pid = uuid.uuid4().hex[:22]
+        with self.lock:
+            self.playlists[pid] = {'name': call.body['name'], 'owner': call.path.split('/')[3], 'uris': [], 'followed': True}
+        return 201, {'id': pid, 'external_urls': {'spotify': f'https://open.spotify.com/playlist/{pid}'}}
+
+    def add(self, call):
+        time.sleep(self.add_delay)
+        with self.lock:
+            self.playlists[call.path.split('/')[3]]['uris'].extend(call.body)
+        return 201, {'snapshot_id': 'snap'}
+
+    def items(self, call):
+        uris = self.playlists[call.path.split('/')[3]]['uris']
+        return 200, {'items': [{'track': {'uri': uri}} for uri in uris], 'next': None}
+
+    def following(self, call):
+        playlist = self.playlists.get(call.path.split('/')[3])
+        return 200, [bool(playlist and playlist['followed'])]
+
+    def mine(self, call):
+        items = [{'id': pid, 'name': p['name'], 'owner': {'id': p['owner']},
+                  'external_urls': {'spotify': f'https://open.spotify.com/playlist/{pid}'}}
+                 for pid, p in self.playlists.items() if p['followed']]
+        return 200, {'items': items, 'next': None}
+
+
+def tracks(n):
+    return [{'title': f'Song {i}', 'artist': 'Band', 'uri': f'spotify:track:t{i}', 'found': True, 'error': None}
+            for i in range(n)]
+
+
+def user():
+    return f'user-{uuid.uuid4().hex[:8]}'
+
+
+def test_rerun_with_nothing_to_change_makes_one_call(fake_spotify):
+    library = FakeLibrary(fake_spotify)
+    sp, user_id = fake_spotify.client(), user()
+    generate_playlist(sp, '1999', tracks(120), user_id=user_id)
+    assert fake_spotify.count('POST', USER_PLAYLISTS) == 1
+    fake_spotify.calls.clear()
+
+    result = generate_playlist(sp, '1999', tracks(120), user_id=user_id)
+
+    assert 'already up to date' in result['message']
+    assert [call.path.rsplit('/', 1)[-1] for call in fake_spotify.calls] == ['contains']
+    assert len(next(iter(library.playlists.values()))['uris']) == 120
+
+
+def test_rerun_writes_only_the_missing_tracks(fake_spotify):
+    library = FakeLibrary(fake_spotify)
+    sp, user_id = fake_spotify.client(), user()
+    generate_playlist(sp, '1999', tracks(90), user_id=user_id)
+
+    generate_playlist(sp, '1999', tracks(100), user_id=user_id)
+
+    (playlist,) = library.playlists.values()
+    assert playlist['uris'] == [f'spotify:track:t{i}' for i in range(100)]
+    assert fake_spotify.count('POST', USER_PLAYLISTS) == 1
+
+
+def test_deleted_playlist_is_forgotten_and_recreated(fake_spotify):
+    library = FakeLibrary(fake_spotify)
+    sp, user_id = fake_spotify.client(), user()
+    generate_playlist(sp, '1999', tracks(10), user_id=user_id)
+    (first,) = library.playlists
+    library.playlists[first]['followed'] = False  # "Delete" in Spotify only unfollows
+
+    result = generate_playlist(sp, '1999', tracks(10), user_id=user_id)
+
+    assert fake_spotify.count('POST', USER_PLAYLISTS) == 2
+    second = app.playlist_registry.get(user_id, '1999')['playlist_id']
+    assert second != first
+    assert first not in result['playlist_url']
+
+
+def test_concurrent_retry_does_not_create_a_duplicate(fake_spotify):
+    library = FakeLibrary(fake_spotify, create_delay=0.3)
+    sp, user_id = fake_spotify.client(), user()
+    results = []
+
+    runs = [threading.Thread(target=lambda: results.append(generate_playlist(sp, '1999', tracks(50), user_id=user_id)))
+            for _ in range(2)]
+    for run in runs:
+        run.start()
+    for run in runs:
+        run.join()
+
+    assert fake_spotify.count('POST', USER_PLAYLISTS) == 1
+    (playlist,) = library.playlists.values()
+    assert len(playlist['uris']) == 50
+    assert len(results) == 2 and all(result['success'] for result in results)
+
+
+def test_lease_outlives_its_ttl_while_the_first_run_writes(fake_spotify, monkeypatch):
+    monkeypatch.setattr(app, 'FLIGHT_LEASE_TTL', 0.3)
+    library = FakeLibrary(fake_spotify, add_delay=0.25)  # Three batches: 0.75s, well past the TTL
+    sp, user_id = fake_spotify.client(), user()
+
+    first = threading.Thread(target=generate_playlist, args=(sp, '1999', tracks(250)), kwargs={'user_id': user_id})
+    first.start()
+    time.sleep(0.1)
+    result = generate_playlist(sp, '1999', tracks(250), user_id=user_id)  # The retry
+    first.join()
+
+    assert fake_spotify.count('POST', USER_PLAYLISTS) == 1
+    (playlist,) = library.playlists.values()
+    assert playlist['uris'] == [f'spotify:track:t{i}' for i in range(250)]
+    assert 'already up to date' in result['message']
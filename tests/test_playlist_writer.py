@@ -0,0 +1,127 @@
+import asyncio
+import threading
+
+import pytest
+import requests
+from spotipy.exceptions import SpotifyException
+
+from playlist_writer import add_tracks_in_batches, add_tracks_in_batches_async
+
+ITEMS = r'/v1/playlists/\w+/items'
+
+
+def uris(n, bad=()):
+    return [f'spotify:track:bad{i}' if i in bad else f'spotify:track:t{i}' for i in range(n)]
+
+
+def accept_unless_bad(call):
+    if any('bad' in uri for uri in call.body):
+        return 400, {'error': {'status': 400, 'message': 'Invalid track uri'}}
+    return 201, {'snapshot_id': 'snap'}
+
+
+def error(status, message='error', headers=None):
+    return lambda call: (status, {'error': {'status': status, 'message': message}}, headers or {})
+
+
+def written(fake):
+    return [uri for call in fake.calls if call.method == 'POST' and call.body and call.path.endswith('/items')
+            for uri in call.body]
+
+
+def test_batches_of_100_in_chart_order(fake_spotify):
+    fake_spotify.route('POST', ITEMS, accept_unless_bad)
+    tracks = uris(250)
+
+    added, failed = add_tracks_in_batches(fake_spotify.client(), 'p1', tracks)
+
+    assert added == tracks
+    assert failed == []
+    assert [len(call.body) for call in fake_spotify.calls] == [100, 100, 50]
+    assert written(fake_spotify) == tracks
+
+
+def test_bad_uri_is_bisected_out(fake_spotify):
+    fake_spotify.route('POST', ITEMS, accept_unless_bad)
+    tracks = uris(100, bad={37})
+
+    added, failed = add_tracks_in_batches(fake_spotify.client(), 'p1', tracks, backoff=0)
+
+    assert failed == ['spotify:track:bad37']
+    assert added == [uri for uri in tracks if 'bad' not in uri]
+    # One rejected batch plus a binary search down to the bad URI, not one call per track
+    assert fake_spotify.count('POST') <= 2 * 7 + 1
+
+
+@pytest.mark.parametrize('status', [401, 403, 404])
+def test_permanent_errors_raise_without_retrying(fake_spotify, status):
+    fake_spotify.route('POST', ITEMS, error(status))
+
+    with pytest.raises(SpotifyException) as raised:
+        add_tracks_in_batches(fake_spotify.client(), 'p1', uris(100), backoff=0)
+
+    assert raised.value.http_status == status
+    assert fake_spotify.count('POST') == 1
+
+
+def test_rate_limited_batch_is_retried_after_retry_after(fake_spotify):
+    responses = [error(429, 'API rate limit exceeded', {'Retry-After': '0'})] * 2 + [accept_unless_bad]
+    fake_spotify.route('POST', ITEMS, lambda call: responses.pop(0)(call))
+    tracks = uris(100)
+
+    added, failed = add_tracks_in_batches(fake_spotify.client(), 'p1', tracks, backoff=0)
+
+    assert added == tracks
+    assert failed == []
+    assert fake_spotify.count('POST') == 3
+
+
+def test_server_errors_are_retried_then_raised_without_bisecting(fake_spotify):
+    fake_spotify.route('POST', ITEMS, error(503))
+
+    with pytest.raises(SpotifyException) as raised:
+        add_tracks_in_batches(fake_spotify.client(), 'p1', uris(100), max_retries=2, backoff=0)
+
+    assert raised.value.http_status == 503
+    assert fake_spotify.count('POST') == 3
+
+
+def test_read_timeout_is_not_retried(fake_spotify):
+    # The server got the request and may have added the tracks; sending it again could add them twice
+    release = threading.Event()
+    received = []
+
+    def slow(call):
+        received.append(call)
+        release.wait(5)
+        return 201, {'snapshot_id': 'snap'}
+
+    fake_spotify.route('POST', ITEMS, slow)
+    try:
+        with pytest.raises(requests.exceptions.Timeout):
+            add_tracks_in_batches(fake_spotify.client(timeout=0.2), 'p1', uris(100), backoff=0)
+    finally:
+        release.set()
+    assert len(received) == 1
+
+
+def test_async_writer_follows_the_same_rules(fake_spotify):
+    httpx = pytest.importorskip('httpx')
+    from async_http import AsyncSpotify
+
+    async def run(tracks):
+        async with httpx.AsyncClient() as client:
+            sp = AsyncSpotify('test-token', prefix=fake_spotify.url, client=client)
+            return await add_tracks_in_batches_async(sp, 'p1', tracks, backoff=0)
+
+    fake_spotify.route('POST', ITEMS, accept_unless_bad)
+    tracks = uris(150, bad={120})
+    added, failed = asyncio.run(run(tracks))
+    assert failed == ['spotify:track:bad120']
+    assert added == [uri for uri in tracks if 'bad' not in uri]
+
+    fake_spotify.calls.clear()
+    fake_spotify.route('POST', ITEMS, error(403))
+    with pytest.raises(SpotifyException):
+        asyncio.run(run(uris(100)))
+    assert fake_spotify.count('POST') == 1
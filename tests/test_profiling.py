@@ -0,0 +1,79 @@
+import os
+import threading
+
+from profiling import RequestProfiler
+
+
+def busy():
+    return sum(i * i for i in range(10000))
+
+
+def test_second_profile_on_a_thread_is_refused(tmp_path):
+    profiler = RequestProfiler(always=True, output_dir=str(tmp_path))
+    first = profiler.start()
+    assert first is not None
+    assert profiler.start() is None  # Would silently take over the first one before Python 3.12
+    busy()
+    name = profiler.finish(first, 'index')
+
+    assert os.path.exists(tmp_path / name)
+    again = profiler.start()  # Free again once the first one finished
+    assert again is not None
+    profiler.discard(again)
+
+
+def test_other_threads_can_profile_at_the_same_time(tmp_path):
+    profiler = RequestProfiler(always=True, output_dir=str(tmp_path))
+    first = profiler.start()
+    started = []
+
+    def other_request():
+        profile = profiler.start()
+        started.append(profile)
+        profiler.discard(profile)
+
+    thread = threading.Thread(target=other_request)
+    thread.start()
+    thread.join()
+    assert started[0] is not None
+    profiler.discard(first)
+
+
+def test_profiles_of_one_endpoint_get_their_own_files(tmp_path):
+    profiler = RequestProfiler(always=True, output_dir=str(tmp_path))
+    names = []
+    for _ in range(3):
+        profile = profiler.start()
+        busy()
+        names.append(profiler.finish(profile, 'generate_playlist'))
+
+    assert len(set(names)) == 3
+    assert sorted(os.listdir(tmp_path)) == sorted(names)
+
+
+def test_app_profiles_requests_and_releases_the_thread(tmp_path, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app.request_profiler, 'always', True)
+    monkeypatch.setattr(app.request_profiler, 'output_dir', str(tmp_path))
+    client = app.app.test_client()
+
+    names = {client.get('/metrics').headers['X-Profile-File'] for _ in range(2)}
+
+    assert len(names) == 2
+    assert sorted(os.listdir(tmp_path)) == sorted(names)
+
+
+def test_profile_header_is_checked_against_the_token():
+    from werkzeug.test import EnvironBuilder
+
+    profiler = RequestProfiler(token='s3cret')
+
+    def wanted(header):
+        headers = {} if header is None else {'X-Profile': header}
+        return profiler.wanted(EnvironBuilder(headers=headers).get_request())
+
+    assert wanted('s3cret')
+    assert not wanted('wrong')
+    assert not wanted(None)
+    assert not wanted('sécret')  # Non-ASCII used to raise TypeError, turning the request into a 500
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+
+from spotipy.exceptions import SpotifyException
+
+from resolution_cache import ResolutionCache, cache_key
+from resolver import TokenBucket, TrackResolver, retry_after_seconds
+from singleflight import LeaseStore, SingleFlight
+
+SEARCH = r'/v1/search'
+
+
+def track(title, artist):
+    return {'uri': f'spotify:track:{abs(hash((title, artist))) % 10 ** 8}', 'name': title, 'artists': [{'name': artist}]}
+
+
+def test_retry_after_seconds_reads_the_header():
+    assert retry_after_seconds(SpotifyException(429, -1, 'slow down', headers={'Retry-After': '3'})) == 3.0
+    assert retry_after_seconds(SpotifyException(429, -1, 'slow down', headers={'retry-after': '0.5'})) == 0.5
+    assert retry_after_seconds(SpotifyException(429, -1, 'slow down'), default=7) == 7
+    assert retry_after_seconds(SpotifyException(429, -1, 'slow down', headers={'Retry-After': 'soon'}), default=2) == 2
+
+
+def test_acquire_is_bounded_by_the_rate():
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.19
+
+
+def test_penalize_blocks_every_caller_for_the_delay():
+    bucket = TokenBucket(rate=1000, capacity=100)
+    bucket.penalize(0.3)
+
+    waits = []
+    start = time.monotonic()
+    threads = [threading.Thread(target=lambda: waits.append(bucket.acquire())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert time.monotonic() - start >= 0.29
+    assert len(waits) == 4 and min(waits) >= 0.29
+
+
+def test_penalize_blocks_async_callers_too():
+    bucket = TokenBucket(rate=1000, capacity=100)
+    bucket.penalize(0.2)
+    start = time.monotonic()
+    asyncio.run(bucket.acquire_async())
+    assert time.monotonic() - start >= 0.19
+
+
+def test_resolver_pauses_all_searches_for_retry_after(fake_spotify):
+    arrivals = []
+    answered_429 = []
+
+    def search(call):
+        arrivals.append(time.monotonic())
+        if not answered_429:
+            answered_429.append(time.monotonic())
+            return 429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}}, {'Retry-After': '0.5'}
+        query = call.query['q'][0]
+        title = query.split('track:')[1].split(' artist:')[0]
+        return 200, {'tracks': {'items': [track(title, 'Band')]}}
+
+    fake_spotify.route('GET', SEARCH, search)
+    songs = [(f'Song {i}', 'Band') for i in range(8)]
+    resolver = TrackResolver(max_workers=4, rate=1000, burst=1000)
+
+    results = resolver.resolve(fake_spotify.client(), songs)
+
+    assert all(result['found'] for result in results)
+    # Searches already in flight may land, but nothing new is sent until Retry-After has passed
+    paused_until = answered_429[0] + 0.5
+    late = [t for t in arrivals if t > answered_429[0] + 0.1]
+    assert late and min(late) >= paused_until - 0.05
+
+
+def test_waiting_on_another_workers_search_does_not_count_as_misses(tmp_path, fake_spotify):
+    cache = ResolutionCache(str(tmp_path / 'resolutions.db'))
+    leases = LeaseStore(str(tmp_path / 'singleflight.db'))
+    resolver = TrackResolver(cache=cache, flights=SingleFlight('search', leases=leases, poll_interval=0.05))
+    fake_spotify.route('GET', SEARCH, lambda call: (200, {'tracks': {'items': []}}))
+
+    # Another worker holds the lease for this song and stores its result after about 1s
+    leases.acquire('search', cache_key('Smooth', 'Santana'), 'other-worker', ttl=60)
+    threading.Timer(1.0, cache.set, args=('Smooth', 'Santana', 'spotify:track:smooth')).start()
+
+    (result,) = resolver.resolve(fake_spotify.client(), [('Smooth', 'Santana')])
+
+    assert result['uri'] == 'spotify:track:smooth'
+    assert fake_spotify.count('GET', SEARCH) == 0
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (0, 1)  # Only the up-front lookup, not each poll
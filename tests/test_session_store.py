@@ -0,0 +1,126 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+from flask import Flask, session
+
+from session_store import MemorySessionInterface, SQLiteSessionInterface
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def backend(request, tmp_path):
+    def make(**options):
+        if request.param == 'sqlite':
+            return SQLiteSessionInterface(str(tmp_path / 'sessions.db'), **options)
+        return MemorySessionInterface(**options)
+    return make
+
+
+def stored_ids(store):
+    if isinstance(store, SQLiteSessionInterface):
+        return {row[0] for row in store._conn().execute('SELECT id FROM sessions')}
+    return set(store._sessions)
+
+
+def test_expired_sessions_are_not_loaded(backend):
+    store = backend()
+    store._save('old', '{}', time.time() - 1)
+    store._save('live', '{}', time.time() + 60)
+
+    assert store._load('old') is None
+    assert store._load('live') is not None
+
+
+def test_sweep_deletes_expired_sessions(backend):
+    store = backend()
+    now = time.time()
+    for i in range(5):
+        store._save(f'expired{i}', '{}', now - 1 - i)
+    store._save('live', '{}', now + 60)
+
+    store.sweep()
+
+    assert stored_ids(store) == {'live'}
+
+
+def test_store_is_capped_at_max_sessions(backend):
+    store = backend(max_sessions=5)
+    now = time.time()
+    for i in range(8):
+        store._save(f's{i}', '{}', now + 60 + i)
+
+    store.sweep()
+
+    # The sessions closest to expiry (the least recently active) are the ones dropped
+    assert stored_ids(store) == {f's{i}' for i in range(3, 8)}
+
+
+def test_sweep_runs_at_most_once_per_interval(backend):
+    store = backend(sweep_interval=300)
+    sweeps = []
+    store.sweep = lambda: sweeps.append(1)
+
+    store._maybe_sweep(1000.0)
+    store._maybe_sweep(1100.0)
+    store._maybe_sweep(1301.0)
+
+    assert len(sweeps) == 2
+
+
+def test_unchanged_sessions_are_not_written(backend):
+    store = backend()
+    writes = []
+    save = store._save
+    store._save = lambda *args: writes.append(args) or save(*args)
+
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.session_interface = store
+
+    @app.route('/set')
+    def set_value():
+        session['year'] = '1999'
+        return 'ok'
+
+    @app.route('/get')
+    def get_value():
+        return session.get('year', '')
+
+    client = app.test_client()
+    client.get('/set')
+    assert client.get('/get').get_data(as_text=True) == '1999'
+    assert client.get('/get').get_data(as_text=True) == '1999'
+    assert len(writes) == 1
+
+
+def test_tampered_cookie_starts_a_new_session(backend):
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.session_interface = backend()
+
+    @app.route('/set')
+    def set_value():
+        session['year'] = '1999'
+        return 'ok'
+
+    @app.route('/get')
+    def get_value():
+        return session.get('year', 'none')
+
+    client = app.test_client()
+    client.get('/set')
+    sid = client.get_cookie('session').value
+    client.set_cookie('session', sid[:-2] + 'xx')
+    assert client.get('/get').get_data(as_text=True) == 'none'
+
+
+def test_unknown_backend_fails_at_startup(tmp_path):
+    env = dict(os.environ, SESSION_BACKEND='sqllite', DATA_DIR=str(tmp_path))
+    result = subprocess.run([sys.executable, '-c', 'import app'], cwd=ROOT, env=env, capture_output=True, text=True)
+
+    assert result.returncode != 0
+    assert 'ValueError: Unknown session backend: sqllite' in result.stderr
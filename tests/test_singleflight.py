@@ -0,0 +1,147 @@
+import asyncio
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from chart_cache import ChartCache
+from singleflight import LeaseStore, SingleFlight
+
+SONGS = [('Smooth', 'Santana Featuring Rob Thomas'), ('No Scrubs', 'TLC')]
+
+
+def make_cache(tmp_dir, loader):
+    leases = LeaseStore(os.path.join(tmp_dir, 'singleflight.db'))
+    return ChartCache(loader, os.path.join(tmp_dir, 'charts.db'), flights=SingleFlight('chart', leases=leases))
+
+
+def counting_loader(tmp_dir, delay=0.0):
+    """A loader that appends a line to calls.log for every call, from any process."""
+    def load(year):
+        with open(os.path.join(tmp_dir, 'calls.log'), 'a') as f:
+            f.write(f'{os.getpid()} {year}\n')
+        time.sleep(delay)
+        return SONGS
+    return load
+
+
+def calls(tmp_dir):
+    path = os.path.join(tmp_dir, 'calls.log')
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return f.read().splitlines()
+
+
+def load_in_worker(tmp_dir, mode, start, results):
+    cache = make_cache(tmp_dir, counting_loader(tmp_dir, delay=0.5))
+    start.wait()
+    if mode == 'async':
+        async def fetch(year):
+            await asyncio.sleep(0.5)
+            return cache.loader(year)
+        songs = asyncio.run(cache.refresh_async(1999, fetch))
+    else:
+        songs = cache.get(1999)
+    results.put([tuple(song) for song in songs])
+
+
+@pytest.mark.parametrize('mode', ['sync', 'async'])
+def test_two_processes_share_one_load(tmp_path, mode):
+    context = multiprocessing.get_context('spawn')
+    start = context.Event()
+    results = context.Queue()
+    workers = [context.Process(target=load_in_worker, args=(str(tmp_path), mode, start, results)) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    time.sleep(1.0)  # Both processes importing and waiting on the start event
+    start.set()
+    shared = [results.get(timeout=30) for _ in workers]
+    for worker in workers:
+        worker.join(timeout=30)
+
+    assert shared == [SONGS, SONGS]
+    assert len(calls(str(tmp_path))) == 1
+
+
+def test_refresh_loads_again_when_a_fresh_copy_is_cached(tmp_path):
+    cache = make_cache(str(tmp_path), counting_loader(str(tmp_path)))
+
+    assert cache.get(1999) == SONGS
+    assert cache.get(1999) == SONGS
+    assert len(calls(str(tmp_path))) == 1
+
+    cache.refresh(1999)
+    assert len(calls(str(tmp_path))) == 2
+
+    async def fetch(year):
+        return cache.loader(year)
+
+    asyncio.run(cache.refresh_async(1999, fetch))
+    assert len(calls(str(tmp_path))) == 3
+
+
+def test_waiter_takes_the_result_of_the_lease_holder(tmp_path):
+    leases = LeaseStore(str(tmp_path / 'singleflight.db'))
+    shared = {}
+    flights = SingleFlight('search', leases=leases, poll_interval=0.01)
+
+    leases.acquire('search', 'key', 'other-process', ttl=60)
+    shared['key'] = 'result'
+    loads = []
+    assert flights.do('key', lambda: loads.append(1), lookup=lambda: shared.get('key')) == 'result'
+    assert loads == []
+
+
+def test_async_lease_calls_run_off_the_event_loop(tmp_path, monkeypatch):
+    leases = LeaseStore(str(tmp_path / 'singleflight.db'))
+    flights = SingleFlight('search', leases=leases)
+    acquire = leases.acquire
+
+    def slow_acquire(*args):
+        time.sleep(0.3)  # A locked lease table
+        return acquire(*args)
+
+    monkeypatch.setattr(leases, 'acquire', slow_acquire)
+
+    async def search():
+        return 'found'
+
+    async def main():
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.create_task(tick())
+        result = await flights.do_async('key', search, lookup=lambda: None)
+        ticker.cancel()
+        return result, max(b - a for a, b in zip(ticks, ticks[1:]))
+
+    result, stall = asyncio.run(main())
+    assert result == 'found'
+    assert stall < 0.15
+
+
+def test_held_lease_is_renewed_past_its_ttl(tmp_path):
+    leases = LeaseStore(str(tmp_path / 'singleflight.db'))
+
+    with leases.hold('playlist', 'user:1999', ttl=0.2):
+        time.sleep(0.5)
+        assert not leases.acquire('playlist', 'user:1999', 'retry', ttl=0.2)
+    assert leases.acquire('playlist', 'user:1999', 'retry', ttl=0.2)
+
+
+def test_held_lease_is_renewed_past_its_ttl_async(tmp_path):
+    leases = LeaseStore(str(tmp_path / 'singleflight.db'))
+
+    async def main():
+        async with leases.hold_async('playlist', 'user:1999', ttl=0.2):
+            await asyncio.sleep(0.5)
+            assert not leases.acquire('playlist', 'user:1999', 'retry', ttl=0.2)
+
+    asyncio.run(main())
+    assert leases.acquire('playlist', 'user:1999', 'retry', ttl=0.2)